@@ -0,0 +1,100 @@
+"""
+保管庫全体のパスワード監査のベンチマーク。
+
+--items 件のアイテム（一部は使い回し・類似・漏洩一覧に載ったパスワード）と、
+--breach 行の漏洩パスワード一覧（SHA-1 順の HIBP 形式）を作り、audit_vault の
+所要時間をワーカー数を変えて測る。結果の件数が作ったデータと合うことも確かめる。
+
+    python -m benchmarks.bench_audit [--items 100000] [--breach 1000000] [--workers 1 4]
+"""
+import argparse
+import hashlib
+import os
+import random
+import string
+import tempfile
+import time
+
+from services.audit import audit_vault, summarize, sort_report
+from services.crypto import FieldCipher, new_data_key
+from services.item_service import encrypt_fields, new_row_uuid
+from services.repository import Repository
+
+ALPHABET = string.ascii_letters + string.digits + "!@#$%"
+
+
+def build_vault(vault, cipher, n_items, rnd):
+    """
+    アイテムを作り、使い回し・漏洩に当たるよう埋め込んだパスワードの一覧を返す。
+    ちょうど n_items // 100 件（100 件ごとに1件）に共通の弱いパスワードを、
+    どれも2件以上で使われるよう順に割り当てる。別の 1% は Season+年 の類似パスワード、
+    残りはランダム。
+    """
+    vault.init()
+    root = vault.root_folder_id()
+    n_planted = n_items // 100
+    pool = [f"password{i}" for i in range(min(50, n_planted // 2))]
+    planted = [pool[k % len(pool)] for k in range(n_planted)]
+    passwords = []
+    for i in range(n_items):
+        roll = i % 100
+        if roll == 0 and i // 100 < n_planted:
+            passwords.append(planted[i // 100])
+        elif roll == 1:
+            passwords.append(f"Summer{i}!")
+        else:
+            passwords.append("".join(rnd.choices(ALPHABET, k=rnd.randint(8, 20))))
+    with vault.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO items (folder_id, title, password, uuid) VALUES (?, ?, ?, ?)",
+            (
+                (root, f"site {i}", encrypt_fields(cipher, {"password": pw}, row_uuid)["password"],
+                 row_uuid)
+                for i, pw, row_uuid in ((i, pw, new_row_uuid()) for i, pw in enumerate(passwords))
+            )
+        )
+    return planted
+
+
+def build_breach_list(path, n_lines, leaked, rnd):
+    digests = {hashlib.sha1(pw.encode("utf-8")).hexdigest().upper() for pw in leaked}
+    while len(digests) < n_lines:
+        digests.add("%040X" % rnd.getrandbits(160))
+    with open(path, "w", newline="") as fp:
+        for digest in sorted(digests):
+            fp.write(f"{digest}:{rnd.randint(1, 5000)}\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--breach", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+    if args.items < 200:
+        # 使い回しのパスワードを2件以上に埋め込むのに必要な件数
+        parser.error("--items は 200 以上にしてください")
+
+    rnd = random.Random(0)
+    cipher = FieldCipher(new_data_key())
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Repository(os.path.join(tmp, "bench.db"))
+        planted = build_vault(vault, cipher, args.items, rnd)
+        breach_path = os.path.join(tmp, "pwned.txt")
+        t0 = time.perf_counter()
+        build_breach_list(breach_path, args.breach, set(planted), rnd)
+        print(f"breach list {args.breach} lines built in {time.perf_counter() - t0:.1f}s")
+
+        for workers in dict.fromkeys(args.workers):
+            t0 = time.perf_counter()
+            entries = audit_vault(vault.conn, cipher, breach_path, workers=workers)
+            report = sort_report(entries)
+            elapsed = time.perf_counter() - t0
+            summary = summarize(entries)
+            print(f"  workers={workers:<3} {elapsed:6.2f}s  {summary}")
+            assert summary["breached"] == summary["reused"] == len(planted), summary
+            assert report[0].breached and report[0].reused
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+バックアップのベンチマーク。
+
+N 件の保管庫を作り、完全エクスポート・1% を変更した後の差分エクスポート・
+復元・DB ファイルのホットバックアップの所要時間と、最大常駐メモリを測る。
+
+    python -m benchmarks.bench_backup [--items 200000]
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from services import backup
+from services.connection import get_connection, close_connection
+from services.crypto import FieldCipher, new_data_key
+from services.item_service import new_row_uuid
+from services.migrations import migrate
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=200000)
+    args = parser.parse_args()
+
+    cipher = FieldCipher(new_data_key())
+    n = args.items
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = get_connection(path)
+        migrate(conn)
+        with conn:
+            conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+            conn.executemany(
+                "INSERT INTO items (folder_id, title, username, password, url, uuid) "
+                "VALUES (1, ?, ?, ?, ?, ?)",
+                (
+                    (f"site {i}", f"user{i}@example.com",
+                     cipher.encrypt_text("%016x" % i, "password", row_uuid),
+                     f"https://site{i % 1000}.example.com", row_uuid)
+                    for i, row_uuid in ((i, new_row_uuid()) for i in range(n))
+                )
+            )
+
+        full_path = os.path.join(tmp, "full.pmbackup")
+        full, t_full = _timed(backup.export_archive, conn, full_path, cipher)
+
+        with conn:
+            conn.execute("UPDATE items SET title = title || '*' WHERE id % 100 = 0")
+        inc_path = os.path.join(tmp, "inc.pmbackup")
+        inc, t_inc = _timed(backup.export_archive, conn, inc_path, cipher, incremental=True)
+
+        restore_path = os.path.join(tmp, "restore.db")
+        restore_conn = get_connection(restore_path)
+        migrate(restore_conn)
+        _, t_restore = _timed(backup.restore_archive, restore_conn, full_path, cipher)
+
+        _, t_copy = _timed(backup.hot_backup, path, os.path.join(tmp, "copy.db"))
+
+        full_mb = os.path.getsize(full_path) / 1024 / 1024
+        inc_kb = os.path.getsize(inc_path) / 1024
+        close_connection(path)
+        close_connection(restore_path)
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"items={n}")
+    print(f"  full export   {t_full * 1000:8.0f}ms  ({full['items'] / t_full:,.0f} rows/s)  {full_mb:.1f}MB")
+    print(f"  incremental   {t_inc * 1000:8.0f}ms  items={inc['items']}  {inc_kb:.0f}KB")
+    print(f"  restore       {t_restore * 1000:8.0f}ms")
+    print(f"  hot backup    {t_copy * 1000:8.0f}ms")
+    print(f"  peak RSS={peak_mb:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
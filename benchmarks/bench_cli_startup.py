@@ -0,0 +1,59 @@
+"""
+CLI（main.py）の起動時間のベンチマーク。
+
+一時保管庫に対して読み取り系のコマンドを別プロセスで繰り返し起動し、
+1回あたりの所要時間（プロセス起動〜終了）の中央値と最大値を測る。
+比較のため、何もしない python の起動時間も表示する。
+
+    python -m benchmarks.bench_cli_startup [--runs 20]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from services.repository import Repository
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+BUDGET_MS = 100
+
+
+def _time_runs(argv, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        Repository(path).init()
+
+        median, worst = _time_runs([sys.executable, "-c", "pass"], args.runs)
+        print(f"  {'python -c pass':24} median={median:5.0f}ms  max={worst:5.0f}ms")
+
+        slow = False
+        for command in (["list"], ["list", "--folder", "1"], ["search", "example"]):
+            median, worst = _time_runs(
+                [sys.executable, MAIN, "--db", path, *command], args.runs
+            )
+            slow = slow or median > BUDGET_MS
+            print(f"  {' '.join(command):24} median={median:5.0f}ms  max={worst:5.0f}ms")
+
+    if slow:
+        print(f"NG 起動時間の中央値が {BUDGET_MS}ms を超えています")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+フィールド復号のスループットベンチマーク。
+
+N 行分の password / notes を暗号化して保存し、
+一括で読み出して復号する速度（行/秒）を測る。
+鍵導出（KDF）は解錠時の1回だけで、行ごとの復号には含まれない。
+
+    python -m benchmarks.bench_decrypt [--rows 100000]
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.crypto import FieldCipher, new_data_key
+from services.item_service import encrypt_fields, decrypt_item, new_row_uuid, ENCRYPTED_FIELDS
+from services.migrations import migrate
+
+
+def _encrypted_row(cipher, rnd, alphabet, i):
+    row_uuid = new_row_uuid()
+    values = encrypt_fields(cipher, {
+        "password": "".join(rnd.choices(alphabet, k=20)),
+        "notes": "メモ " * rnd.randint(0, 40),
+    }, row_uuid)
+    return f"item {i}", values["password"], values["notes"], row_uuid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    cipher = FieldCipher(new_data_key())
+    alphabet = string.ascii_letters + string.digits
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = get_connection(path)
+        migrate(conn)
+
+        t0 = time.perf_counter()
+        with conn:
+            conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+            conn.executemany(
+                "INSERT INTO items (folder_id, title, password, notes, uuid) VALUES (1, ?, ?, ?, ?)",
+                (_encrypted_row(cipher, rnd, alphabet, i) for i in range(args.rows))
+            )
+        t_encrypt = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        rows = conn.execute("SELECT id, password, notes, uuid FROM items").fetchall()
+        t_read = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for item_id, password, notes, row_uuid in rows:
+            decrypt_item(
+                cipher, {"id": item_id, "password": password, "notes": notes, "uuid": row_uuid}
+            )
+        t_decrypt = time.perf_counter() - t0
+        close_connection(path)
+
+    n = args.rows
+    print(f"rows={n}  fields/row={len(ENCRYPTED_FIELDS)}")
+    print(f"  encrypt+insert {t_encrypt * 1000:8.0f}ms  ({n / t_encrypt:,.0f} rows/s)")
+    print(f"  read           {t_read * 1000:8.0f}ms")
+    print(f"  decrypt        {t_decrypt * 1000:8.0f}ms  ({n / t_decrypt:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
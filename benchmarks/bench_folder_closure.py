@@ -0,0 +1,197 @@
+"""
+フォルダ階層の閉包テーブルのベンチマーク。
+
+深い木（--depth 階層の一本道）と広い木（1つの親の下に --wide 個の兄弟）を作り、
+それぞれで次を、従来の再帰 CTE と閉包テーブル（folder_closure）で比べる。
+  - 部分木のフォルダ一覧
+  - 部分木のアイテム数（「このフォルダ以下を検索」と同じ絞り込み）
+  - パンくず（最も深いフォルダからルートまで）
+書き込み側は、閉包テーブルのトリガを外して再帰 CTE で処理する場合と比べて
+フォルダ追加・部分木の移動・部分木の削除（配下のアイテムごと）にかかる時間を測る。
+最後に閉包テーブルが folders と整合していることを確かめる。
+
+    python -m benchmarks.bench_folder_closure [--depth 50] [--wide 10000] [--items 50000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.folder_service import (
+    SUBTREE_IDS, check_folder_closure, delete_subtree, move_folder,
+)
+from services.migrations import migrate
+
+# 閉包テーブルを入れる前の部分木の求め方
+LEGACY_SUBTREE_IDS = """
+    WITH RECURSIVE subtree(id) AS (
+        SELECT ?
+        UNION
+        SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+    )
+    SELECT id FROM subtree
+"""
+LEGACY_PATH = """
+    WITH RECURSIVE path(id, parent_id, name, depth) AS (
+        SELECT id, parent_id, name, 0 FROM folders WHERE id = ?
+        UNION ALL
+        SELECT f.id, f.parent_id, f.name, p.depth + 1
+        FROM folders f JOIN path p ON f.id = p.parent_id
+    )
+    SELECT id, parent_id, name FROM path ORDER BY depth DESC
+"""
+CLOSURE_PATH = (
+    "SELECT f.id, f.parent_id, f.name FROM folder_closure c "
+    "JOIN folders f ON f.id = c.ancestor WHERE c.descendant = ? ORDER BY c.depth DESC"
+)
+CLOSURE_TRIGGERS = ("folders_closure_ai", "folders_closure_au", "folders_closure_ad")
+
+READ_REPEAT = 50
+WRITE_REPEAT = 5
+
+
+def build_tree(conn, shape, size, n_items, seed=0):
+    """
+    ルート(1) の下に top を作り、shape が "deep" なら top から size 階層の一本道、
+    "wide" なら top の直下に size 個の兄弟を作る。(top, 最も深いフォルダ, 全フォルダ id) を返す
+    """
+    rnd = random.Random(seed)
+    with conn:
+        conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+        top = conn.execute(
+            "INSERT INTO folders (parent_id, name) VALUES (1, 'top')"
+        ).lastrowid
+        ids = [top]
+        parent = top
+        for i in range(size):
+            fid = conn.execute(
+                "INSERT INTO folders (parent_id, name) VALUES (?, ?)", (parent, f"{shape}-{i}")
+            ).lastrowid
+            ids.append(fid)
+            if shape == "deep":
+                parent = fid
+        conn.executemany(
+            "INSERT INTO items (folder_id, title, username, password, url, notes) "
+            "VALUES (?, ?, 'user', 'pw', 'https://example.com', '')",
+            ((rnd.choice(ids), f"item {i}") for i in range(n_items))
+        )
+    return top, ids[-1], ids
+
+
+def median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def report(label, legacy_ms, closure_ms):
+    print(f"  {label:28} CTE {legacy_ms:9.3f} ms   closure {closure_ms:9.3f} ms  "
+          f"x{legacy_ms / closure_ms:.1f}")
+
+
+def bench_reads(conn, top, deepest, n_folders):
+    def listing(sql):
+        rows = conn.execute(f"SELECT id FROM folders WHERE id IN ({sql})", (top,)).fetchall()
+        assert len(rows) == n_folders
+
+    def item_count(sql):
+        return conn.execute(
+            f"SELECT COUNT(*) FROM items WHERE folder_id IN ({sql})", (top,)
+        ).fetchone()[0]
+
+    def path(sql):
+        return conn.execute(sql, (deepest,)).fetchall()
+
+    assert item_count(LEGACY_SUBTREE_IDS) == item_count(SUBTREE_IDS)
+    assert path(LEGACY_PATH) == path(CLOSURE_PATH)
+    for label, fn in (("subtree listing", listing), ("subtree item count", item_count)):
+        report(label, median_ms(lambda: fn(LEGACY_SUBTREE_IDS), READ_REPEAT),
+               median_ms(lambda: fn(SUBTREE_IDS), READ_REPEAT))
+    report("breadcrumb (deepest)", median_ms(lambda: path(LEGACY_PATH), READ_REPEAT),
+           median_ms(lambda: path(CLOSURE_PATH), READ_REPEAT))
+
+
+def legacy_move(conn, folder_id, new_parent_id):
+    conn.execute(
+        f"UPDATE folders SET parent_id = ? WHERE id = ? "
+        f"AND (? IS NULL OR ? NOT IN ({LEGACY_SUBTREE_IDS}))",
+        (new_parent_id, folder_id, new_parent_id, new_parent_id, folder_id)
+    )
+
+
+def legacy_delete(conn, folder_id):
+    conn.execute(f"DELETE FROM items WHERE folder_id IN ({LEGACY_SUBTREE_IDS})", (folder_id,))
+    conn.execute(f"DELETE FROM folders WHERE id IN ({LEGACY_SUBTREE_IDS})", (folder_id,))
+
+
+def bench_writes(conn, top, deepest, move, delete):
+    """(フォルダ追加, 部分木の移動, 部分木の削除) の時間（ミリ秒）"""
+    def add():
+        with conn:
+            conn.executemany(
+                "INSERT INTO folders (parent_id, name) VALUES (?, 'new')",
+                [(deepest,)] * 100
+            )
+
+    # top の部分木をルート直下の別フォルダへ移し、ルート直下へ戻す
+    with conn:
+        other = conn.execute(
+            "INSERT INTO folders (parent_id, name) VALUES (1, 'other')"
+        ).lastrowid
+
+    def move_and_back():
+        with conn:
+            move(conn, top, other)
+        with conn:
+            move(conn, top, 1)
+
+    add_ms = median_ms(add, WRITE_REPEAT) / 100
+    move_ms = median_ms(move_and_back, WRITE_REPEAT) / 2
+    t0 = time.perf_counter()
+    with conn:
+        delete(conn, top)
+    delete_ms = (time.perf_counter() - t0) * 1000
+    assert conn.execute("SELECT COUNT(*) FROM folders").fetchone()[0] == 2
+    return add_ms, move_ms, delete_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=50)
+    parser.add_argument("--wide", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape, size in (("deep", args.depth), ("wide", args.wide)):
+            print(f"{shape}: {size} folders under top, {args.items} items")
+            writes = {}
+            for with_triggers in (False, True):
+                path = os.path.join(tmp, f"{shape}-{with_triggers}.db")
+                conn = get_connection(path)
+                migrate(conn)
+                if not with_triggers:
+                    # トリガを外した DB は閉包テーブルが空になるので、従来の再帰 CTE で書き込む
+                    for name in CLOSURE_TRIGGERS:
+                        conn.execute(f"DROP TRIGGER {name}")
+                top, deepest, ids = build_tree(conn, shape, size, args.items)
+                if with_triggers:
+                    bench_reads(conn, top, deepest, len(ids))
+                    writes[True] = bench_writes(conn, top, deepest, move_folder, delete_subtree)
+                    assert check_folder_closure(conn) == (0, 0)
+                else:
+                    writes[False] = bench_writes(conn, top, deepest, legacy_move, legacy_delete)
+                close_connection(path)
+            for i, label in enumerate(("add folder", "move subtree", "delete subtree")):
+                print(f"  {label:28} CTE {writes[False][i]:9.3f} ms   "
+                      f"closure {writes[True][i]:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
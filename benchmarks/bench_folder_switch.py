@@ -0,0 +1,109 @@
+"""
+フォルダ切替レイテンシのベンチマーク。
+
+呼び出しごとに sqlite3.connect() する旧実装と、
+services.connection の共有コネクションを比較する。
+
+    python -m benchmarks.bench_folder_switch [--items 50000] [--folders 200] [--switches 2000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+
+
+def build_vault(path, n_folders, n_items):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE folders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER,
+            name TEXT NOT NULL
+        );
+        CREATE TABLE items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_id INTEGER NOT NULL,
+            title TEXT,
+            username TEXT,
+            password TEXT,
+            url TEXT,
+            notes TEXT,
+            FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE CASCADE
+        );
+    """)
+    conn.executemany(
+        "INSERT INTO folders (id, parent_id, name) VALUES (?, ?, ?)",
+        ((i, None if i == 1 else 1, f"folder {i}") for i in range(1, n_folders + 1))
+    )
+    rnd = random.Random(0)
+    conn.executemany(
+        "INSERT INTO items (folder_id, title, username, password, url, notes) VALUES (?, ?, ?, ?, ?, ?)",
+        ((rnd.randint(1, n_folders), f"item {i}", "user", "pw", "https://example.com", "")
+         for i in range(n_items))
+    )
+    conn.commit()
+    conn.close()
+
+
+QUERY = "SELECT id, title FROM items WHERE folder_id = ? ORDER BY id DESC"
+
+
+def switch_per_call(path, folder_id):
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute(QUERY, (folder_id,))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def switch_shared(path, folder_id):
+    return get_connection(path).execute(QUERY, (folder_id,)).fetchall()
+
+
+def measure(fn, path, folder_ids):
+    samples = []
+    for folder_id in folder_ids:
+        t0 = time.perf_counter()
+        fn(path, folder_id)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--folders", type=int, default=200)
+    parser.add_argument("--switches", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_vault(path, args.folders, args.items)
+
+        rnd = random.Random(1)
+        folder_ids = [rnd.randint(1, args.folders) for _ in range(args.switches)]
+
+        before = measure(switch_per_call, path, folder_ids)
+        get_connection(path)  # 初回接続コストは起動時に1度だけ払う
+        after = measure(switch_shared, path, folder_ids)
+        close_connection(path)
+
+    print(f"items={args.items} folders={args.folders} switches={args.switches}")
+    for label, result in (("per-call connect", before), ("shared connection", after)):
+        print(f"  {label:18s} mean={result['mean_ms']:.3f}ms "
+              f"p50={result['p50_ms']:.3f}ms p95={result['p95_ms']:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
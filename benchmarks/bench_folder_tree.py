@@ -0,0 +1,112 @@
+"""
+フォルダツリー読み込みのベンチマーク。
+
+ランダムな順序で並んだ N 件のフォルダから階層を組み立てる時間を測る。
+アイテム数つきの一覧（folder_stats を JOIN した1クエリ）と、
+フォルダごとに COUNT(*) する場合の時間も比べる。
+PySide6 が入っていれば offscreen で FolderTree の初回構築と
+差分更新（1件の名前変更）も測る。
+
+    python -m benchmarks.bench_folder_tree [--folders 10000] [--items 100000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.folder_service import (
+    FolderIndex, SUBTREE_IDS, check_folder_closure, check_folder_stats, load_folder_rows,
+    load_folder_rows_with_counts, rebuild_folder_closure,
+)
+from services.migrations import migrate
+from services.repository import Repository
+
+
+def build_folders(path, n_folders, n_items=0, seed=0):
+    rnd = random.Random(seed)
+    conn = get_connection(path)
+    migrate(conn)
+    rows = [(1, None, "ルート")]
+    for folder_id in range(2, n_folders + 1):
+        rows.append((folder_id, rnd.randint(1, folder_id - 1), f"フォルダ {folder_id}"))
+    # 親より子が先に来る行順でも正しく組めることを確かめるため、挿入順を崩す
+    shuffled = rows[1:]
+    rnd.shuffle(shuffled)
+    with conn:
+        conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (?, ?, ?)", rows[0])
+        conn.executemany("INSERT INTO folders (id, parent_id, name) VALUES (?, ?, ?)", shuffled)
+        # 親より先に入った子は閉包テーブルのトリガで祖先を拾えないので、復元と同じく作り直す
+        rebuild_folder_closure(conn)
+        conn.executemany(
+            "INSERT INTO items (folder_id, title) VALUES (?, ?)",
+            ((rnd.randint(1, n_folders), f"item {i}") for i in range(n_items))
+        )
+    return conn
+
+
+def count_per_folder(conn, rows):
+    """アイテム数を folder_stats を使わずにフォルダごとの COUNT(*) で求める"""
+    return [
+        (
+            conn.execute("SELECT COUNT(*) FROM items WHERE folder_id = ?", (folder_id,)).fetchone()[0],
+            conn.execute(
+                f"SELECT COUNT(*) FROM items WHERE folder_id IN ({SUBTREE_IDS})", (folder_id,)
+            ).fetchone()[0],
+        )
+        for folder_id, _, _ in rows
+    ]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--folders", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = build_folders(path, args.folders, args.items)
+
+        rows, t_query = timed(lambda: load_folder_rows(conn))
+        index, t_index = timed(lambda: FolderIndex(rows))
+        walked, t_walk = timed(lambda: sum(1 for _ in index.walk()))
+        assert walked == args.folders, "到達できないフォルダがある"
+        print(f"folders={args.folders}  query={t_query:.1f}ms  index={t_index:.1f}ms  walk={t_walk:.1f}ms")
+
+        counted, t_counts = timed(lambda: load_folder_rows_with_counts(conn))
+        direct, t_per_folder = timed(lambda: count_per_folder(conn, rows))
+        assert [tuple(row[3:]) for row in counted] == direct
+        assert check_folder_closure(conn) == (0, 0) and check_folder_stats(conn) == []
+        print(f"items={args.items}  counts from folder_stats={t_counts:.1f}ms  "
+              f"COUNT(*) per folder={t_per_folder:.1f}ms")
+
+        try:
+            os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+            from PySide6.QtWidgets import QApplication
+            import gui_main
+        except ImportError:
+            print("PySide6 が無いため FolderTree の計測は省略")
+            close_connection(path)
+            return
+
+        app = QApplication.instance() or QApplication([])
+        gui_main.vault = Repository(path)
+        tree, t_build = timed(lambda: gui_main.FolderTree("", ""))
+        with conn:
+            conn.execute("UPDATE folders SET name = ? WHERE id = ?", ("変更後", args.folders))
+        _, t_update = timed(tree.load_folders_from_db)
+        print(f"FolderTree  initial build={t_build:.1f}ms  diff reload={t_update:.1f}ms")
+        close_connection(path)
+        del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+インポートのベンチマーク。
+
+N 件の汎用 JSON Lines ファイルを生成して import_file で取り込み、
+所要時間・スループットと最大常駐メモリを測る。
+
+    python -m benchmarks.bench_import [--records 500000] [--dry-run]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.crypto import FieldCipher, new_data_key
+from services.importer import import_file
+from services.migrations import migrate
+
+
+def write_export(path, n_records, seed=0):
+    rnd = random.Random(seed)
+    groups = [f"グループ{g}/サブ{s}" for g in range(20) for s in range(10)]
+    with open(path, "w", encoding="utf-8") as fp:
+        for i in range(n_records):
+            fp.write(json.dumps({
+                "title": f"site {i}",
+                "username": f"user{i}@example.com",
+                "password": "%016x" % rnd.getrandbits(64),
+                "url": f"https://site{i % 1000}.example.com",
+                "notes": "",
+                "folder": rnd.choice(groups),
+            }, ensure_ascii=False))
+            fp.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=500000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, "export.jsonl")
+        write_export(export_path, args.records)
+
+        path = os.path.join(tmp, "bench.db")
+        conn = get_connection(path)
+        migrate(conn)
+        with conn:
+            conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+
+        t0 = time.perf_counter()
+        result = import_file(
+            conn, export_path, 1, FieldCipher(new_data_key()), dry_run=args.dry_run
+        )
+        elapsed = time.perf_counter() - t0
+        close_connection(path)
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"records={args.records} dry_run={args.dry_run}  items={result['items']} "
+          f"folders={result['folders']}")
+    print(f"  {elapsed:.1f}s  ({result['items'] / elapsed:,.0f} records/s)  peak RSS={peak_mb:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+詳細表示のキャッシュと先読みのベンチマーク。
+
+一覧の先頭ページを矢印キーで1行ずつ --steps 回下へ移動し、そのあと同じだけ
+上へ戻る操作を、キャッシュなし（毎回 get_item で読んで復号）とキャッシュあり
+（ItemCache + 前後の先読み）で再現する。1行あたりの表示までの時間と、キャッシュの
+ヒット率を比べる。先読みの時間は表示の後に行われるので、表示時間には含めない。
+
+    python -m benchmarks.bench_item_cache [--items 10000] [--steps 150]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from services.crypto import FieldCipher, new_data_key
+from services.item_cache import ItemCache, PREFETCH_RADIUS
+from services.repository import Repository
+
+
+def build_vault(vault, cipher, n_items):
+    vault.init()
+    root = vault.root_folder_id()
+    with vault.transaction():
+        for i in range(n_items):
+            vault.add_item(root, cipher, title=f"site {i}", username=f"user{i}",
+                           password=f"pw-{i:08d}", notes="メモ " * 20)
+    return root
+
+
+def walk(rows, steps):
+    """下へ steps 行進んでから上へ戻るときに選択される行番号の列"""
+    down = list(range(min(steps, len(rows))))
+    return down + down[-2::-1]
+
+
+def summarize(label, samples, extra=""):
+    print(f"  {label:24} median={statistics.median(samples):7.1f}us  "
+          f"max={max(samples):7.1f}us{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=150)
+    args = parser.parse_args()
+
+    cipher = FieldCipher(new_data_key())
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Repository(os.path.join(tmp, "bench.db"))
+        root = build_vault(vault, cipher, args.items)
+        rows = [row.id for row in vault.item_page(root)]
+        order = walk(rows, args.steps)
+
+        samples = []
+        for row in order:
+            t0 = time.perf_counter()
+            vault.get_item(rows[row], cipher)
+            samples.append((time.perf_counter() - t0) * 1e6)
+        summarize("get_item every time", samples)
+
+        cache = ItemCache(vault)
+        samples, prefetch_us = [], []
+        for row in order:
+            t0 = time.perf_counter()
+            cache.get(rows[row], cipher)
+            t1 = time.perf_counter()
+            # 先読みは表示の後に行うので、表示時間とは別に集計する
+            cache.prefetch([
+                rows[r] for r in range(row - PREFETCH_RADIUS, row + PREFETCH_RADIUS + 1)
+                if r != row and 0 <= r < len(rows)
+            ], cipher)
+            samples.append((t1 - t0) * 1e6)
+            prefetch_us.append((time.perf_counter() - t1) * 1e6)
+        summarize("ItemCache + prefetch", samples,
+                  f"  prefetch median={statistics.median(prefetch_us):.1f}us")
+        stats = cache.stats()
+        print(f"  hits={stats['hits']} misses={stats['misses']} prefetched={stats['prefetched']} "
+              f"hit rate={stats['hit_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
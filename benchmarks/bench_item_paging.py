@@ -0,0 +1,50 @@
+"""
+アイテム一覧の初回表示（先頭ページ読み込み）のベンチマーク。
+
+フォルダ内の件数を増やしても、先頭ページの取得時間が
+fetchall() による全件読み込みと違ってほぼ一定であることを確認する。
+
+    python -m benchmarks.bench_item_paging [--sizes 1000 10000 50000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_folder_switch import build_vault
+from services.connection import get_connection, close_connection
+from services.item_service import fetch_item_page
+
+
+def best_of(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            # フォルダ1つに全件を入れる
+            build_vault(path, 1, size)
+            conn = get_connection(path)
+
+            full = best_of(lambda: conn.execute(
+                "SELECT id, title FROM items WHERE folder_id = ? ORDER BY id DESC", (1,)
+            ).fetchall())
+            first_page = best_of(lambda: fetch_item_page(conn, 1))
+            close_connection(path)
+
+        print(f"items={size:7d}  fetchall={full:8.3f}ms  first page={first_page:6.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+移動のベンチマーク。
+
+1. 選択した --select 件のアイテムを別フォルダへ移す。move_items（UPDATE 1文）と、
+   1件ずつ UPDATE する従来のやり方（同じく1トランザクション）を比べる。
+2. --depth 階層の一本道のフォルダで、末端を先頭の下へ移す（循環判定の CTE が
+   木全体をたどる最悪ケース）のと、先頭を末端の下へ移そうとして拒否されるまでの時間。
+
+    python -m benchmarks.bench_move [--items 100000] [--select 10000] [--depth 1000]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from services.repository import Repository
+
+
+def build_vault(vault, n_items, depth):
+    vault.init()
+    root = vault.root_folder_id()
+    with vault.transaction() as conn:
+        source = vault.add_folder(root, "移動元").id
+        target = vault.add_folder(root, "移動先").id
+        conn.executemany(
+            "INSERT INTO items (folder_id, title) VALUES (?, ?)",
+            ((source, f"item {i}") for i in range(n_items))
+        )
+        chain = [vault.add_folder(root, "L0").id]
+        for level in range(1, depth):
+            chain.append(vault.add_folder(chain[-1], f"L{level}").id)
+    return source, target, chain
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--select", type=int, default=10000)
+    parser.add_argument("--depth", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Repository(os.path.join(tmp, "bench.db"))
+        source, target, chain = build_vault(vault, args.items, args.depth)
+        ids = [row[0] for row in vault.conn.execute(
+            "SELECT id FROM items WHERE folder_id = ? ORDER BY id LIMIT ?", (source, args.select)
+        )]
+
+        t0 = time.perf_counter()
+        moved = vault.move_items(ids, target)
+        bulk_ms = (time.perf_counter() - t0) * 1000
+        assert moved == len(ids)
+
+        t0 = time.perf_counter()
+        with vault.transaction():
+            for item_id in ids:
+                vault.update_item(item_id, None, folder_id=source)
+        per_row_ms = (time.perf_counter() - t0) * 1000
+
+        print(f"move {len(ids)} items (of {args.items})")
+        print(f"  move_items (1 statement)  {bulk_ms:8.1f} ms")
+        print(f"  update_item per row       {per_row_ms:8.1f} ms")
+
+        t0 = time.perf_counter()
+        vault.move_folder(chain[-1], chain[0])
+        leaf_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        try:
+            vault.move_folder(chain[0], chain[-2])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("循環する移動が拒否されませんでした")
+        cycle_ms = (time.perf_counter() - t0) * 1000
+
+        print(f"folder chain depth={args.depth}")
+        print(f"  move leaf under top       {leaf_ms:8.2f} ms")
+        print(f"  reject cycle              {cycle_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+全文検索のベンチマーク。
+
+N 件のアイテムを持つ保管庫で、入力途中の語（前方一致）による
+上位 N 件検索の応答時間を測る。目標は 10 万件で 10ms 未満。
+
+    python -m benchmarks.bench_search [--items 100000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.migrations import migrate
+from services.search_service import search_items
+
+SITES = [
+    "google", "github", "amazon", "rakuten", "yahoo", "twitter", "facebook",
+    "netflix", "spotify", "dropbox", "slack", "zoom", "apple", "microsoft",
+    "paypal", "mercari", "line", "docomo", "softbank", "nintendo",
+]
+WORDS = [
+    "仕事", "個人", "銀行", "メール", "買い物", "開発", "テスト", "本番",
+    "account", "admin", "backup", "billing", "personal", "shared", "team",
+]
+
+
+def build_vault(conn, n_items, n_folders=500, seed=0):
+    rnd = random.Random(seed)
+    with conn:
+        conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+        conn.executemany(
+            "INSERT INTO folders (id, parent_id, name) VALUES (?, ?, ?)",
+            ((i, rnd.randint(1, i - 1), f"フォルダ {i}") for i in range(2, n_folders + 1))
+        )
+
+        def rows():
+            for i in range(n_items):
+                site = rnd.choice(SITES)
+                word = rnd.choice(WORDS)
+                yield (
+                    rnd.randint(1, n_folders),
+                    f"{site} {word} {i}",
+                    f"user{rnd.randint(1, 5000)}@{site}.com",
+                    "pw",
+                    f"https://www.{site}.com/login",
+                    f"{rnd.choice(WORDS)} {rnd.choice(WORDS)}",
+                )
+
+        conn.executemany(
+            "INSERT INTO items (folder_id, title, username, password, url, notes) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows()
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        site = rnd.choice(SITES)
+        # 2〜4 文字の打ちかけの語と、語の組み合わせを混ぜる
+        prefix = site[:rnd.randint(2, 4)]
+        if rnd.random() < 0.3:
+            prefix += " " + rnd.choice(WORDS)[:2]
+        queries.append(prefix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = get_connection(path)
+        migrate(conn)
+        build_vault(conn, args.items)
+
+        for label, scope in (("全体", None), ("部分木", 2)):
+            samples = []
+            for q in queries:
+                t0 = time.perf_counter()
+                search_items(conn, q, args.limit, scope)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            print(f"items={args.items} scope={label}  p50={samples[len(samples) // 2]:.2f}ms  "
+                  f"p95={samples[int(len(samples) * 0.95)]:.2f}ms  "
+                  f"mean={statistics.fmean(samples):.2f}ms")
+        close_connection(path)
+
+
+if __name__ == "__main__":
+    main()
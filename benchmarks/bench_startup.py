@@ -0,0 +1,112 @@
+"""
+GUI の起動時間の回帰ベンチマーク。
+
+一時保管庫に対して `gui_main.py --profile-startup` を offscreen で繰り返し起動し、
+最初のウィンドウが表示されるまでの時間（段階ごと）と、プロセス全体の時間の
+中央値を測る。基準値（benchmarks/startup_baseline.json）より
+許容幅を超えて遅くなっていれば終了コード 1 で終わる。
+
+鍵導出のコストはマシンの校正に依存しないよう固定値にする。
+
+    python -m benchmarks.bench_startup [--runs 10] [--tolerance 0.2] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from services.crypto import FieldCipher
+from services.repository import Repository
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "startup_baseline.json")
+PASSWORD = "bench-startup"
+KDF_PARAMS = {"algorithm": "scrypt", "n": 2 ** 14, "r": 8, "p": 1}
+
+
+def build_vault(path, n_items=1000):
+    vault = Repository(path)
+    vault.init()
+    cipher = FieldCipher(vault.set_master_password(PASSWORD, params=KDF_PARAMS))
+    root = vault.root_folder_id()
+    with vault.transaction():
+        for i in range(n_items):
+            vault.add_item(root, cipher, title=f"site {i}", password=f"pw{i}")
+
+
+def run_once(db_path):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PM_MASTER_PASSWORD=PASSWORD)
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "gui_main.py"), "--profile-startup", "--db", db_path],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"終了コード {proc.returncode}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall_ms"] = wall_ms
+    return result
+
+
+def summarize(results):
+    phases = {
+        name: statistics.median(r["phases"][name] for r in results)
+        for name in results[0]["phases"]
+    }
+    return {
+        "phases": phases,
+        "total_ms": statistics.median(r["total_ms"] for r in results),
+        "wall_ms": statistics.median(r["wall_ms"] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="基準値からの許容される悪化の割合")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        import PySide6  # noqa: F401
+    except ImportError:
+        print("PySide6 が無いため起動時間の計測は省略")
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build_vault(db_path)
+        # 1回目はディスクキャッシュを温めるために捨てる
+        run_once(db_path)
+        summary = summarize([run_once(db_path) for _ in range(args.runs)])
+
+    for name, ms in summary["phases"].items():
+        print(f"  {name:20} {ms:8.1f} ms")
+    print(f"  {'time-to-first-window':20} {summary['total_ms']:8.1f} ms")
+    print(f"  {'process wall time':20} {summary['wall_ms']:8.1f} ms")
+
+    if args.update_baseline or not os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "w", encoding="utf-8") as fp:
+            json.dump(summary, fp, indent=2, ensure_ascii=False)
+        print(f"基準値を {BASELINE_PATH} に保存しました")
+        return 0
+
+    with open(BASELINE_PATH, encoding="utf-8") as fp:
+        baseline = json.load(fp)
+    failed = False
+    for key in ("total_ms", "wall_ms"):
+        limit = baseline[key] * (1 + args.tolerance)
+        status = "OK" if summary[key] <= limit else "NG"
+        failed = failed or status == "NG"
+        print(f"{status} {key}: {summary[key]:.1f} ms（基準 {baseline[key]:.1f} ms、上限 {limit:.1f} ms）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
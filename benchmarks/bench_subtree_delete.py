@@ -0,0 +1,84 @@
+"""
+部分木削除のベンチマーク。
+
+5階層・10万アイテムの部分木を delete_subtree で削除し、
+全体の所要時間と、進捗ハンドラ呼び出しの最大間隔
+（GUI ではこれがイベントループが止まる最長時間になる）を測る。
+
+    python -m benchmarks.bench_subtree_delete [--levels 5] [--fanout 6] [--items 100000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from services.connection import get_connection, close_connection
+from services.folder_service import delete_subtree, vacuum_orphans
+from services.migrations import migrate
+
+
+def build_subtree(conn, levels, fanout, n_items, seed=0):
+    """ルート(1) の下に levels 階層・各 fanout 分岐の部分木を作り、その頂点 id を返す"""
+    rnd = random.Random(seed)
+    with conn:
+        conn.execute("INSERT INTO folders (id, parent_id, name) VALUES (1, NULL, 'ルート')")
+        top = conn.execute(
+            "INSERT INTO folders (parent_id, name) VALUES (1, '削除対象')"
+        ).lastrowid
+        level = [top]
+        all_ids = [top]
+        for depth in range(1, levels):
+            next_level = []
+            for parent_id in level:
+                for i in range(fanout):
+                    fid = conn.execute(
+                        "INSERT INTO folders (parent_id, name) VALUES (?, ?)",
+                        (parent_id, f"L{depth}-{i}")
+                    ).lastrowid
+                    next_level.append(fid)
+            all_ids.extend(next_level)
+            level = next_level
+        conn.executemany(
+            "INSERT INTO items (folder_id, title, username, password, url, notes) "
+            "VALUES (?, ?, 'user', 'pw', 'https://example.com', '')",
+            ((rnd.choice(all_ids), f"item {i}") for i in range(n_items))
+        )
+    return top, len(all_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--items", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = get_connection(path)
+        migrate(conn)
+        top, n_folders = build_subtree(conn, args.levels, args.fanout, args.items)
+
+        ticks = []
+
+        def progress():
+            ticks.append(time.perf_counter())
+
+        t0 = time.perf_counter()
+        with conn:
+            folders, items = delete_subtree(conn, top, progress=progress)
+        t1 = time.perf_counter()
+
+        stamps = [t0] + ticks + [t1]
+        max_gap = max(b - a for a, b in zip(stamps, stamps[1:])) * 1000
+        print(f"subtree folders={n_folders} items={args.items}")
+        print(f"  deleted folders={folders} items={items}  total={(t1 - t0) * 1000:.1f}ms  "
+              f"progress calls={len(ticks)}  max stall={max_gap:.2f}ms")
+        assert (folders, items) == (n_folders, args.items)
+        assert vacuum_orphans(conn) == (0, 0)
+        close_connection(path)
+
+
+if __name__ == "__main__":
+    main()
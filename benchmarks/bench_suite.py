@@ -0,0 +1,277 @@
+"""
+保管庫の大きさごとの性能ベンチマーク（コミット間の回帰の比較用）。
+
+benchmarks.synthetic_vault で --sizes 件（既定 1k / 100k / 1M）の保管庫を作り、
+それぞれで次の時間（ミリ秒、--repeat 回の中央値）を測る。
+  init_db             gui_main.init_db()（スキーマの確認とルートフォルダ）
+  unlock              gui_main.unlock_vault()（鍵導出とデータ鍵の取り出し）
+  folder_tree         FolderTree の初回構築（load_folders_from_db で木全体を組む）
+  folder_tree_reload  変更のない状態での load_folders_from_db（差分の反映だけ）
+  load_items          MainWindow.load_items_for_folder() から一覧と先頭の詳細が出るまで
+  delete_folder       ルート直下の1フォルダを配下ごと削除してツリーに反映する（1回だけ）
+Qt は QT_QPA_PLATFORM=offscreen で動かす。PySide6 が無ければ GUI の関数の代わりに
+同じ処理の Repository 部分だけを測り、結果に "qt": false と記録する。
+
+結果は --history の JSON（1回分ずつのリスト）に追記し、同じ件数・同じ qt の有無の
+直前の結果と比べる。--tolerance を超えて遅くなった項目があれば終了コード 1 で終わる。
+作った保管庫は --cache-dir を指定すれば残し、同じ形なら次回は作り直さない。
+
+    python -m benchmarks.bench_suite [--sizes 1000 100000 1000000] [--repeat 5]
+        [--cache-dir DIR] [--history benchmarks/suite_history.json] [--tolerance 0.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_vault import PASSWORD, VaultShape, build_vault, folder_count
+from services.backup import hot_backup
+from services.folder_service import FolderIndex
+from services.repository import Repository
+from services.session import session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_PATH = os.path.join(ROOT, "benchmarks", "suite_history.json")
+DEFAULT_SIZES = (1000, 100000, 1000000)
+# 件数が変わってもフォルダの形は同じにする（1フォルダあたりの件数が件数に比例する）
+SUITE_SHAPE = VaultShape(depth=3, fanout=5)
+# 比べる時間がこれより短い項目は、揺らぎが大きいので回帰と判定しない
+MIN_COMPARABLE_MS = 1.0
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def vault_path(cache_dir, shape):
+    name = "vault-{}-d{}-f{}-s{}.db".format(shape.items, shape.depth, shape.fanout, shape.seed)
+    return os.path.join(cache_dir, name)
+
+
+def prepare_vault(cache_dir, shape):
+    """shape の保管庫のパスと、作るのにかかった時間（キャッシュにあれば None）を返す"""
+    path = vault_path(cache_dir, shape)
+    if os.path.exists(path):
+        return path, None
+    t0 = time.perf_counter()
+    build_vault(path, shape)
+    return path, (time.perf_counter() - t0) * 1000
+
+
+# ---------- 計測 ----------
+
+def measure_core(vault, folder_ids, repeat):
+    """PySide6 が無いときの計測（GUI の関数が DB に対して行う処理だけ）"""
+    leaf = folder_ids[-1]
+
+    def unlock():
+        # gui_main.unlock_vault と同じ手順
+        session.unlock(vault.open_vault(PASSWORD))
+        vault.encrypt_pending_rows(session.cipher())
+
+    results = {
+        "init_db": median_ms(vault.init, repeat),
+        "unlock": median_ms(unlock, repeat),
+        "folder_tree": median_ms(
+            lambda: list(FolderIndex(vault.list_folders_with_counts()).walk()), repeat
+        ),
+        "load_items": median_ms(lambda: vault.item_page(leaf), repeat),
+    }
+    t0 = time.perf_counter()
+    vault.delete_folder(folder_ids[1])
+    results["delete_folder"] = (time.perf_counter() - t0) * 1000
+    return results
+
+
+def measure_qt(app, gui_main, folder_ids, repeat):
+    from PySide6.QtCore import QEventLoop
+
+    def wait_loaded(window):
+        # MainWindow.on_db_loaded の後に繋ぐので、抜けた時点で一覧は反映済み
+        # （失敗したときも抜け、呼び出し側で一覧のフォルダを確かめる）
+        loop = QEventLoop()
+        done = lambda channel, *_: channel == "items" and loop.quit()
+        window.db_worker.loaded.connect(done)
+        window.db_worker.failed.connect(done)
+        return loop, done
+
+    def stop_waiting(window, done):
+        window.db_worker.loaded.disconnect(done)
+        window.db_worker.failed.disconnect(done)
+
+    results = {
+        "init_db": median_ms(gui_main.init_db, repeat),
+        "unlock": median_ms(lambda: gui_main.unlock_vault(PASSWORD), repeat),
+        "folder_tree": median_ms(lambda: gui_main.FolderTree("", "").deleteLater(), repeat),
+    }
+    tree = gui_main.FolderTree("", "")
+    results["folder_tree_reload"] = median_ms(tree.load_folders_from_db, repeat)
+
+    window = gui_main.MainWindow()
+    loop, done = wait_loaded(window)
+    # 起動直後のルートフォルダの読み込みを待ってから測る
+    loop.exec()
+    stop_waiting(window, done)
+
+    def load_items(folder_id):
+        loop, done = wait_loaded(window)
+        window.load_items_for_folder(folder_id)
+        loop.exec()
+        stop_waiting(window, done)
+        if window.item_model.folder_id() != folder_id:
+            raise RuntimeError(f"フォルダ {folder_id} の一覧が読み込まれませんでした")
+
+    # 同じフォルダを続けて読むとキャッシュの効き方が変わるので、2つの末端を交互に読む
+    leaves = iter(folder_ids[-2:] * repeat)
+    results["load_items"] = median_ms(lambda: load_items(next(leaves)), repeat)
+
+    # FolderTree.delete_folder から確認ダイアログ・進捗ダイアログと完了通知を除いたもの
+    # （GUI ではワーカースレッドで削除する）
+    folder_id = folder_ids[1]
+    t0 = time.perf_counter()
+    gui_main.vault.delete_folder(folder_id)
+    window.folder_tree.apply_removed(folder_id)
+    window.folder_tree.load_folders_from_db()
+    results["delete_folder"] = (time.perf_counter() - t0) * 1000
+
+    window.db_worker.wait()
+    window.close()
+    window.deleteLater()
+    tree.deleteLater()
+    app.processEvents()
+    return results
+
+
+def run_size(work_dir, cache_dir, size, repeat, qt):
+    shape = SUITE_SHAPE._replace(items=size)
+    cached, build_ms = prepare_vault(cache_dir, shape)
+    # 削除を測るので、キャッシュの保管庫は書き換えずに複製を使う
+    path = os.path.join(work_dir, f"work-{size}.db")
+    hot_backup(cached, path, pages=-1, sleep=0)
+    vault = Repository(path)
+    # build_vault は浅い順に作るので、id 順がそのまま浅い順
+    folder_ids = [row[0] for row in vault.conn.execute("SELECT id FROM folders ORDER BY id")]
+    assert len(folder_ids) == folder_count(shape)
+
+    if qt is None:
+        results = measure_core(vault, folder_ids, repeat)
+    else:
+        app, gui_main = qt
+        gui_main.vault = vault
+        results = measure_qt(app, gui_main, folder_ids, repeat)
+    if build_ms is not None:
+        results["build_vault"] = build_ms
+    return results
+
+
+# ---------- 履歴 ----------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def previous_results(history, size, qt):
+    for run in reversed(history):
+        if run["qt"] == qt and str(size) in run["sizes"]:
+            return run["commit"], run["sizes"][str(size)]
+    return None, None
+
+
+def compare(results, previous, tolerance):
+    """(項目, 今回, 前回, 悪化したか) のリスト。build_vault はキャッシュの有無で変わるので除く"""
+    rows = []
+    for name, ms in results.items():
+        before = previous.get(name)
+        if name == "build_vault" or before is None:
+            continue
+        regressed = ms > before * (1 + tolerance) and ms >= MIN_COMPARABLE_MS
+        rows.append((name, ms, before, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache-dir", help="作った保管庫を置いて次回も使うディレクトリ")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="前回からの許容される悪化の割合")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PySide6.QtWidgets import QApplication
+        import gui_main
+    except ImportError:
+        print("PySide6 が無いため GUI の代わりに Repository の処理だけを測ります")
+        qt = None
+    else:
+        app = QApplication.instance() or QApplication([])
+        gui_main.preload_assets(app.devicePixelRatio())
+        qt = (app, gui_main)
+
+    run = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "qt": qt is not None,
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    history = load_history(args.history)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = args.cache_dir or tmp
+        os.makedirs(cache_dir, exist_ok=True)
+        for size in args.sizes:
+            results = run_size(tmp, cache_dir, size, args.repeat, qt)
+            run["sizes"][str(size)] = results
+            commit, previous = previous_results(history, size, run["qt"])
+            print(f"items={size}" + (f"  (前回 {commit} と比較)" if previous else ""))
+            compared = {row[0]: row for row in compare(results, previous or {}, args.tolerance)}
+            for name, ms in results.items():
+                if name in compared:
+                    _, _, before, regressed = compared[name]
+                    failed = failed or regressed
+                    mark = "NG" if regressed else "  "
+                    change = f", {(ms - before) / before * 100:+.0f}%" if before else ""
+                    print(f"  {mark} {name:20} {ms:10.3f} ms  (前回 {before:.3f} ms{change})")
+                else:
+                    print(f"     {name:20} {ms:10.3f} ms")
+
+    history.append(run)
+    with open(args.history, "w", encoding="utf-8") as fp:
+        json.dump(history, fp, indent=2, ensure_ascii=False)
+    print(f"結果を {args.history} に追記しました")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
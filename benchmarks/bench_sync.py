@@ -0,0 +1,86 @@
+"""
+同期（services.sync_service）の差分の大きさと時間が、保管庫の大きさによらないことを確かめる。
+
+--sizes 件ごとに benchmarks.synthetic_vault で保管庫 A を作り、最初の同期（全件の書き出し）を
+してから B に複製する。その後 A で --edits 件のアイテムを変更し、次を測る。
+  initial_export   最初の書き出し（全件。保管庫の大きさに比例する）
+  delta_export     変更した --edits 件だけの書き出し
+  delta_import     B での取り込み
+  idle_sync        変更の無い同期（書き出し・取り込みとも空）
+時間はミリ秒、delta_bytes は差分ファイルの大きさ。
+
+    python -m benchmarks.bench_sync [--sizes 10000 100000] [--edits 100]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.synthetic_vault import PASSWORD, VaultShape, build_vault
+from services import sync_service
+from services.backup import hot_backup
+from services.crypto import FieldCipher
+from services.repository import Repository
+
+
+def timed_ms(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - t0) * 1000, result
+
+
+def run_size(work_dir, size, edits):
+    path_a = os.path.join(work_dir, f"a-{size}.db")
+    path_b = os.path.join(work_dir, f"b-{size}.db")
+    sync_dir = os.path.join(work_dir, f"sync-{size}")
+    build_vault(path_a, VaultShape(items=size))
+    a = Repository(path_a)
+    a.init()
+    cipher = FieldCipher(a.open_vault(PASSWORD))
+
+    results = {}
+    results["initial_export"], _ = timed_ms(
+        lambda: sync_service.export_changes(a.conn, sync_dir, cipher)
+    )
+    # 書き出し済みの A を複製して、B を別の端末として始める
+    hot_backup(path_a, path_b, pages=-1, sleep=0)
+    b = Repository(path_b)
+    b.init()
+    sync_service.sync(b.conn, sync_dir, cipher)
+
+    rnd = random.Random(0)
+    item_ids = [row[0] for row in a.conn.execute("SELECT id FROM items")]
+    with a.transaction():
+        for item_id in rnd.sample(item_ids, min(edits, len(item_ids))):
+            a.update_item(item_id, cipher, title=f"edited {item_id}")
+
+    results["delta_export"], exported = timed_ms(
+        lambda: sync_service.export_changes(a.conn, sync_dir, cipher)
+    )
+    results["delta_import"], imported = timed_ms(
+        lambda: sync_service.import_changes(b.conn, sync_dir, cipher)
+    )
+    assert imported["items"] == exported["items"], (imported, exported)
+    results["idle_sync"], _ = timed_ms(lambda: sync_service.sync(b.conn, sync_dir, cipher))
+    results["delta_bytes"] = os.path.getsize(exported["path"])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--edits", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            results = run_size(tmp, size, args.edits)
+            print(f"items={size} edits={args.edits}")
+            for name, value in results.items():
+                unit = "bytes" if name == "delta_bytes" else "ms"
+                print(f"  {name:16} {value:12.1f} {unit}")
+
+
+if __name__ == "__main__":
+    main()
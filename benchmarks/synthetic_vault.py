@@ -0,0 +1,164 @@
+"""
+ベンチマーク用の合成保管庫を作る。
+
+フォルダの深さ・分岐数、アイテム数、各項目の長さ、日本語のタイトル・メモの割合を
+VaultShape で指定する。形と乱数の種が同じなら、同じ id・同じ平文の保管庫になる
+（暗号文は nonce が毎回変わるので一致しない）。
+マスターパスワードは PASSWORD、鍵導出のコストは KDF_PARAMS に固定する。
+
+アイテムはすべてのフォルダ（ルートを含む）に順に割り当てるので、
+1フォルダあたりのアイテム数はおよそ items / フォルダ数 になる。
+--items-per-folder を指定すると、そこから items を決める。
+
+    python -m benchmarks.synthetic_vault OUT.db [--items 100000] [--depth 3] [--fanout 5]
+        [--items-per-folder N] [--title-len 24] [--notes-len 200] [--unicode-ratio 0.5] [--seed 0]
+"""
+import argparse
+import os
+import random
+import string
+import time
+from collections import namedtuple
+
+from services import folder_service
+from services.crypto import FieldCipher
+from services.connection import triggers_suspended
+from services.folder_service import ITEM_STATS_TRIGGERS, rebuild_folder_stats
+from services.item_service import encrypt_fields, new_row_uuid
+from services.repository import Repository
+from services.search_service import FTS_TRIGGERS, rebuild_fts_index
+
+PASSWORD = "bench-vault"
+KDF_PARAMS = {"algorithm": "scrypt", "n": 2 ** 14, "r": 8, "p": 1}
+
+VaultShape = namedtuple(
+    "VaultShape",
+    "items depth fanout title_len username_len password_len notes_len unicode_ratio seed",
+    defaults=(100000, 3, 5, 24, 12, 20, 200, 0.5, 0),
+)
+
+# 1回の executemany で入れる件数
+BATCH_SIZE = 10000
+
+FOLDER_NAMES = ("仕事", "個人", "家族", "金融", "買い物", "趣味", "開発", "旅行", "学校", "アーカイブ")
+JAPANESE_WORDS = (
+    "銀行", "ネット証券", "メール", "通販", "旅行予約", "会社", "大学", "クラウド", "ゲーム",
+    "病院", "市役所", "図書館", "電力会社", "携帯電話", "動画配信", "新聞", "保険", "ポイント",
+)
+ASCII_WORDS = (
+    "mail", "bank", "shop", "cloud", "travel", "news", "video", "music", "game", "forum",
+    "photo", "drive", "office", "school", "market", "health", "energy", "mobile",
+)
+PASSWORD_CHARS = string.ascii_letters + string.digits + "!@#$%^&*"
+
+
+def folder_count(shape):
+    """ルートを含むフォルダの数"""
+    return sum(shape.fanout ** d for d in range(shape.depth + 1))
+
+
+def _text(rnd, length, unicode_ratio):
+    """単語をつないだ length 文字の文字列（unicode_ratio の割合で日本語の単語を使う）"""
+    words = JAPANESE_WORDS if rnd.random() < unicode_ratio else ASCII_WORDS
+    parts = []
+    size = 0
+    while size < length:
+        word = rnd.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:length]
+
+
+def _item_rows(shape, folder_ids, cipher, rnd, start, stop):
+    for i in range(start, stop):
+        values = {
+            "title": f"{_text(rnd, shape.title_len - 7, shape.unicode_ratio)} {i:06d}",
+            "username": f"user{i}"[:shape.username_len].ljust(shape.username_len, "x"),
+            "password": "".join(rnd.choices(PASSWORD_CHARS, k=shape.password_len)),
+            "url": f"https://{rnd.choice(ASCII_WORDS)}{i}.example.com/login",
+            "notes": _text(rnd, shape.notes_len, shape.unicode_ratio),
+        }
+        row_uuid = new_row_uuid()
+        values = encrypt_fields(cipher, values, row_uuid)
+        yield (
+            folder_ids[i % len(folder_ids)], values["title"], values["username"],
+            values["password"], values["url"], values["notes"], row_uuid,
+        )
+
+
+def build_vault(path, shape=VaultShape(), progress=None):
+    """
+    path に shape の保管庫を作り、フォルダの id を浅い順（ルートが先頭）で返す。
+    path が既にあれば上書きせずに ValueError。
+    progress を渡すと BATCH_SIZE 件ごとに progress(作成済みの件数) を呼ぶ。
+    """
+    if os.path.exists(path):
+        raise ValueError(f"{path} は既にあります")
+    rnd = random.Random(shape.seed)
+    vault = Repository(path)
+    vault.init()
+    cipher = FieldCipher(vault.set_master_password(PASSWORD, params=KDF_PARAMS))
+    root = vault.root_folder_id()
+
+    with vault.transaction() as conn:
+        # 親を子より先に作るので、閉包テーブルはトリガのままで正しくなる
+        folder_ids = [root]
+        level = [root]
+        for depth in range(1, shape.depth + 1):
+            next_level = []
+            for parent_id in level:
+                for i in range(shape.fanout):
+                    name = f"{FOLDER_NAMES[(len(folder_ids) + i) % len(FOLDER_NAMES)]} {depth}-{i}"
+                    next_level.append(folder_service.add_folder(conn, parent_id, name))
+            folder_ids.extend(next_level)
+            level = next_level
+
+        # 全文検索とアイテム数は行ごとに更新せず、最後にまとめて作り直す
+        with triggers_suspended(conn, FTS_TRIGGERS), triggers_suspended(conn, ITEM_STATS_TRIGGERS):
+            for start in range(0, shape.items, BATCH_SIZE):
+                stop = min(start + BATCH_SIZE, shape.items)
+                conn.executemany(
+                    "INSERT INTO items (folder_id, title, username, password, url, notes, uuid) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    _item_rows(shape, folder_ids, cipher, rnd, start, stop)
+                )
+                if progress is not None:
+                    progress(stop)
+        rebuild_fts_index(conn)
+        rebuild_folder_stats(conn)
+    return folder_ids
+
+
+def main():
+    defaults = VaultShape()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--items", type=int, default=defaults.items)
+    parser.add_argument("--items-per-folder", type=int)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--title-len", type=int, default=defaults.title_len)
+    parser.add_argument("--username-len", type=int, default=defaults.username_len)
+    parser.add_argument("--password-len", type=int, default=defaults.password_len)
+    parser.add_argument("--notes-len", type=int, default=defaults.notes_len)
+    parser.add_argument("--unicode-ratio", type=float, default=defaults.unicode_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    shape = VaultShape(
+        args.items, args.depth, args.fanout, args.title_len, args.username_len,
+        args.password_len, args.notes_len, args.unicode_ratio, args.seed,
+    )
+    if args.items_per_folder is not None:
+        shape = shape._replace(items=args.items_per_folder * folder_count(shape))
+
+    t0 = time.perf_counter()
+    folder_ids = build_vault(
+        args.path, shape, progress=lambda done: print(f"\r{done}/{shape.items}", end="", flush=True)
+    )
+    print(f"\r{args.path}: folders={len(folder_ids)} items={shape.items} "
+          f"in {time.perf_counter() - t0:.1f}s (password: {PASSWORD})")
+
+
+if __name__ == "__main__":
+    main()
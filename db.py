@@ -1,24 +0,0 @@
-# db.py
-import sqlite3
-
-DB_PATH = "password_manager.db"
-
-def get_connection():
-    return sqlite3.connect(DB_PATH)
-
-def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # フォルダテーブル
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            parent_id INTEGER,
-            name TEXT NOT NULL
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-
@@ -1,8 +1,405 @@
-from services.db_service import init_db, add_account
+import argparse
+import base64
+import binascii
+import getpass
+import json
+import os
+import sqlite3
+import sys
 
-def main():
-    init_db()
-    add_account()
+from services.item_service import PAGE_SIZE, ItemConflictError
+from services.repository import Repository, DB_PATH
+
+
+# ========== コマンドライン版 ==========
+#
+# GUI と同じ Repository を使う、スクリプトから呼ぶための CLI。
+# PySide6 は読み込まないので起動が速い（数十ミリ秒）。
+#
+#   python main.py [--db PATH] list [--folder ID]
+#   python main.py get ID... [--reveal]
+#   python main.py search TEXT [--folder ID] [--limit N]
+#   python main.py add [--folder ID] [--title ...] [--username ...] ... | --batch
+#   python main.py update ID [--title ...] ... [--expect-version N] | --batch
+#   python main.py rm ID... [--folder] | --batch
+#   python main.py mv ID... --to FOLDER [--folder] | --batch
+#   python main.py import PATH [--format FMT] [--folder ID] [--dry-run]
+#   python main.py export PATH [--incremental]
+#   python main.py sync DIR
+#   python main.py audit [--breach-list PATH] [--sort KEY] [--workers N]
+#   python main.py generate [--count N] [--length N] [--passphrase] [--url URL] ...
+#   python main.py unlock
+#
+# 出力は1行1オブジェクトの JSON（NDJSON）。エラーは {"error": ...} を標準エラーに出し、
+# 終了コード 1 で終わる。
+#
+# --batch を付けると標準入力から1行1レコードの JSON を読み、全件を
+# 1トランザクションで処理する（途中で失敗すれば1件も書き込まれない）。
+#
+# 暗号化フィールドを扱うコマンドは保管庫の解錠が必要。鍵は次の順で探す。
+#   1. 環境変数 PM_SESSION（`main.py unlock` が出力するセッショントークン）
+#   2. 環境変数 PM_MASTER_PASSWORD
+#   3. 端末からの入力
+# マスターパスワードからの鍵導出は意図的に遅い（約 300ms）ので、
+# 何度も呼ぶスクリプトでは最初に unlock してトークンを使い回す。
+# トークンはデータ鍵そのものなので、パスワードと同じように扱うこと。
+#
+# update に --expect-version（--batch ではレコードの "version"）を付けると、
+# get で読んだ後に GUI や別のスクリプトが更新していた場合は書き込まずにエラーにする。
+
+ITEM_FIELDS = ("title", "username", "password", "url", "notes")
+
+
+class CliError(Exception):
+    pass
+
+
+# ---------- 入出力 ----------
+
+def emit(obj):
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False))
+    sys.stdout.write("\n")
+
+
+def read_batch():
+    """標準入力の JSON Lines を (行番号, dict) で返す（空行は飛ばす）"""
+    for lineno, line in enumerate(sys.stdin, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise CliError(f"{lineno} 行目: JSON として読めません: {e}")
+        if not isinstance(record, dict):
+            raise CliError(f"{lineno} 行目: オブジェクトではありません")
+        yield lineno, record
+
+
+def run_batch(vault, records, apply):
+    """
+    records の各レコードに apply(record) を1トランザクションで適用する。
+    結果はコミットしてから出力する（失敗したバッチの結果は出さない）。
+    """
+    results = []
+    with vault.transaction():
+        for lineno, record in records:
+            try:
+                results.append(apply(record))
+            except (CliError, ItemConflictError, KeyError, TypeError, ValueError,
+                    sqlite3.Error) as e:
+                message = f"'{e.args[0]}' がありません" if isinstance(e, KeyError) else str(e)
+                # --batch でない場合（lineno = 0）は行番号を付けない
+                raise CliError(f"{lineno} 行目: {message}" if lineno else message)
+    for result in results:
+        emit(result)
+
+
+# ---------- 解錠 ----------
+
+def encode_session(data_key):
+    return base64.urlsafe_b64encode(data_key).decode("ascii")
+
+
+def load_data_key(vault):
+    token = os.environ.get("PM_SESSION")
+    if token:
+        try:
+            data_key = base64.urlsafe_b64decode(token.encode("ascii"))
+        except (binascii.Error, ValueError):
+            raise CliError("PM_SESSION の形式が不正です")
+        if not vault.check_data_key(data_key):
+            raise CliError("PM_SESSION がこの保管庫のものではありません")
+        return data_key
+
+    if not vault.is_master_password_set():
+        raise CliError("マスターパスワードが未設定です（GUI で設定してください）")
+    password = os.environ.get("PM_MASTER_PASSWORD")
+    if password is None:
+        password = getpass.getpass("マスターパスワード: ")
+    data_key = vault.open_vault(password)
+    if data_key is None:
+        raise CliError("マスターパスワードが違います")
+    return data_key
+
+
+def load_cipher(vault):
+    from services.crypto import FieldCipher
+
+    cipher = FieldCipher(load_data_key(vault))
+    # 暗号化導入前の平文が残っていれば、GUI と同じくここで暗号化する
+    vault.encrypt_pending_rows(cipher)
+    return cipher
+
+
+# ---------- コマンド ----------
+
+def cmd_list(vault, args):
+    if args.folder is None:
+        for folder in vault.list_folders_with_counts():
+            emit(folder._asdict())
+        return
+    before_id = None
+    while True:
+        page = vault.item_page(args.folder, before_id)
+        for row in page:
+            emit({"id": row.id, "folder_id": args.folder, "title": row.title})
+        if len(page) < PAGE_SIZE:
+            return
+        before_id = page[-1].id
+
+
+def cmd_get(vault, args):
+    cipher = load_cipher(vault) if args.reveal else None
+    for item_id in args.ids:
+        item = vault.get_item(item_id, cipher)
+        if item is None:
+            raise CliError(f"アイテム {item_id} がありません")
+        record = item._asdict()
+        if cipher is None:
+            # 解錠しない場合、暗号化フィールドは出力しない
+            for field in ("password", "notes"):
+                record[field] = None
+        emit(record)
+
+
+def cmd_search(vault, args):
+    for row in vault.search(args.text, args.limit, args.folder):
+        emit(row._asdict())
+
+
+def _fields_from_args(args):
+    return {f: getattr(args, f) for f in ITEM_FIELDS if getattr(args, f) is not None}
+
+
+def cmd_add(vault, args):
+    cipher = load_cipher(vault)
+    default_folder = args.folder if args.folder is not None else vault.root_folder_id()
+
+    def apply(record):
+        folder_id = record.pop("folder_id", default_folder)
+        item = vault.add_item(folder_id, cipher, **record)
+        return {"id": item.id, "folder_id": folder_id}
+
+    if args.batch:
+        run_batch(vault, read_batch(), apply)
+    else:
+        run_batch(vault, [(0, _fields_from_args(args))], apply)
+
+
+def cmd_update(vault, args):
+    cipher = load_cipher(vault)
+
+    def apply(record):
+        item_id = record.pop("id")
+        if not vault.update_item(item_id, cipher, **record):
+            raise CliError(f"アイテム {item_id} がありません")
+        return {"id": item_id, "updated": sorted(set(record) - {"version"})}
+
+    if args.batch:
+        run_batch(vault, read_batch(), apply)
+    else:
+        if args.id is None:
+            raise CliError("ID を指定してください")
+        record = {"id": args.id, **_fields_from_args(args)}
+        if args.expect_version is not None:
+            record["version"] = args.expect_version
+        run_batch(vault, [(0, record)], apply)
+
+
+def cmd_rm(vault, args):
+    def apply(record):
+        if record.get("folder", args.folder):
+            folders, items = vault.delete_folder(record["id"])
+            if not folders:
+                raise CliError(f"フォルダ {record['id']} がありません")
+            return {"id": record["id"], "folders": folders, "items": items}
+        if not vault.delete_item(record["id"]):
+            raise CliError(f"アイテム {record['id']} がありません")
+        return {"id": record["id"], "deleted": True}
+
+    records = read_batch() if args.batch else [(0, {"id": i}) for i in args.ids]
+    run_batch(vault, records, apply)
+
+
+def cmd_mv(vault, args):
+    def apply(record):
+        target = record.get("to", args.to)
+        if target is None:
+            raise CliError("移動先（to）を指定してください")
+        if record.get("folder", args.folder):
+            moved = vault.move_folder(record["id"], target)
+        else:
+            # アイテムの移動は folder_id の更新だけなので暗号器は要らない
+            moved = vault.update_item(record["id"], None, folder_id=target)
+        if not moved:
+            raise CliError(f"{record['id']} がありません")
+        return {"id": record["id"], "to": target}
+
+    if args.batch or args.folder:
+        records = read_batch() if args.batch else [(0, {"id": i}) for i in args.ids]
+        run_batch(vault, records, apply)
+        return
+    # 引数で渡したアイテムは件数に関係なく UPDATE 1文でまとめて移す
+    if args.to is None:
+        raise CliError("移動先（to）を指定してください")
+    ids = list(dict.fromkeys(args.ids))
+    with vault.transaction():
+        if vault.move_items(ids, args.to) != len(ids):
+            raise CliError("存在しないアイテムが含まれています")
+    for item_id in ids:
+        emit({"id": item_id, "to": args.to})
+
+
+def cmd_import(vault, args):
+    cipher = None if args.dry_run else load_cipher(vault)
+    folder_id = args.folder if args.folder is not None else vault.root_folder_id()
+    result = vault.import_file(args.path, folder_id, cipher, args.format, dry_run=args.dry_run)
+    emit(result)
+
+
+def cmd_export(vault, args):
+    emit(vault.export(args.path, load_cipher(vault), incremental=args.incremental))
+
+
+def cmd_sync(vault, args):
+    emit(vault.sync(args.directory, load_cipher(vault)))
+
+
+def cmd_audit(vault, args):
+    from services.audit import sort_report, summarize, STRENGTH_LABELS
+
+    entries = vault.audit(load_cipher(vault), args.breach_list, args.workers)
+    for entry in sort_report(entries, args.sort):
+        record = entry._asdict()
+        record["strength"] = STRENGTH_LABELS[entry.strength]
+        emit(record)
+    # 最後の1行は集計
+    emit({"summary": summarize(entries)})
+
+
+def cmd_generate(vault, args):
+    from services import generator
+
+    base = generator.PASSPHRASE_POLICY if args.passphrase else generator.DEFAULT_POLICY
+    overrides = {
+        "length": args.length, "words": args.words,
+        "exclude": args.exclude,
+        "exclude_lookalikes": args.exclude_lookalikes or None,
+        "symbols": False if args.no_symbols else None,
+    }
+    base = base._replace(**{k: v for k, v in overrides.items() if v is not None})
+    rules = generator.load_site_rules(args.rules) if args.rules else None
+    policy = generator.policy_for_url(args.url, rules, base)
+    for password in generator.generate_batch(args.count, policy):
+        emit({"password": password})
+
+
+def cmd_unlock(vault, args):
+    print(encode_session(load_data_key(vault)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python main.py")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="フォルダ一覧、または --folder のアイテム一覧")
+    p.add_argument("--folder", type=int)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("get", help="アイテムの詳細")
+    p.add_argument("ids", type=int, nargs="+")
+    p.add_argument("--reveal", action="store_true", help="解錠して password / notes も出力する")
+    p.set_defaults(func=cmd_get)
+
+    p = sub.add_parser("search", help="全文検索")
+    p.add_argument("text")
+    p.add_argument("--folder", type=int, help="このフォルダと配下に絞り込む")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_search)
+
+    for name, func, help_text in (
+        ("add", cmd_add, "アイテムを追加"),
+        ("update", cmd_update, "アイテムを更新"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        if name == "update":
+            p.add_argument("id", type=int, nargs="?")
+            p.add_argument("--expect-version", type=int,
+                           help="この版のときだけ更新する（get の version）")
+        else:
+            p.add_argument("--folder", type=int, help="追加先（省略時はルート）")
+        for field in ITEM_FIELDS:
+            p.add_argument(f"--{field}")
+        p.add_argument("--batch", action="store_true", help="標準入力の JSON Lines をまとめて処理")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("rm", help="アイテム（--folder ならフォルダと配下）を削除")
+    p.add_argument("ids", type=int, nargs="*")
+    p.add_argument("--folder", action="store_true")
+    p.add_argument("--batch", action="store_true")
+    p.set_defaults(func=cmd_rm)
+
+    p = sub.add_parser("mv", help="アイテム（--folder ならフォルダ）を移動")
+    p.add_argument("ids", type=int, nargs="*")
+    p.add_argument("--to", type=int)
+    p.add_argument("--folder", action="store_true")
+    p.add_argument("--batch", action="store_true")
+    p.set_defaults(func=cmd_mv)
+
+    p = sub.add_parser("import", help="他のパスワード管理ソフトのエクスポートを取り込む")
+    p.add_argument("path")
+    p.add_argument("--format", choices=("1password", "bitwarden", "keepass", "json"))
+    p.add_argument("--folder", type=int, help="取り込み先（省略時はルート）")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="暗号化バックアップを書き出す")
+    p.add_argument("path")
+    p.add_argument("--incremental", action="store_true")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("sync", help="共有ディレクトリを介して他の端末の保管庫と同期する")
+    p.add_argument("directory")
+    p.set_defaults(func=cmd_sync)
+
+    p = sub.add_parser("audit", help="弱い・使い回し・類似・漏洩したパスワードを調べる")
+    p.add_argument("--breach-list", help="SHA-1 順の漏洩パスワード一覧（HIBP 形式）")
+    p.add_argument("--sort", default="risk",
+                   choices=("risk", "strength", "reused", "similar", "breached", "title"))
+    p.add_argument("--workers", type=int, help="ワーカープロセス数（省略時は CPU 数）")
+    p.set_defaults(func=cmd_audit)
+
+    p = sub.add_parser("generate", help="パスワード（またはパスフレーズ）を生成")
+    p.add_argument("--count", type=int, default=1)
+    p.add_argument("--length", type=int)
+    p.add_argument("--passphrase", action="store_true")
+    p.add_argument("--words", type=int, help="パスフレーズの単語数")
+    p.add_argument("--no-symbols", action="store_true")
+    p.add_argument("--exclude", help="使わない文字")
+    p.add_argument("--exclude-lookalikes", action="store_true", help="Il1O0 などを使わない")
+    p.add_argument("--url", help="このサイトの規則を適用する")
+    p.add_argument("--rules", help="サイトごとの規則（JSON）")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("unlock", help="セッショントークン（PM_SESSION 用）を出力")
+    p.set_defaults(func=cmd_unlock)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    vault = Repository(args.db)
+    try:
+        vault.init()
+        args.func(vault, args)
+    except CliError as e:
+        sys.stderr.write(json.dumps({"error": str(e)}, ensure_ascii=False) + "\n")
+        return 1
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.stderr.write(json.dumps({"error": str(e)}, ensure_ascii=False) + "\n")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
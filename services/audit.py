@@ -0,0 +1,294 @@
+import hashlib
+import math
+import mmap
+import multiprocessing
+import os
+import string
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+
+# ========== パスワード監査 ==========
+#
+# 保管庫全体のパスワードを調べて、アイテムごとの報告（AuditEntry）を作る。
+#   - 強度: 文字種の数と長さから見積もったエントロピー（同じ文字の繰り返しと連番は割り引く）
+#   - 使い回し: 同じパスワードを使うほかのアイテムの数。SHA-1 でまとめるので
+#     アイテム同士の総当たり比較はしない
+#   - 類似: 大文字小文字・前後の数字と記号・よくある置き換え（@→a など）を正規化すると
+#     同じになるもの（Summer2023! と summer2024 など）。完全一致は使い回しの方で数える
+#   - 漏洩: ローカルの漏洩パスワード一覧に載っている回数
+#
+# アイテムは AUDIT_CHUNK_SIZE 件ずつキーセットで読む。復号はこのプロセスで行い、
+# ハッシュ・強度・漏洩一覧の照合はチャンクごとにワーカープロセスへ渡す。
+# ワーカーに渡すのは平文のパスワードだけで、データ鍵は渡さない。
+# 結果として返すのはハッシュから求めた数値だけで、平文は報告に残らない。
+
+AUDIT_CHUNK_SIZE = 5000
+# これより少なければワーカープロセスを起動せずにこのプロセスで調べる
+# （起動のコストの方が大きい）
+PARALLEL_THRESHOLD = 4 * AUDIT_CHUNK_SIZE
+
+# エントロピー（ビット）の区切りと強度の表示名
+STRENGTH_THRESHOLDS = (28, 36, 60, 128)
+STRENGTH_LABELS = ("非常に弱い", "弱い", "普通", "強い", "非常に強い")
+# 「弱い」以下を弱いパスワードとして数える
+WEAK_LEVEL = 1
+# 類似とみなすために正規化後に残っていなければならない長さ
+MIN_SKELETON_LENGTH = 4
+# 漏洩一覧の探索: 位置の見積もりに使う先頭の桁数、補間探索の最大回数、
+# 残りを find で探す範囲の大きさ（バイト）
+PREFIX_DIGITS = 12
+INTERPOLATION_STEPS = 4
+SCAN_BELOW = 2048
+
+AuditEntry = namedtuple(
+    "AuditEntry", "item_id title entropy strength reused similar breached"
+)
+
+
+# ---------- 強度 ----------
+
+# 文字種ごとの候補の数。各文字を translate で文字種の代表 1 文字に置き換えてから数える
+_CLASS_POOL = {"a": 26, "A": 26, "0": 10, "!": 33}
+_CLASS_OF = str.maketrans({
+    **dict.fromkeys(string.ascii_lowercase, "a"),
+    **dict.fromkeys(string.ascii_uppercase, "A"),
+    **dict.fromkeys(string.digits, "0"),
+    **dict.fromkeys(string.punctuation + " ", "!"),
+})
+# ASCII 以外の文字はまとめて1つの文字種とみなす
+_OTHER_POOL = 100
+
+
+def _pool_size(password):
+    classes = set(password.translate(_CLASS_OF))
+    pool = sum(_CLASS_POOL.get(c, 0) for c in classes)
+    if not classes <= _CLASS_POOL.keys():
+        pool += _OTHER_POOL
+    return pool
+
+
+def estimate_entropy(password):
+    """文字種から見積もったエントロピー（ビット）。繰り返しと連番の文字は 1/4 に数える"""
+    if not password:
+        return 0.0
+    # 隣り合う文字の比較は int の列で行う（1文字ずつ ord() を呼ばない）
+    if password.isascii():
+        codes = password.encode("ascii")
+    else:
+        codes = memoryview(password.encode("utf-32-le")).cast("I")
+    repeats = sum(1 for a, b in zip(codes, codes[1:]) if -1 <= a - b <= 1)
+    return (len(codes) - 0.75 * repeats) * math.log2(_pool_size(password))
+
+
+def strength_level(entropy):
+    """0（非常に弱い）〜 4（非常に強い）"""
+    for level, threshold in enumerate(STRENGTH_THRESHOLDS):
+        if entropy < threshold:
+            return level
+    return len(STRENGTH_THRESHOLDS)
+
+
+# ---------- 類似 ----------
+
+_LEET = str.maketrans({"@": "a", "$": "s", "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t"})
+_EDGE = string.digits + string.punctuation + " "
+
+
+def skeleton(password):
+    """類似判定用の正規化: 前後の数字・記号を落とし、小文字にして置き換えを戻す"""
+    core = password.strip(_EDGE).lower().translate(_LEET)
+    return core if len(core) >= MIN_SKELETON_LENGTH else None
+
+
+# ---------- 漏洩一覧 ----------
+
+class BreachList:
+    """
+    SHA-1 順に並んだ漏洩パスワード一覧（Have I Been Pwned の
+    "ordered by hash" 形式。1行が `40桁の16進:回数`、回数は省略可）。
+    ファイルは mmap し、バイト位置で探索するので読み込みもインデックスも要らない。
+    """
+
+    def __init__(self, path):
+        self._fp = open(path, "rb")
+        size = os.fstat(self._fp.fileno()).st_size
+        self._map = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._fp.close()
+
+    def count(self, digest_hex):
+        """digest_hex（大文字の16進 bytes）が載っていればその回数、無ければ 0"""
+        m = self._map
+        lo, hi = 0, len(m)
+        # lo と hi は常に行頭。lo より前の行はすべて digest_hex より小さく、
+        # 該当する行があれば hi の行までにある。
+        # SHA-1 は一様に散らばるので、値から位置を見積もる補間探索で範囲を縮め
+        # （ほとんどは1〜2回で数十行まで縮む）、縮まらなければ二分探索で縮める。
+        # 残りの数 KB は find でまとめて探す（40桁の16進が一致するのは行頭だけ）
+        target = int(digest_hex[:PREFIX_DIGITS], 16)
+        lo_key, hi_key = 0, 16 ** PREFIX_DIGITS
+        steps = 0
+        while hi - lo > SCAN_BELOW:
+            if steps < INTERPOLATION_STEPS and lo_key < hi_key:
+                pos = lo + (target - lo_key) * (hi - lo) // (hi_key - lo_key)
+            else:
+                pos = (lo + hi) // 2
+            steps += 1
+            # pos を含む行の行頭（lo より前には戻らない）
+            pos = min(max(pos, lo), hi - 1)
+            start = m.rfind(b"\n", lo, pos) + 1 or lo
+            key = m[start:start + 40]
+            if key < digest_hex:
+                end = m.find(b"\n", pos)
+                lo = end + 1 if end != -1 else len(m)
+                lo_key = int(key[:PREFIX_DIGITS], 16)
+            else:
+                hi, hi_key = start, int(key[:PREFIX_DIGITS], 16)
+        lo = m.find(digest_hex, lo, hi + 40)
+        if lo == -1:
+            return 0
+        end = m.find(b"\n", lo)
+        line = m[lo:end if end != -1 else len(m)].rstrip(b"\r")
+        _, _, count = line.partition(b":")
+        return int(count) if count else 1
+
+
+# ---------- ワーカーで行う処理 ----------
+
+_breach_list = None
+
+
+def _init_worker(breach_path):
+    global _breach_list
+    _breach_list = BreachList(breach_path) if breach_path else None
+
+
+def analyze_passwords(passwords):
+    """
+    パスワードのリストを (SHA-1 の digest, エントロピー, 類似判定キー, 漏洩回数) の
+    リストにする。ワーカープロセスで呼ぶ（先に _init_worker が呼ばれている前提）。
+    """
+    results = []
+    for password in passwords:
+        digest = hashlib.sha1(password.encode("utf-8")).digest()
+        breached = _breach_list.count(digest.hex().upper().encode("ascii")) if _breach_list else 0
+        results.append((digest, estimate_entropy(password), skeleton(password), breached))
+    return results
+
+
+# ---------- 保管庫全体の監査 ----------
+
+def _iter_chunks(conn, cipher, chunk_size):
+    """(id, title, 平文パスワード) のリストを chunk_size 件ずつ返す（パスワードが空の行は除く）"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, title, password, uuid FROM items WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size)
+        ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        chunk = []
+        for item_id, title, password, row_uuid in rows:
+            password = cipher.decrypt_text(password, "password", row_uuid)
+            if password:
+                chunk.append((item_id, title, password))
+        yield chunk
+
+
+def _analyzed_chunks(conn, cipher, breach_path, workers, chunk_size):
+    """_iter_chunks の各チャンクを (行, 解析結果) にして返す"""
+    total = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    if workers <= 1 or total < PARALLEL_THRESHOLD:
+        _init_worker(breach_path)
+        try:
+            for chunk in _iter_chunks(conn, cipher, chunk_size):
+                yield chunk, analyze_passwords([row[2] for row in chunk])
+        finally:
+            if _breach_list is not None:
+                _breach_list.close()
+            _init_worker(None)
+        return
+
+    # GUI ではスレッドから呼ばれるので fork ではなく spawn でワーカーを起動する
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker, initargs=(breach_path,),
+    ) as executor:
+        # 復号しながら投入し、同時に処理中のチャンクは workers の2倍までに抑える
+        in_flight = deque()
+        for chunk in _iter_chunks(conn, cipher, chunk_size):
+            rows = [(item_id, title) for item_id, title, _ in chunk]
+            in_flight.append((rows, executor.submit(analyze_passwords, [row[2] for row in chunk])))
+            while len(in_flight) >= 2 * workers:
+                rows, future = in_flight.popleft()
+                yield rows, future.result()
+        while in_flight:
+            rows, future = in_flight.popleft()
+            yield rows, future.result()
+
+
+def audit_vault(conn, cipher, breach_path=None, workers=None,
+                chunk_size=AUDIT_CHUNK_SIZE, progress=None):
+    """
+    保管庫全体を監査し、AuditEntry のリスト（アイテム id 順）を返す。
+    progress を渡すと、チャンクごとに progress(調べた件数) を呼ぶ。
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    rows = []        # (item_id, title, entropy, digest, skeleton, breached)
+    by_digest = Counter()
+    by_skeleton = Counter()
+    done = 0
+    for chunk, results in _analyzed_chunks(conn, cipher, breach_path, workers, chunk_size):
+        for row, (digest, entropy, key, breached) in zip(chunk, results):
+            rows.append((row[0], row[1], entropy, digest, key, breached))
+            by_digest[digest] += 1
+            if key is not None:
+                by_skeleton[key] += 1
+        done += len(chunk)
+        if progress:
+            progress(done)
+
+    # 類似の件数は「正規化すると同じ」件数から「完全に同じ」件数を引いたもの
+    # （同じパスワードは必ず同じ正規化キーになる）
+    entries = []
+    for item_id, title, entropy, digest, key, breached in rows:
+        same = by_digest[digest]
+        entries.append(AuditEntry(
+            item_id, title, round(entropy, 1), strength_level(entropy),
+            same - 1, by_skeleton[key] - same if key is not None else 0, breached
+        ))
+    return entries
+
+
+# ---------- 並べ替えと集計 ----------
+
+SORT_KEYS = {
+    # 漏洩 → 使い回し → 類似 → 弱い順（対処すべきものが先頭）
+    "risk": lambda e: (-(e.breached > 0), -e.reused, -e.similar, e.entropy),
+    "strength": lambda e: e.entropy,
+    "reused": lambda e: -e.reused,
+    "similar": lambda e: -e.similar,
+    "breached": lambda e: -e.breached,
+    "title": lambda e: (e.title or "").lower(),
+}
+
+
+def sort_report(entries, key="risk"):
+    return sorted(entries, key=SORT_KEYS[key])
+
+
+def summarize(entries):
+    return {
+        "items": len(entries),
+        "weak": sum(1 for e in entries if e.strength <= WEAK_LEVEL),
+        "reused": sum(1 for e in entries if e.reused),
+        "similar": sum(1 for e in entries if e.similar),
+        "breached": sum(1 for e in entries if e.breached),
+    }
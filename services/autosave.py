@@ -0,0 +1,104 @@
+import threading
+
+from services import item_service
+from services.item_service import ItemConflictError
+
+
+# ========== 詳細フォームの自動保存 ==========
+#
+# キー入力ごとに UPDATE せず、変更された列をアイテムごとにためておき（後書き）、
+# まとめて書き込む。同じ列への連続した変更は最後の値だけが残る。
+# flush() はたまっている全アイテムを1トランザクションで書き込み、
+# 1アイテムあたり変更された列だけの UPDATE 1文になる。
+# いつ flush するか（入力が止まったとき・アイテム切替・終了時）は呼び出し側が決める。
+#
+# password / notes は edit() の時点で暗号化してためるので、バッファに平文の秘密情報は
+# 残らず、ロックされた後でも鍵なしで書き込める。
+#
+# 書き込みは編集を始めたときの版（Item.version）を条件にするので、その間に別の
+# ウィンドウや CLI が同じアイテムを更新していれば、上書きせずに衝突として返す。
+# 衝突したアイテムの変更は resolve() で上書きするか捨てるまでバッファに残る。
+
+
+class AutosaveBuffer:
+    def __init__(self, vault):
+        self.vault = vault
+        self._lock = threading.Lock()
+        # item_id -> [編集を始めたときの版, {列: 値（暗号化済み）}]
+        self._pending = {}
+
+    def edit(self, item_id, version, field, value, cipher):
+        """item_id の field が value に変わったことを記録する（まだ書き込まない）"""
+        if field in item_service.ENCRYPTED_FIELDS:
+            row_uuid = self.vault.item_uuid(item_id)
+            if row_uuid is None:
+                # 削除済みのアイテムへの変更は捨てる（flush と同じ）
+                return
+            value = cipher.encrypt_text(value, field, row_uuid)
+        with self._lock:
+            entry = self._pending.setdefault(item_id, [version, {}])
+            entry[1][field] = value
+
+    def is_dirty(self, item_id=None):
+        with self._lock:
+            return item_id in self._pending if item_id is not None else bool(self._pending)
+
+    def flush(self):
+        """
+        たまっている変更を1トランザクションで書き込み、(saved, conflicts) を返す。
+        saved は {item_id: (新しい版, 書き込んだ {列: 値}（password / notes は暗号文）)}、
+        conflicts は別の場所で更新されていたアイテムの id のリスト。
+        削除済みのアイテムへの変更は捨てる。
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        saved, conflicts = {}, []
+        try:
+            with self.vault.transaction() as conn:
+                for item_id, (version, fields) in pending.items():
+                    try:
+                        updated = item_service.update_item(conn, item_id, fields, version)
+                    except ItemConflictError:
+                        # 条件付き UPDATE は何も書き換えていないので、ほかのアイテムは続けてよい
+                        conflicts.append(item_id)
+                        continue
+                    if updated:
+                        saved[item_id] = (version + 1, fields)
+        except BaseException:
+            # 書き込めなかった変更は捨てずに戻す
+            self._requeue(pending)
+            raise
+        self._requeue({item_id: pending[item_id] for item_id in conflicts})
+        return saved, conflicts
+
+    def _requeue(self, entries):
+        with self._lock:
+            for item_id, (version, fields) in entries.items():
+                entry = self._pending.setdefault(item_id, [version, {}])
+                # 戻す間に新しい編集があれば、そちらを優先する
+                entry[1] = {**fields, **entry[1]}
+
+    def resolve(self, item_id, overwrite):
+        """
+        衝突したアイテムの変更を、overwrite なら現在の版に対して書き込めるようにし
+        （次の flush で上書きする）、そうでなければ捨てる。
+        """
+        with self._lock:
+            if item_id not in self._pending:
+                return
+            if not overwrite:
+                del self._pending[item_id]
+                return
+        current = self.vault.get_item(item_id)
+        with self._lock:
+            if current is None:
+                self._pending.pop(item_id, None)
+            elif item_id in self._pending:
+                self._pending[item_id][0] = current.version
+
+    def discard(self, item_id=None):
+        with self._lock:
+            if item_id is None:
+                self._pending.clear()
+            else:
+                self._pending.pop(item_id, None)
@@ -0,0 +1,448 @@
+import argparse
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+
+from services.crypto import DecryptionError
+from services.connection import triggers_suspended
+from services.folder_service import rebuild_folder_closure, rebuild_folder_stats
+from services.item_service import (
+    ENCRYPTED_FIELDS, encrypt_pending_rows, is_pending_value, mark_pending_rows
+)
+from services.migrations import mark_sync_clone
+from services.search_service import FTS_TRIGGERS, rebuild_fts_index
+
+
+# ========== 暗号化エクスポート／バックアップ ==========
+#
+# folders / items を JSON Lines にして一定量ずつ zlib で圧縮し、
+# データ鍵の FieldCipher で暗号化したチャンクとして書き出す。
+# 行はカーソルから1行ずつ読むので、件数が多くてもメモリ使用量は一定。
+#
+#   ファイル形式:
+#     MAGIC | ヘッダ長(4) | ヘッダ JSON | { チャンク長(4) | 暗号化チャンク }*
+#
+# 各チャンクの aad にはヘッダのハッシュ・チャンク番号・最終フラグを入れるので、
+# チャンクの入れ替え・削除・ファイル末尾の切り詰めは復号時に検出できる。
+#
+# 差分バックアップは change_seq（マイグレーション 6 でトリガが維持する通し番号）
+# が前回のバックアップより大きい行と、その間に削除された行（tombstones）だけを書く。
+#
+# password / notes は DB に保存されている暗号文のまま書き出すため、
+# 復元先は同じデータ鍵を持つ保管庫（元の保管庫かその複製）に限られる。
+
+MAGIC = b"PMBACKUP\x01"
+FORMAT_VERSION = 1
+# 圧縮前のチャンクの目安サイズ
+CHUNK_SIZE = 256 * 1024
+# オンラインバックアップで1回にコピーするページ数と、その合間に休む秒数
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+
+# uuid は端末間の同期（services.sync_service）で行を見分けるためのもの。
+# 導入前のアーカイブには無いので、復元では無ければ今の値を残す
+FOLDER_COLUMNS = ("id", "parent_id", "name", "uuid")
+ITEM_COLUMNS = ("id", "folder_id", "title", "username", "password", "url", "notes", "uuid")
+
+_LENGTH = struct.Struct(">I")
+
+
+class BackupFormatError(ValueError):
+    pass
+
+
+# ---------- 値の変換 ----------
+
+def encode_value(value):
+    # BLOB（暗号化済みのフィールドと uuid）は JSON に載せるため base64 にする
+    if isinstance(value, (bytes, memoryview)):
+        return {"b64": base64.b64encode(bytes(value)).decode("ascii")}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value["b64"])
+    return value
+
+
+def _chunk_aad(header_digest, index, final):
+    return b"pm-backup" + header_digest + index.to_bytes(8, "big") + (b"\x01" if final else b"\x00")
+
+
+# ---------- 書き出し ----------
+
+class ChunkWriter:
+    """JSON Lines をためて、CHUNK_SIZE ごとに圧縮・暗号化して書き出す"""
+
+    def __init__(self, fp, cipher, header_digest):
+        self.fp = fp
+        self.cipher = cipher
+        self.header_digest = header_digest
+        self.index = 0
+        self.buf = []
+        self.size = 0
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self.buf.append(line)
+        self.size += len(line)
+        if self.size >= CHUNK_SIZE:
+            self._flush(final=False)
+
+    def _flush(self, final):
+        data = zlib.compress(b"".join(self.buf), 6)
+        blob = self.cipher.encrypt(data, _chunk_aad(self.header_digest, self.index, final))
+        self.fp.write(_LENGTH.pack(len(blob)))
+        self.fp.write(blob)
+        self.index += 1
+        self.buf.clear()
+        self.size = 0
+
+    def close(self):
+        # 空でも最終チャンクは必ず書く（切り詰めの検出に使う）
+        self._flush(final=True)
+
+
+def write_header(fp, header):
+    """MAGIC とヘッダ（format と created を足したもの）を書き、チャンクの aad に使う値を返す"""
+    header_bytes = json.dumps(
+        {"format": FORMAT_VERSION, **header, "created": int(time.time())}
+    ).encode("utf-8")
+    fp.write(MAGIC)
+    fp.write(_LENGTH.pack(len(header_bytes)))
+    fp.write(header_bytes)
+    return hashlib.sha256(header_bytes).digest()[:16]
+
+
+def get_change_seq(conn):
+    return conn.execute("SELECT seq FROM change_counter WHERE id = 1").fetchone()[0]
+
+
+def last_backup_seq(conn):
+    """前回のバックアップが含む最新の change_seq。バックアップが無ければ None"""
+    return conn.execute("SELECT MAX(until_seq) FROM backups").fetchone()[0]
+
+
+def export_archive(conn, path, cipher, incremental=False, progress=None):
+    """
+    保管庫を path に暗号化して書き出し、
+    {"kind", "since", "until", "folders", "items", "deletes"} を返す。
+
+    incremental : True なら前回のバックアップ以降に変わった行だけを書く
+                  （バックアップが1度も無ければ完全バックアップになる）
+    progress    : 書き出した行数を引数に、チャンクを書くたびに呼ばれる
+
+    読み出しは1つの読み取りトランザクションで行うので、WAL モードでは
+    書き出し中に GUI から書き込まれても、開始時点の一貫した内容になる。
+    ファイルは一時ファイルに書いてから置き換えるので、途中で失敗しても壊れた
+    バックアップは残らない。
+    """
+    since = last_backup_seq(conn) if incremental else None
+    kind = "incremental" if since is not None else "full"
+    since = since or 0
+    counts = {"folders": 0, "items": 0, "deletes": 0}
+    tmp_path = path + ".tmp"
+
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        until = get_change_seq(conn)
+        header = {"kind": kind, "since": since, "until": until}
+
+        with open(tmp_path, "wb") as fp:
+            writer = ChunkWriter(fp, cipher, write_header(fp, header))
+            chunks = 0
+
+            def emit(record, key):
+                nonlocal chunks
+                writer.write(record)
+                counts[key] += 1
+                if progress is not None and writer.index != chunks:
+                    chunks = writer.index
+                    progress(sum(counts.values()))
+
+            # 親フォルダが先に復元されるよう、フォルダ → アイテム → 削除の順に書く
+            cur = conn.execute(
+                f"SELECT {', '.join(FOLDER_COLUMNS)} FROM folders WHERE change_seq > ? ORDER BY id",
+                (since,)
+            )
+            for row in cur:
+                record = {c: encode_value(v) for c, v in zip(FOLDER_COLUMNS, row)}
+                emit({"t": "folder", **record}, "folders")
+
+            cur = conn.execute(
+                f"SELECT {', '.join(ITEM_COLUMNS)} FROM items WHERE change_seq > ? ORDER BY id",
+                (since,)
+            )
+            for row in cur:
+                record = {c: encode_value(v) for c, v in zip(ITEM_COLUMNS, row)}
+                emit({"t": "item", **record}, "items")
+
+            if kind == "incremental":
+                cur = conn.execute(
+                    "SELECT entity, row_id FROM tombstones WHERE change_seq > ? ORDER BY change_seq",
+                    (since,)
+                )
+                for entity, row_id in cur:
+                    emit({"t": "delete", "entity": entity, "id": row_id}, "deletes")
+
+            writer.close()
+            fp.flush()
+            os.fsync(fp.fileno())
+    except BaseException:
+        conn.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    conn.rollback()
+
+    os.replace(tmp_path, path)
+    with conn:
+        conn.execute(
+            "INSERT INTO backups (path, kind, since_seq, until_seq) VALUES (?, ?, ?, ?)",
+            (os.path.abspath(path), kind, since, until)
+        )
+    return {"kind": kind, "since": since, "until": until, **counts}
+
+
+# ---------- 読み込み・復元 ----------
+
+def read_header(fp):
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise BackupFormatError("バックアップファイルではありません")
+    raw = fp.read(_LENGTH.size)
+    if len(raw) != _LENGTH.size:
+        raise BackupFormatError("バックアップファイルが途中で切れています")
+    header_bytes = fp.read(_LENGTH.unpack(raw)[0])
+    try:
+        header = json.loads(header_bytes)
+    except ValueError as e:
+        raise BackupFormatError("バックアップのヘッダが不正です") from e
+    if header.get("format") != FORMAT_VERSION:
+        raise BackupFormatError(f"未対応のバックアップ形式です: {header.get('format')}")
+    return header, hashlib.sha256(header_bytes).digest()[:16]
+
+
+def iter_records(fp, cipher, header_digest):
+    """チャンクを1つずつ復号して、レコード（dict）を順に返す"""
+    index = 0
+    while True:
+        raw = fp.read(_LENGTH.size)
+        if len(raw) != _LENGTH.size:
+            raise BackupFormatError("バックアップファイルが途中で切れています")
+        blob = fp.read(_LENGTH.unpack(raw)[0])
+        # 最終チャンクかどうかは aad で区別する（どちらでも合わなければ改ざん）
+        try:
+            data = cipher.decrypt(blob, _chunk_aad(header_digest, index, False))
+            final = False
+        except DecryptionError:
+            data = cipher.decrypt(blob, _chunk_aad(header_digest, index, True))
+            final = True
+        for line in zlib.decompress(data).splitlines():
+            yield json.loads(line)
+        if final:
+            return
+        index += 1
+
+
+# 種類ごとに (テーブル, 列, 無い id の行を入れる SQL, 既にある id の行を上書きする SQL)。
+# UPSERT（ON CONFLICT DO UPDATE）にしないのは、その更新で動くトリガの中の
+# INSERT OR REPLACE が ABORT として扱われ、同期の変更ログへの記録が失敗するため
+_RESTORE_SQL = {
+    "folder": (
+        "folders", FOLDER_COLUMNS,
+        "INSERT INTO folders (id, parent_id, name, uuid) VALUES (?, ?, ?, ?)",
+        "UPDATE folders SET parent_id = ?, name = ?, uuid = COALESCE(?, uuid) WHERE id = ?",
+    ),
+    "item": (
+        "items", ITEM_COLUMNS,
+        "INSERT INTO items (id, folder_id, title, username, password, url, notes, uuid) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        # update_item と同じく版を進め、復元前に読んだ版での自動保存を衝突させる
+        "UPDATE items SET folder_id = ?, title = ?, username = ?, password = ?, "
+        "url = ?, notes = ?, uuid = COALESCE(?, uuid), version = version + 1 WHERE id = ?",
+    ),
+}
+RESTORE_BATCH_SIZE = 5000
+# 復元するアイテムの行のうち、password / notes の位置
+_ENCRYPTED_INDEXES = tuple(ITEM_COLUMNS.index(field) for field in ENCRYPTED_FIELDS)
+
+
+def restore_archive(conn, path, cipher, progress=None):
+    """
+    path のバックアップを conn の保管庫に適用し、
+    {"kind", "folders", "items", "deletes"} を返す。
+
+    完全バックアップは空の保管庫に、差分バックアップはその後に順に適用する。
+    行は id ごとに上書きし、全体を1トランザクションで行う。
+    完全バックアップでは全文検索の索引を行ごとに更新せず、最後にまとめて作り直す。
+    フォルダの閉包テーブルとアイテム数も最後に作り直す。
+    鍵が違う・改ざんされている場合は DecryptionError で、何も書き込まれない。
+    """
+    counts = {"folders": 0, "items": 0, "deletes": 0}
+    batch = []
+    batch_kind = None
+    # 行の uuid に結び付ける前の形式で書き出されたアーカイブか
+    pending = False
+
+    def flush():
+        # 同じ種類のレコードが続く間はまとめて executemany する
+        # （アーカイブ内の順序は種類の切り替わりで保たれる）
+        if batch_kind == "delete":
+            for entity in ("items", "folders"):
+                conn.executemany(
+                    f"DELETE FROM {entity} WHERE id = ?",
+                    [(row_id,) for e, row_id in batch if e == entity]
+                )
+        elif batch:
+            table, _, insert_sql, update_sql = _RESTORE_SQL[batch_kind]
+            existing = {row_id for row_id, in conn.execute(
+                f"SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps([row[0] for row in batch]),)
+            )}
+            conn.executemany(
+                update_sql, [(*row[1:], row[0]) for row in batch if row[0] in existing]
+            )
+            conn.executemany(insert_sql, [row for row in batch if row[0] not in existing])
+        batch.clear()
+        if progress is not None:
+            progress(sum(counts.values()))
+
+    with open(path, "rb") as fp:
+        header, digest = read_header(fp)
+        conn.commit()
+        # トリガの削除も同じトランザクションに含めるため、明示的に開始する
+        conn.execute("BEGIN")
+        with conn, contextlib.ExitStack() as stack:
+            if header["kind"] == "full":
+                stack.enter_context(triggers_suspended(conn, FTS_TRIGGERS))
+            for record in iter_records(fp, cipher, digest):
+                kind = record["t"]
+                if kind != batch_kind or len(batch) >= RESTORE_BATCH_SIZE:
+                    flush()
+                    batch_kind = kind
+                if kind in _RESTORE_SQL:
+                    columns = _RESTORE_SQL[kind][1]
+                    row = tuple(decode_value(record.get(c)) for c in columns)
+                    if kind == "item" and not pending:
+                        pending = any(is_pending_value(row[i]) for i in _ENCRYPTED_INDEXES)
+                    batch.append(row)
+                    counts[kind + "s"] += 1
+                elif kind == "delete" and record["entity"] in ("folders", "items"):
+                    batch.append((record["entity"], record["id"]))
+                    counts["deletes"] += 1
+                else:
+                    raise BackupFormatError(f"不明なレコードです: {kind}")
+            flush()
+            if header["kind"] == "full":
+                rebuild_fts_index(conn)
+            # 子が親より先に入ると閉包テーブルのトリガでは祖先を拾えないので作り直し、
+            # それを元に増減していたアイテム数も数え直す
+            if counts["folders"]:
+                rebuild_folder_closure(conn)
+                rebuild_folder_stats(conn)
+            if pending:
+                mark_pending_rows(conn)
+    # 行の uuid に結び付ける前の形式で書き出されたアーカイブなら、ここで変換する
+    encrypt_pending_rows(conn, cipher)
+    return {"kind": header["kind"], **counts}
+
+
+# ========== DB ファイルのホットバックアップ ==========
+
+def hot_backup(src_path, dest_path, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, progress=None):
+    """
+    SQLite のオンラインバックアップ API で src_path を dest_path に複製する。
+    pages ページごとに sleep 秒休むので、その間は他の接続が読み書きできる。
+    （コピー中に別の接続が書き込むと、SQLite はコピーをやり直す）
+    progress(残りページ数, 総ページ数) を各ステップ後に呼ぶ。
+    複製は同期では複製元とは別の端末になる（migrations.mark_sync_clone）。
+
+    共有接続を長く占有しないよう、専用の接続を開いて閉じる。
+    """
+    tmp_path = dest_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    src = sqlite3.connect(src_path)
+    try:
+        dest = sqlite3.connect(tmp_path)
+        try:
+            src.backup(
+                dest, pages=pages, sleep=sleep,
+                progress=(lambda status, remaining, total: progress(remaining, total))
+                if progress is not None else None
+            )
+            # 複製は1ファイルで完結させる（-wal を伴わない）
+            dest.execute("PRAGMA journal_mode = DELETE")
+            mark_sync_clone(dest)
+        finally:
+            dest.close()
+    finally:
+        src.close()
+    os.replace(tmp_path, dest_path)
+
+
+# ========== コマンドライン ==========
+
+def open_cipher(conn, password):
+    from services.crypto import FieldCipher
+    from services.vault_key import open_vault
+
+    data_key = open_vault(conn, password)
+    if data_key is None:
+        raise SystemExit("マスターパスワードが違います")
+    return FieldCipher(data_key)
+
+
+def main(argv=None):
+    """
+    python -m services.backup [--db DB] export PATH [--incremental]
+    python -m services.backup [--db DB] restore PATH
+    python -m services.backup [--db DB] copy PATH
+    マスターパスワードは環境変数 PM_MASTER_PASSWORD か標準入力から読む。
+    """
+    from services.connection import get_connection
+    from services.migrations import migrate
+
+    parser = argparse.ArgumentParser(prog="python -m services.backup")
+    parser.add_argument("--db", default="password_manager.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="暗号化アーカイブを書き出す")
+    p.add_argument("path")
+    p.add_argument("--incremental", action="store_true", help="前回以降の変更だけを書く")
+    p = sub.add_parser("restore", help="暗号化アーカイブを適用する")
+    p.add_argument("path")
+    p = sub.add_parser("copy", help="DB ファイルをオンラインバックアップで複製する")
+    p.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "copy":
+        hot_backup(args.db, args.path)
+        print(f"{args.db} -> {args.path}")
+        return 0
+
+    conn = get_connection(args.db)
+    migrate(conn)
+    password = os.environ.get("PM_MASTER_PASSWORD")
+    if password is None:
+        password = sys.stdin.readline().rstrip("\n")
+    cipher = open_cipher(conn, password)
+
+    if args.command == "export":
+        result = export_archive(conn, args.path, cipher, incremental=args.incremental)
+    else:
+        result = restore_archive(conn, args.path, cipher)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import atexit
+import contextlib
+import sqlite3
+import threading
+
+from services import diagnostics
+
+
+# ========== 共有コネクション ==========
+#
+# 呼び出しごとに sqlite3.connect() するとフォルダ切替のたびに
+# 接続確立とスキーマ解析が走るため、スレッドごと・DB パスごとに
+# 1本の接続を使い回す。SQLite の接続はスレッドをまたげないので
+# スレッドローカルに保持し、プロセス終了時にまとめて閉じる。
+
+# プリペアドステートメントのキャッシュ数（sqlite3 標準は 128）
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),        # 約 16MB（負数は KiB 単位）
+    ("mmap_size", 64 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    # 宣言済みの ON DELETE CASCADE を有効にする（接続ごとの設定）
+    ("foreign_keys", "ON"),
+)
+
+_local = threading.local()
+_lock = threading.Lock()
+_all_connections = []
+
+
+def _open(path):
+    conn = sqlite3.connect(
+        path,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # PM_DIAGNOSTICS が設定されていれば文ごとの時間を測る接続になる
+        factory=diagnostics.connection_factory(),
+    )
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_connection(path):
+    """
+    path に対応する共有コネクションを返す。
+    同じスレッドから呼ばれる限り同じ接続が返るので、呼び出し側で close() しないこと。
+    トランザクションは `with conn:` で囲めば commit / rollback される。
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(path)
+    if conn is None:
+        conn = _open(path)
+        conns[path] = conn
+        with _lock:
+            _all_connections.append(conn)
+    return conn
+
+
+def close_connection(path):
+    """現在のスレッドが持つ path の接続を閉じる（テストやファイル差し替え用）"""
+    conns = getattr(_local, "conns", None) or {}
+    conn = conns.pop(path, None)
+    if conn is not None:
+        with _lock:
+            if conn in _all_connections:
+                _all_connections.remove(conn)
+        conn.close()
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        conns = list(_all_connections)
+        _all_connections.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            # 別スレッドで作られた接続は閉じられないが、プロセス終了時に解放される
+            pass
+
+
+# ========== トリガの一時停止 ==========
+
+@contextlib.contextmanager
+def triggers_suspended(conn, name_pattern):
+    """
+    with 文の間だけ、名前が name_pattern（GLOB）に合うトリガを外す。
+    大量の行を書き込むとき、行ごとのトリガの代わりに最後にまとめて直すために使う
+    （外している間に飛ばした更新は呼び出し側で直すこと）。
+    定義は sqlite_master から読んで戻すので、スキーマの変更に追従する。
+    トランザクションの中で使うこと（途中で失敗すればトリガの削除も取り消される）。
+
+    DROP / CREATE TRIGGER はスキーマの変更なので schema cookie が進み、
+    この DB を開いている他の接続はキャッシュしたステートメントを次の実行時に準備し直す。
+    """
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name GLOB ?",
+        (name_pattern,)
+    ).fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    yield
+    for _, sql in triggers:
+        conn.execute(sql)
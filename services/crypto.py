@@ -0,0 +1,140 @@
+import hashlib
+import hmac
+import os
+
+
+# ========== フィールド暗号化 ==========
+#
+# items.password / items.notes を認証付き暗号で保存する。
+# 外部ライブラリに依存しないよう、標準ライブラリの鍵付き BLAKE2b だけで組む。
+#
+#   鍵ストリーム : BLAKE2b(鍵=enc_key, salt=nonce, データ=ブロック番号) のカウンタモード
+#   改ざん検出   : BLAKE2b(鍵=mac_key, データ=版|nonce|aad長|aad|暗号文) の 16 バイト
+#   形式         : 版(1) | nonce(16) | 暗号文 | tag(16)
+#
+# enc_key / mac_key は 32 バイトのデータ鍵から person を変えて導出する。
+# データ鍵はマスターパスワードの導出鍵（kdf.unlock）で同じ方式で包んで保存する。
+#
+# 行のフィールド（encrypt_text）は ROW_VERSION で、aad に列名と行の uuid を含める。
+# 別の行や別の列へ暗号文を貼り替えると復号できない。
+# uuid は端末をまたいで変わらないので、同期やバックアップで運んだ暗号文もそのまま読める。
+# 列名だけを aad にしていた旧形式（VERSION）の行は、解錠時に
+# item_service.encrypt_pending_rows が ROW_VERSION に変換する。
+
+# encrypt() / decrypt() の形式（データ鍵の包み、バックアップのチャンク）と、旧形式の行
+VERSION = b"\x01"
+# 行に結び付けたフィールド
+ROW_VERSION = b"\x02"
+NONCE_LENGTH = 16
+TAG_LENGTH = 16
+KEY_LENGTH = 32
+BLOCK = 64
+
+
+class DecryptionError(ValueError):
+    pass
+
+
+def new_data_key():
+    return os.urandom(KEY_LENGTH)
+
+
+def _subkey(key, purpose):
+    return hashlib.blake2b(key=key, person=purpose, digest_size=32).digest()
+
+
+class FieldCipher:
+    """データ鍵1つに対応する暗号器。サブ鍵の導出は生成時に1度だけ行う"""
+
+    def __init__(self, key):
+        if len(key) != KEY_LENGTH:
+            raise ValueError("鍵の長さが不正です")
+        self._enc_key = _subkey(key, b"pm-field-enc")
+        self._mac_key = _subkey(key, b"pm-field-mac")
+
+    def _keystream(self, nonce, length):
+        blocks = []
+        for counter in range((length + BLOCK - 1) // BLOCK):
+            blocks.append(hashlib.blake2b(
+                counter.to_bytes(8, "little"), key=self._enc_key, salt=nonce
+            ).digest())
+        return b"".join(blocks)[:length]
+
+    def _tag(self, version, nonce, aad, ciphertext):
+        mac = hashlib.blake2b(key=self._mac_key, digest_size=TAG_LENGTH)
+        mac.update(version)
+        mac.update(nonce)
+        mac.update(len(aad).to_bytes(8, "little"))
+        mac.update(aad)
+        mac.update(ciphertext)
+        return mac.digest()
+
+    @staticmethod
+    def _xor(data, stream):
+        n = len(data)
+        return (int.from_bytes(data, "little") ^ int.from_bytes(stream, "little")).to_bytes(n, "little")
+
+    def _seal(self, version, plaintext, aad):
+        nonce = os.urandom(NONCE_LENGTH)
+        ciphertext = self._xor(plaintext, self._keystream(nonce, len(plaintext)))
+        return version + nonce + ciphertext + self._tag(version, nonce, aad, ciphertext)
+
+    def _open(self, version, blob, aad):
+        if len(blob) < 1 + NONCE_LENGTH + TAG_LENGTH or blob[:1] != version:
+            raise DecryptionError("暗号文の形式が不正です")
+        nonce = blob[1:1 + NONCE_LENGTH]
+        ciphertext = blob[1 + NONCE_LENGTH:-TAG_LENGTH]
+        if not hmac.compare_digest(self._tag(version, nonce, aad, ciphertext), blob[-TAG_LENGTH:]):
+            raise DecryptionError("暗号文が改ざんされているか、鍵が違います")
+        return self._xor(ciphertext, self._keystream(nonce, len(ciphertext)))
+
+    def encrypt(self, plaintext, aad=b""):
+        return self._seal(VERSION, plaintext, aad)
+
+    def decrypt(self, blob, aad=b""):
+        return self._open(VERSION, blob, aad)
+
+    # ---------- 文字列フィールド ----------
+
+    @staticmethod
+    def _row_aad(field, row_uuid):
+        if row_uuid is None:
+            raise ValueError("行の uuid が必要です")
+        # 列名に NUL は含まれず、uuid は固定長なので区切りが曖昧にならない
+        return field.encode("ascii") + b"\x00" + bytes(row_uuid)
+
+    def encrypt_text(self, text, field, row_uuid):
+        """text を row_uuid の行の field 用に暗号化して BLOB を返す。None はそのまま None"""
+        if text is None:
+            return None
+        return self._seal(ROW_VERSION, text.encode("utf-8"), self._row_aad(field, row_uuid))
+
+    def decrypt_text(self, value, field, row_uuid):
+        """
+        encrypt_text の逆。None はそのまま返す。
+        移行前の平文（str）が残っていればそのまま返す。
+        旧形式の暗号文は行に結び付いていないので受け付けない（DecryptionError）。
+        """
+        if value is None or isinstance(value, str):
+            return value
+        return self._open(ROW_VERSION, bytes(value), self._row_aad(field, row_uuid)).decode("utf-8")
+
+    def rebind_text(self, value, field, row_uuid):
+        """
+        旧形式（列名だけを aad にした VERSION）の暗号文を復号し、
+        row_uuid の行に結び付けて暗号化し直す。平文（str）はそのまま暗号化する。
+        """
+        if isinstance(value, str):
+            return self.encrypt_text(value, field, row_uuid)
+        text = self._open(VERSION, bytes(value), field.encode("ascii")).decode("utf-8")
+        return self.encrypt_text(text, field, row_uuid)
+
+
+# ========== データ鍵の包み／取り出し ==========
+
+def wrap_key(kek, data_key):
+    return FieldCipher(kek).encrypt(data_key, b"data-key")
+
+
+def unwrap_key(kek, wrapped):
+    return FieldCipher(kek).decrypt(bytes(wrapped), b"data-key")
@@ -0,0 +1,359 @@
+import argparse
+import atexit
+import bisect
+import datetime
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+# ========== 診断用の計測 ==========
+#
+# 「動作が重い」と言われたときに、どこで時間を使っているかを調べるための計測。
+# 環境変数 PM_DIAGNOSTICS を設定して起動したときだけ有効になり、
+# 無効なときは接続もメソッドも元のまま（計測の処理は一切通らない）。
+#   PM_DIAGNOSTICS=1            計測する（GUI では Ctrl+Shift+D の診断パネルで見る）
+#   PM_DIAGNOSTICS=diag.json    計測し、終了時に diag.json へ書き出す
+#   PM_SLOW_QUERY_MS=50         これ以上かかった文を実行計画つきで記録する
+#
+# 記録するもの:
+#   - SQL 文ごとの回数と所要時間の分布（p50 / p95 / p99）。execute / executemany の
+#     呼び出しを測るので、SELECT は最初の行が返るまでの時間になる
+#     （残りの読み出しは、呼び出し元の vault.* の時間に含まれる）
+#   - その文の間に SQLite が実行した文の数（set_trace_callback で数える）。
+#     トリガの中の文も1つずつ数えられるので、回数より大きければトリガで膨らんでいる
+#   - Repository の各メソッド（vault.*）・GUI のスロット（ui.*）・
+#     ワーカーへの要求から結果が届くまで（worker.*）の所要時間の分布
+#   - 遅い文とその EXPLAIN QUERY PLAN
+#   - GUI のイベントループが止まった時間と、その間に動いていたスロット
+#
+# 文は ? のままのテキストで集計し、バインドした値は記録しない（保管庫の中身が
+# 書き出しファイルに残らないように）。トレースコールバックに渡される文は値が
+# 展開済みなので、数えるだけで本文は保持しない。
+
+ENV_VAR = "PM_DIAGNOSTICS"
+SLOW_QUERY_ENV_VAR = "PM_SLOW_QUERY_MS"
+DEFAULT_SLOW_QUERY_MS = 50.0
+# イベントループがこれ以上止まったら記録する
+STALL_MS = 100
+# 遅い文・停止の記録は直近のこれだけを残す
+SLOW_LOG_SIZE = 200
+STALL_LOG_SIZE = 200
+# 停止の原因を探すために、スレッドごとに直近の呼び出しをこれだけ覚えておく
+RECENT_SPANS = 64
+
+_setting = os.environ.get(ENV_VAR, "")
+enabled = _setting not in ("", "0")
+# "1" 以外の値は終了時の書き出し先
+dump_path = _setting if enabled and _setting != "1" else None
+
+
+class LatencyHistogram:
+    """
+    所要時間（ミリ秒）を対数目盛りのバケツで数える。
+    サンプルを溜めないので、回数が増えてもメモリは一定。
+    パーセンタイルはバケツの上限で返す（誤差は 25% 以内）。
+    """
+
+    # 0.01 ms から 1.25 倍ずつ、約 60 秒まで
+    BOUNDS = tuple(0.01 * 1.25 ** k for k in range(71))
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                break
+        # 最後のバケツ（上限なし）と、最大値より大きい上限は最大値で返す
+        return min(self.BOUNDS[i], self.max_ms) if i < len(self.BOUNDS) else self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+        }
+
+
+def _normalize(sql):
+    """改行・インデントの違いで別の文として数えないように空白を詰める"""
+    return " ".join(sql.split())
+
+
+def explain(conn, sql, parameters=None):
+    """
+    sql の EXPLAIN QUERY PLAN の各行（detail 列）。
+    parameters が無ければ ? の数だけ NULL を渡す（計画は値にほぼ依存しない）。
+    説明できない文なら None。
+    """
+    if parameters is None:
+        parameters = (None,) * sql.count("?")
+    try:
+        # 計測用の execute を通さない
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters)
+        return [row[-1] for row in rows]
+    except sqlite3.Error:
+        return None
+
+
+class Recorder:
+    """計測結果の集計。どのスレッドから呼んでもよい"""
+
+    def __init__(self, slow_query_ms=DEFAULT_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        # トレースコールバックが呼ばれた回数（スレッドごと）
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.statements = {}
+            # 文 -> その文の間に SQLite が実行した文の数
+            self.executed = Counter()
+            self.calls = {}
+            self.slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+            self.stalls = deque(maxlen=STALL_LOG_SIZE)
+            # スレッド id -> 直近の (名前, 開始, 終了)
+            self._recent = {}
+
+    # ---------- 記録 ----------
+
+    def trace_count(self):
+        return getattr(self._local, "count", 0)
+
+    def trace(self, statement):
+        """set_trace_callback に渡すコールバック（値が展開された文を受け取る）"""
+        # 暗黙の BEGIN と実行計画の取得は数えない
+        if statement == "BEGIN " or statement.startswith("EXPLAIN QUERY PLAN "):
+            return
+        self._local.count = self.trace_count() + 1
+
+    def statement_done(self, conn, sql, parameters, started, traced):
+        """
+        TracedConnection から、文を1つ実行し終えるたびに呼ばれる。
+        traced は実行前の trace_count()。
+        """
+        ms = (time.perf_counter() - started) * 1000
+        executed = self.trace_count() - traced
+        sql = _normalize(sql)
+        with self._lock:
+            histogram = self.statements.get(sql)
+            if histogram is None:
+                histogram = self.statements[sql] = LatencyHistogram()
+            histogram.add(ms)
+            self.executed[sql] += executed
+        if ms >= self.slow_query_ms:
+            entry = {
+                "at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "thread": threading.current_thread().name,
+                "ms": ms,
+                "sql": sql,
+                "plan": explain(conn, sql, parameters),
+            }
+            with self._lock:
+                self.slow_queries.append(entry)
+
+    def record_call(self, name, ms):
+        with self._lock:
+            histogram = self.calls.get(name)
+            if histogram is None:
+                histogram = self.calls[name] = LatencyHistogram()
+            histogram.add(ms)
+
+    def span_done(self, name, started, ended):
+        """timed で包んだ関数の呼び出し1回（停止の原因探しのためにスレッドごとに覚える）"""
+        self.record_call(name, (ended - started) * 1000)
+        thread_id = threading.get_ident()
+        with self._lock:
+            recent = self._recent.get(thread_id)
+            if recent is None:
+                recent = self._recent[thread_id] = deque(maxlen=RECENT_SPANS)
+            recent.append((name, started, ended))
+
+    def record_stall(self, started, ended):
+        """
+        呼び出したスレッドが started から ended（perf_counter の値）まで
+        イベントを処理できなかったことを記録する。
+        その間に終わった呼び出しを、長い順に原因の候補として添える。
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            spans = [
+                (name, (end - start) * 1000)
+                for name, start, end in self._recent.get(thread_id, ())
+                if end > started and start < ended
+            ]
+            spans.sort(key=lambda span: span[1], reverse=True)
+            self.stalls.append({
+                "at": datetime.datetime.now().isoformat(timespec="milliseconds"),
+                "ms": (ended - started) * 1000,
+                "calls": [{"name": name, "ms": ms} for name, ms in spans[:5]],
+            })
+
+    # ---------- 書き出し ----------
+
+    def snapshot(self):
+        """JSON にできる dict。文と呼び出しは合計時間の長い順"""
+        def by_total(histograms, key_name):
+            rows = [dict(h.summary(), **{key_name: key}) for key, h in histograms.items()]
+            rows.sort(key=lambda row: row["total_ms"], reverse=True)
+            return rows
+
+        with self._lock:
+            statements = by_total(self.statements, "sql")
+            for row in statements:
+                row["executed"] = self.executed[row["sql"]]
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "elapsed_s": time.time() - self.started,
+                "slow_query_ms": self.slow_query_ms,
+                "statements": statements,
+                "calls": by_total(self.calls, "name"),
+                "slow_queries": list(self.slow_queries),
+                "stalls": list(self.stalls),
+            }
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(self.snapshot(), fp, indent=2, ensure_ascii=False)
+
+
+recorder = Recorder(float(os.environ.get(SLOW_QUERY_ENV_VAR, DEFAULT_SLOW_QUERY_MS)))
+
+if dump_path is not None:
+    atexit.register(recorder.dump, dump_path)
+
+
+# ---------- 計測の差し込み ----------
+
+class TracedConnection(sqlite3.Connection):
+    """execute / executemany の所要時間を recorder に記録する接続（有効なときの factory）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(recorder.trace)
+
+    def execute(self, sql, parameters=()):
+        traced = recorder.trace_count()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            recorder.statement_done(self, sql, parameters, started, traced)
+
+    def executemany(self, sql, seq_of_parameters):
+        traced = recorder.trace_count()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # 行ごとの値は使えない（イテレータは読み終わっている）ので計画は NULL で求める
+            recorder.statement_done(self, sql, None, started, traced)
+
+
+def connection_factory():
+    """sqlite3.connect の factory に渡すクラス"""
+    return TracedConnection if enabled else sqlite3.Connection
+
+
+def timed(name):
+    """
+    関数の所要時間を name で記録するデコレータ。
+    無効なときは関数をそのまま返すので、呼び出しに余分な処理は入らない。
+    """
+    def decorate(fn):
+        if not enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.span_done(name, started, time.perf_counter())
+        return wrapper
+    return decorate
+
+
+def instrument_methods(prefix, exclude=()):
+    """クラスの公開メソッドをすべて timed(prefix + メソッド名) で包むクラスデコレータ"""
+    def decorate(cls):
+        if not enabled:
+            return cls
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude or not inspect.isfunction(attr):
+                continue
+            setattr(cls, name, timed(prefix + name)(attr))
+        return cls
+    return decorate
+
+
+# ========== 書き出したファイルの表示 ==========
+#
+#   python -m services.diagnostics diag.json [--top 20]
+
+def _print_table(title, rows, label):
+    print(title)
+    print(f"  {'回数':>8} {'合計 ms':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'最大':>9}  {label}")
+    for r in rows:
+        print(f"  {r['count']:8d} {r['total_ms']:10.1f} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+              f"{r['p99_ms']:8.2f} {r['max_ms']:9.2f}  {r.get('sql') or r['name']}")
+        if r.get("executed", 0) > r["count"]:
+            print(f"  {'':>8} （SQLite が実行した文 {r['executed']}、トリガを含む）")
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m services.diagnostics")
+    parser.add_argument("path", help=f"{ENV_VAR} で書き出した JSON")
+    parser.add_argument("--top", type=int, default=20, help="表示する文・呼び出しの数")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as fp:
+        data = json.load(fp)
+    print(f"計測開始 {data['started']}（{data['elapsed_s']:.1f} 秒間）\n")
+    _print_table("SQL 文（合計時間の長い順）", data["statements"][:args.top], "文")
+    _print_table("呼び出し（合計時間の長い順）", data["calls"][:args.top], "名前")
+    print(f"{data['slow_query_ms']:g} ms 以上かかった文: {len(data['slow_queries'])} 件")
+    for entry in data["slow_queries"][-args.top:]:
+        print(f"  {entry['at']} [{entry['thread']}] {entry['ms']:.1f} ms  {entry['sql']}")
+        for line in entry["plan"] or ():
+            print(f"      {line}")
+    print(f"\nイベントループの停止: {len(data['stalls'])} 件")
+    for stall in data["stalls"][-args.top:]:
+        calls = ", ".join(f"{c['name']} {c['ms']:.0f} ms" for c in stall["calls"]) or "不明"
+        print(f"  {stall['at']} {stall['ms']:.0f} ms  ({calls})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+import contextlib
+
+from services.connection import triggers_suspended
+
+
+# ========== フォルダ階層 ==========
+#
+# folders テーブル（id, parent_id, name）のメモリ上の写し。
+# 行の並び順に関係なく1パスで親子関係を組み立て、
+# 再読み込み時は前回との差分（追加・名前変更・移動・削除）だけを返す。
+
+
+def load_folder_rows(conn):
+    return conn.execute("SELECT id, parent_id, name FROM folders ORDER BY id").fetchall()
+
+
+def load_folder_rows_with_counts(conn):
+    """
+    load_folder_rows に (直下のアイテム数, 配下を含むアイテム数) を足した行。
+    数は folder_stats（トリガで保っている）から同じクエリで読むので、
+    フォルダごとに COUNT(*) しない。
+    """
+    return conn.execute(
+        "SELECT f.id, f.parent_id, f.name, "
+        "COALESCE(s.item_count, 0), COALESCE(s.total_items, 0) "
+        "FROM folders f LEFT JOIN folder_stats s ON s.folder_id = f.id ORDER BY f.id"
+    ).fetchall()
+
+
+class FolderIndex:
+    def __init__(self, rows=()):
+        self.parents = {}
+        self.names = {}
+        self.children = {}
+        # 子の並び順は行の順（load_folder_rows では id 順）。
+        # 4列目以降（アイテム数など）は使わない
+        for folder_id, parent_id, name, *_ in rows:
+            self.parents[folder_id] = parent_id
+            self.names[folder_id] = name
+            self.children.setdefault(parent_id, []).append(folder_id)
+
+    def __contains__(self, folder_id):
+        return folder_id in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def roots(self):
+        return self.children.get(None, [])
+
+    def children_of(self, folder_id):
+        return self.children.get(folder_id, [])
+
+    def walk(self):
+        """
+        ルートから幅優先で (id, parent_id, name) を返す。
+        親は必ず子より先に出てくる。親が存在しないフォルダや循環は辿らない。
+        """
+        queue = list(self.roots())
+        for folder_id in queue:
+            yield folder_id, self.parents[folder_id], self.names[folder_id]
+            queue.extend(self.children_of(folder_id))
+
+    # ---------- 更新 ----------
+
+    def add(self, folder_id, parent_id, name):
+        self.parents[folder_id] = parent_id
+        self.names[folder_id] = name
+        self.children.setdefault(parent_id, []).append(folder_id)
+
+    def rename(self, folder_id, name):
+        self.names[folder_id] = name
+
+    def move(self, folder_id, new_parent_id):
+        old_parent_id = self.parents[folder_id]
+        self.children[old_parent_id].remove(folder_id)
+        self.parents[folder_id] = new_parent_id
+        self.children.setdefault(new_parent_id, []).append(folder_id)
+
+    def remove(self, folder_id):
+        """folder_id と配下をすべて取り除き、取り除いた id のリストを返す"""
+        removed = [folder_id]
+        for fid in removed:
+            removed.extend(self.children.pop(fid, []))
+        self.children[self.parents[folder_id]].remove(folder_id)
+        for fid in removed:
+            del self.parents[fid]
+            del self.names[fid]
+        return removed
+
+    # ---------- 差分 ----------
+
+    def diff(self, other):
+        """
+        self を other に変えるための操作列を返す。
+        ("add", id, parent_id, name) は親から順に、
+        ("remove", id) は削除される部分木の頂点だけが入る。
+        """
+        ops = []
+
+        for folder_id, parent_id, name in other.walk():
+            if folder_id not in self:
+                ops.append(("add", folder_id, parent_id, name))
+                continue
+            if self.parents[folder_id] != parent_id:
+                ops.append(("move", folder_id, parent_id))
+            if self.names[folder_id] != name:
+                ops.append(("rename", folder_id, name))
+
+        # 削除は最後に行う（消える親の下から別の場所へ移った子を巻き込まないため）
+        for folder_id in self.names:
+            if folder_id not in other:
+                parent_id = self.parents[folder_id]
+                # 親も消えるなら親側の remove にまとめる
+                if parent_id is None or parent_id in other:
+                    ops.append(("remove", folder_id))
+
+        return ops
+
+
+# ========== 追加・名前変更・移動 ==========
+#
+# 書き込み系の関数はコミットしない（Repository.transaction でまとめてコミットする）。
+
+ROOT_FOLDER_NAME = "ルート"
+
+
+def ensure_root_folder(conn, name=ROOT_FOLDER_NAME):
+    """ルートフォルダが無ければ作る。最初のルートの id を返す"""
+    row = conn.execute(
+        "SELECT id FROM folders WHERE parent_id IS NULL ORDER BY id LIMIT 1"
+    ).fetchone()
+    if row is not None:
+        return row[0]
+    return conn.execute(
+        "INSERT INTO folders (parent_id, name) VALUES (NULL, ?)", (name,)
+    ).lastrowid
+
+
+def add_folder(conn, parent_id, name):
+    return conn.execute(
+        "INSERT INTO folders (parent_id, name) VALUES (?, ?)", (parent_id, name)
+    ).lastrowid
+
+
+def rename_folder(conn, folder_id, name):
+    cur = conn.execute("UPDATE folders SET name = ? WHERE id = ?", (name, folder_id))
+    return cur.rowcount > 0
+
+
+def move_folder(conn, folder_id, new_parent_id):
+    """
+    folder_id を new_parent_id の下へ移す。移動先が自分自身か配下なら ValueError。
+    移動したら True（folder_id が無ければ False）。
+
+    循環の判定は閉包テーブルの検索で UPDATE の WHERE に含めるので、移動は1文で済む
+    （フォルダの深さや件数に関係なく、Python 側で木をたどらない）。
+    閉包テーブルの付け替えはトリガが同じ文の中で行う。
+    """
+    cur = conn.execute(
+        f"UPDATE folders SET parent_id = ? WHERE id = ? "
+        f"AND (? IS NULL OR ? NOT IN ({SUBTREE_IDS}))",
+        (new_parent_id, folder_id, new_parent_id, new_parent_id, folder_id)
+    )
+    if cur.rowcount > 0:
+        return True
+    # 更新されなかった理由（フォルダが無いのか、循環なのか）はここで初めて調べる
+    if conn.execute("SELECT 1 FROM folders WHERE id = ?", (folder_id,)).fetchone():
+        raise ValueError("フォルダを自分自身の配下へは移動できません")
+    return False
+
+
+# ========== 部分木の削除 ==========
+
+# 起点フォルダとその子孫すべての id。閉包テーブル（マイグレーション 10、
+# 祖先・子孫の全組をトリガで保っている）の主キーを1回引くだけで済む
+SUBTREE_IDS = "SELECT descendant FROM folder_closure WHERE ancestor = ?"
+
+# 進捗ハンドラを呼ぶ間隔（SQLite VM 命令数）
+PROGRESS_INTERVAL = 20000
+# 配下のアイテムがこれ以上なら、アイテム数のトリガを外してまとめて数を直す
+BULK_STATS_THRESHOLD = 1000
+
+
+def delete_subtree(conn, folder_id, progress=None):
+    """
+    folder_id 以下のフォルダとアイテムを削除し、
+    (削除したフォルダ数, 削除したアイテム数) を返す。コミットは呼び出し側で行う。
+    progress を渡すと削除中に定期的に呼ばれる（進捗の表示用）。
+    書き込みトランザクションの中で呼ばれるので、GUI のイベントループを回したり
+    同じ接続で書き込んだりしないこと。
+    progress が真値を返すと SQLite が処理を中断するので None を返すこと。
+    """
+    if progress is not None:
+        conn.set_progress_handler(progress, PROGRESS_INTERVAL)
+    try:
+        total = count_subtree_items(conn, folder_id)
+        with contextlib.ExitStack() as stack:
+            if total >= BULK_STATS_THRESHOLD:
+                # 1行ごとに祖先の数を減らす代わりに、祖先から合計を1回で引き、
+                # 部分木の数を 0 にしてからトリガなしで消す。
+                # トリガの削除がトランザクションに入るよう、UPDATE を先に流す
+                conn.execute(
+                    "UPDATE folder_stats SET total_items = total_items - ? WHERE folder_id IN "
+                    "(SELECT ancestor FROM folder_closure WHERE descendant = ? AND ancestor != ?)",
+                    (total, folder_id, folder_id)
+                )
+                conn.execute(
+                    "UPDATE folder_stats SET item_count = 0, total_items = 0 "
+                    f"WHERE folder_id IN ({SUBTREE_IDS})",
+                    (folder_id,)
+                )
+                stack.enter_context(triggers_suspended(conn, ITEM_STATS_TRIGGERS))
+            cur = conn.execute(
+                f"DELETE FROM items WHERE folder_id IN ({SUBTREE_IDS})",
+                (folder_id,)
+            )
+            deleted_items = cur.rowcount
+        cur = conn.execute(
+            f"DELETE FROM folders WHERE id IN ({SUBTREE_IDS})",
+            (folder_id,)
+        )
+        deleted_folders = cur.rowcount
+    finally:
+        if progress is not None:
+            conn.set_progress_handler(None, 0)
+    return deleted_folders, deleted_items
+
+
+def vacuum_orphans(conn, compact=False):
+    """
+    ルートから辿れないフォルダ（親が消えたもの・循環）と、
+    存在しないフォルダを指すアイテムを1トランザクションで削除する。
+    (削除したフォルダ数, 削除したアイテム数) を返す。
+    compact=True なら削除後に VACUUM してファイルを縮める。
+    """
+    with conn:
+        cur = conn.execute("""
+            DELETE FROM folders WHERE id NOT IN (
+                WITH RECURSIVE reachable(id) AS (
+                    SELECT id FROM folders WHERE parent_id IS NULL
+                    UNION
+                    SELECT f.id FROM folders f JOIN reachable r ON f.parent_id = r.id
+                )
+                SELECT id FROM reachable
+            )
+        """)
+        deleted_folders = cur.rowcount
+        cur = conn.execute(
+            "DELETE FROM items WHERE folder_id NOT IN (SELECT id FROM folders)"
+        )
+        deleted_items = cur.rowcount
+    if compact:
+        conn.execute("VACUUM")
+    return deleted_folders, deleted_items
+
+
+# ========== 閉包テーブル ==========
+#
+# folder_closure には (祖先, 子孫, 距離) の組をすべて、自分自身も距離 0 で持つ。
+# 部分木の一覧・配下のアイテム数・パンくずは、どれも再帰せずに
+# インデックス1回の検索になる。
+# 追加・移動・削除はトリガ（migrations の 10 と 11）が保つが、親より先に子が入る
+# 復元などでは組が欠けるので、最後に rebuild_folder_closure で作り直す。
+
+# folders から求めた本来の閉包（循環していても止まるよう深さはフォルダ数で打ち切り、
+# 同じ組が複数の距離で現れたら近い方を取る）
+CLOSURE_FROM_FOLDERS = """
+    WITH RECURSIVE closure(ancestor, descendant, depth) AS (
+        SELECT id, id, 0 FROM folders
+        UNION
+        SELECT c.ancestor, f.id, c.depth + 1
+        FROM closure c JOIN folders f ON f.parent_id = c.descendant
+        WHERE c.depth < (SELECT COUNT(*) FROM folders)
+    )
+    SELECT ancestor, descendant, MIN(depth) FROM closure GROUP BY ancestor, descendant
+"""
+
+
+def subtree_folders(conn, folder_id):
+    """folder_id とその子孫の (id, parent_id, name, 距離) を浅い順に返す"""
+    return conn.execute(
+        "SELECT f.id, f.parent_id, f.name, c.depth FROM folder_closure c "
+        "JOIN folders f ON f.id = c.descendant "
+        "WHERE c.ancestor = ? ORDER BY c.depth, f.id",
+        (folder_id,)
+    ).fetchall()
+
+
+def count_subtree_items(conn, folder_id):
+    """folder_id とその子孫のフォルダにあるアイテムの数（folder_stats から読む）"""
+    row = conn.execute(
+        "SELECT total_items FROM folder_stats WHERE folder_id = ?", (folder_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def folder_path(conn, folder_id):
+    """ルートから folder_id までの (id, parent_id, name) を上から順に返す（パンくず用）"""
+    return conn.execute(
+        "SELECT f.id, f.parent_id, f.name FROM folder_closure c "
+        "JOIN folders f ON f.id = c.ancestor "
+        "WHERE c.descendant = ? ORDER BY c.depth DESC",
+        (folder_id,)
+    ).fetchall()
+
+
+def rebuild_folder_closure(conn):
+    """folders から閉包テーブルを作り直す。コミットは呼び出し側で行う"""
+    conn.execute("DELETE FROM folder_closure")
+    conn.execute(
+        "INSERT INTO folder_closure (ancestor, descendant, depth) " + CLOSURE_FROM_FOLDERS
+    )
+
+
+def check_folder_closure(conn):
+    """
+    閉包テーブルを folders から求めた本来の内容と比べ、
+    (欠けている組の数, 余分な組の数) を返す（どちらも 0 なら整合している）。
+    """
+    expected = f"SELECT * FROM ({CLOSURE_FROM_FOLDERS})"
+    actual = "SELECT ancestor, descendant, depth FROM folder_closure"
+    missing = conn.execute(
+        f"SELECT COUNT(*) FROM ({expected} EXCEPT {actual})"
+    ).fetchone()[0]
+    extra = conn.execute(
+        f"SELECT COUNT(*) FROM ({actual} EXCEPT {expected})"
+    ).fetchone()[0]
+    return missing, extra
+
+
+# ========== アイテム数の集計 ==========
+#
+# folder_stats にはフォルダごとの直下のアイテム数（item_count）と、
+# 配下のフォルダを含めた数（total_items）を持つ。
+# アイテムの追加・削除・移動とフォルダの移動・削除のたびに、トリガ（migrations の 11）が
+# 閉包テーブルで祖先をたどって増減させる。
+# 閉包テーブルを作り直したあと（復元など）は rebuild_folder_stats で数え直す。
+
+# items と閉包テーブルから数え直した本来の値 (folder_id, item_count, total_items)
+_STATS_FROM_ITEMS = """
+    WITH direct(folder_id, n) AS (
+        SELECT folder_id, COUNT(*) FROM items GROUP BY folder_id
+    )
+    SELECT f.id, COALESCE(d.n, 0), COALESCE((
+        SELECT SUM(sub.n) FROM folder_closure c JOIN direct sub ON sub.folder_id = c.descendant
+        WHERE c.ancestor = f.id
+    ), 0)
+    FROM folders f LEFT JOIN direct d ON d.folder_id = f.id
+"""
+
+
+# items の folder_stats 更新トリガ（connection.triggers_suspended で外す）
+ITEM_STATS_TRIGGERS = "items_stats_*"
+
+
+def rebuild_folder_stats(conn):
+    """folder_stats を数え直す。コミットは呼び出し側で行う"""
+    conn.execute("DELETE FROM folder_stats")
+    conn.execute(
+        "INSERT INTO folder_stats (folder_id, item_count, total_items) " + _STATS_FROM_ITEMS
+    )
+
+
+def check_folder_stats(conn):
+    """
+    folder_stats を数え直した値と比べ、食い違うフォルダの
+    (folder_id, (直下, 配下を含む) の保存値, 数え直した値) のリストを返す（空なら整合している）。
+    保存値が無いフォルダは None、フォルダが無いのに残っている行は数え直した値を None にする。
+    """
+    expected = {row[0]: tuple(row[1:]) for row in conn.execute(_STATS_FROM_ITEMS)}
+    actual = {
+        row[0]: tuple(row[1:])
+        for row in conn.execute("SELECT folder_id, item_count, total_items FROM folder_stats")
+    }
+    return [
+        (folder_id, actual.get(folder_id), expected.get(folder_id))
+        for folder_id in sorted(expected.keys() | actual.keys())
+        if actual.get(folder_id) != expected.get(folder_id)
+    ]
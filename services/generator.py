@@ -0,0 +1,231 @@
+import functools
+import json
+import math
+import os
+import string
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+
+# ========== パスワード生成 ==========
+#
+# Policy（長さ・使う文字種・除外する文字・パスフレーズかどうか）に従って
+# パスワードを作る。generate_batch は1回の呼び出しで何千件でも作れ、
+# 乱数は os.urandom からまとめて読む（1文字ごとに secrets.choice を呼ばない）。
+#
+# 文字の選び方は棄却サンプリングで偏りを無くしている。1バイト（0〜255）を
+# 文字集合の大きさ n で割った余りにすると先頭の文字が選ばれやすくなるので、
+# 256 // n * n 以上のバイトは捨てる。この変換は bytes.translate で
+# 「使うバイトは文字に、捨てるバイトは削除」として C の中で一度に行う。
+#
+# 必須の文字種（英小文字・英大文字・数字・記号のうち有効なもの）を含まない
+# パスワードは、作り直しではなく丸ごと捨てる。こうすると条件を満たすパスワード
+# 全体の中から一様に選んだのと同じになる。
+#
+# パスフレーズは単語をつなげたもの。単語一覧（1行1語のファイル）を指定しなければ、
+# ローマ字の音節 SYLLABLES_PER_WORD 個で作った読める単語を使う。
+#
+# サイトごとの規則（SITE_RULES、または load_site_rules で読んだ JSON）は
+# ドメインの末尾で照合し、Policy の一部の項目だけを上書きする。
+
+LOWER = string.ascii_lowercase
+UPPER = string.ascii_uppercase
+DIGITS = string.digits
+DEFAULT_SYMBOLS = "!@#$%^&*"
+# 見分けにくい文字（exclude_lookalikes で除く）
+LOOKALIKES = "Il1|O0o`'\""
+
+Policy = namedtuple(
+    "Policy",
+    "kind length lower upper digits symbols symbol_chars exclude_lookalikes exclude "
+    "words separator capitalize wordlist",
+    defaults=(
+        "password", 16, True, True, True, True, DEFAULT_SYMBOLS, False, "",
+        5, "-", False, None,
+    ),
+)
+DEFAULT_POLICY = Policy()
+PASSPHRASE_POLICY = Policy(kind="passphrase")
+
+# ドメイン（末尾一致）-> Policy を上書きする項目
+SITE_RULES = {}
+
+ROMAJI_SYLLABLES = tuple(
+    c + v for c in ("", "k", "s", "t", "n", "h", "m", "r", "g", "z", "d", "b", "p")
+    for v in "aiueo"
+) + ("ya", "yu", "yo", "wa")
+SYLLABLES_PER_WORD = 3
+
+# 1回に読む乱数の量の見積もりに足す余裕（棄却される分の揺らぎを吸収する）
+_RANDOM_MARGIN = 1.1
+
+
+class PolicyError(ValueError):
+    pass
+
+
+# ---------- 文字集合 ----------
+
+def _classes(policy):
+    """有効な文字種ごとの文字列（除外する文字を除いたもの）のリスト"""
+    excluded = set(policy.exclude)
+    if policy.exclude_lookalikes:
+        excluded.update(LOOKALIKES)
+    classes = []
+    for enabled, chars in (
+        (policy.lower, LOWER), (policy.upper, UPPER),
+        (policy.digits, DIGITS), (policy.symbols, policy.symbol_chars),
+    ):
+        if enabled:
+            chars = "".join(dict.fromkeys(c for c in chars if c not in excluded))
+            if not chars:
+                raise PolicyError("有効な文字種の文字がすべて除外されています")
+            classes.append(chars)
+    if not classes:
+        raise PolicyError("文字種が1つも有効になっていません")
+    return classes
+
+
+@functools.lru_cache(maxsize=32)
+def _sampler(alphabet):
+    """alphabet から一様に選ぶための (translate の表, 捨てるバイト) を返す"""
+    if not alphabet.isascii() or len(alphabet) > 256:
+        raise PolicyError("文字集合は 256 文字以下の ASCII にしてください")
+    n = len(alphabet)
+    limit = 256 // n * n
+    table = bytes(ord(alphabet[b % n]) if b < limit else 0 for b in range(256))
+    return table, bytes(range(limit, 256)), limit / 256
+
+
+def random_chars(alphabet, count):
+    """alphabet から一様に選んだ count 文字の文字列"""
+    table, rejected, accept_rate = _sampler(alphabet)
+    out = b""
+    while len(out) < count:
+        need = count - len(out)
+        raw = os.urandom(math.ceil(need / accept_rate * _RANDOM_MARGIN) + 16)
+        out += raw.translate(table, rejected)
+    return out[:count].decode("ascii")
+
+
+def random_indices(n, count):
+    """0 以上 n 未満の一様な整数を count 個（n が 256 を超えても使える）"""
+    width = 1 if n <= 256 else 2 if n <= 65536 else 4
+    span = 256 ** width
+    limit = span // n * n
+    fmt = {1: "B", 2: "H", 4: "I"}[width]
+    result = []
+    while len(result) < count:
+        need = count - len(result)
+        raw = os.urandom(width * (math.ceil(need * span / limit * _RANDOM_MARGIN) + 4))
+        result.extend(v % n for v in memoryview(raw).cast(fmt) if v < limit)
+    return result[:count]
+
+
+# ---------- 生成 ----------
+
+def _passwords(policy, count):
+    classes = _classes(policy)
+    if policy.length < len(classes):
+        raise PolicyError(f"長さ {policy.length} では {len(classes)} 種類の文字を含められません")
+    alphabet = "".join(classes)
+    # 各パスワードに文字種がそろっているかは、文字を種類の代表に置き換えて調べる
+    class_of = str.maketrans({c: str(i) for i, chars in enumerate(classes) for c in chars})
+    required = len(classes)
+    length = policy.length
+
+    result = []
+    while len(result) < count:
+        need = count - len(result)
+        chars = random_chars(alphabet, need * length)
+        for i in range(0, len(chars), length):
+            password = chars[i:i + length]
+            if len(set(password.translate(class_of))) == required:
+                result.append(password)
+    return result[:count]
+
+
+@functools.lru_cache(maxsize=4)
+def load_wordlist(path):
+    """1行1語の単語一覧（空行と重複は除く）"""
+    with open(path, encoding="utf-8") as fp:
+        words = tuple(dict.fromkeys(w.strip() for w in fp if w.strip()))
+    if len(words) < 2:
+        raise PolicyError(f"単語一覧 {path} の単語が少なすぎます")
+    return words
+
+
+def _passphrases(policy, count):
+    if policy.words < 1:
+        raise PolicyError("単語数は1以上にしてください")
+    per_phrase = policy.words
+    if policy.wordlist:
+        words = load_wordlist(policy.wordlist)
+        picked = [words[i] for i in random_indices(len(words), count * per_phrase)]
+    else:
+        syllables = ROMAJI_SYLLABLES
+        indices = random_indices(len(syllables), count * per_phrase * SYLLABLES_PER_WORD)
+        picked = [
+            "".join(syllables[j] for j in indices[i:i + SYLLABLES_PER_WORD])
+            for i in range(0, len(indices), SYLLABLES_PER_WORD)
+        ]
+    if policy.capitalize:
+        picked = [w.capitalize() for w in picked]
+    return [
+        policy.separator.join(picked[i:i + per_phrase])
+        for i in range(0, len(picked), per_phrase)
+    ]
+
+
+def generate_batch(count, policy=DEFAULT_POLICY):
+    """policy に従ったパスワード（またはパスフレーズ）を count 件作る"""
+    if count <= 0:
+        return []
+    if policy.kind == "passphrase":
+        return _passphrases(policy, count)
+    if policy.kind != "password":
+        raise PolicyError(f"不明な種類です: {policy.kind}")
+    return _passwords(policy, count)
+
+
+def generate(policy=DEFAULT_POLICY):
+    return generate_batch(1, policy)[0]
+
+
+def policy_entropy(policy):
+    """policy で作られるパスワードのおおよそのエントロピー（ビット）"""
+    if policy.kind == "passphrase":
+        if policy.wordlist:
+            per_word = math.log2(len(load_wordlist(policy.wordlist)))
+        else:
+            per_word = SYLLABLES_PER_WORD * math.log2(len(ROMAJI_SYLLABLES))
+        return policy.words * per_word
+    return policy.length * math.log2(len("".join(_classes(policy))))
+
+
+# ---------- サイトごとの規則 ----------
+
+def load_site_rules(path):
+    """
+    {"example.com": {"length": 12, "symbols": false}, ...} 形式の JSON を読む。
+    Policy に無い項目があれば PolicyError。
+    """
+    with open(path, encoding="utf-8") as fp:
+        rules = json.load(fp)
+    for domain, overrides in rules.items():
+        unknown = set(overrides) - set(Policy._fields)
+        if unknown:
+            raise PolicyError(f"{domain}: 不明な項目です: {', '.join(sorted(unknown))}")
+    return rules
+
+
+def policy_for_url(url, rules=None, base=DEFAULT_POLICY):
+    """url のホストに一致する規則（一番長く一致するドメイン）で base を上書きした Policy"""
+    rules = SITE_RULES if rules is None else rules
+    if not url or not rules:
+        return base
+    host = urlsplit(url if "//" in url else "//" + url).hostname or ""
+    matches = [d for d in rules if host == d or host.endswith("." + d)]
+    if not matches:
+        return base
+    return base._replace(**rules[max(matches, key=len)])
@@ -0,0 +1,334 @@
+import contextlib
+import csv
+import json
+import os
+
+from services.connection import triggers_suspended
+from services.folder_service import ITEM_STATS_TRIGGERS, rebuild_folder_stats
+from services.item_service import encrypt_fields, new_row_uuid
+from services.search_service import FTS_TRIGGERS, rebuild_fts_index
+
+
+# ========== 他のパスワード管理ソフトからのインポート ==========
+#
+# エクスポートファイルをジェネレータで1件ずつ読み、
+# フォルダ階層を作りながら executemany でまとめて INSERT する。
+# ファイル全体をメモリに載せないので、件数が多くてもメモリ使用量は一定。
+#
+# 各パーサは次の形の dict を順に返す:
+#   {"folder": ("親", "子", ...), "title", "username", "password", "url", "notes"}
+
+BATCH_SIZE = 5000
+# この件数を超えたら、残りは全文検索とアイテム数のトリガを外して1トランザクションで取り込み、
+# 最後に作り直す（行ごとにトリガで更新するより速い）
+BULK_THRESHOLD = 20000
+
+FIELDS = ("title", "username", "password", "url", "notes")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _record(folder, title, username, password, url, notes):
+    return {
+        "folder": tuple(part for part in folder if part),
+        "title": title or "",
+        "username": username or "",
+        "password": password or "",
+        "url": url or "",
+        "notes": notes or "",
+    }
+
+
+def _split_path(path, sep="/"):
+    return tuple(part.strip() for part in (path or "").split(sep) if part.strip())
+
+
+# ---------- CSV ----------
+
+def parse_1password_csv(fp):
+    """1Password の CSV（Title, Url, Username, Password, Notes, Tags / Vault）"""
+    for row in csv.DictReader(fp):
+        folder = row.get("Vault") or (row.get("Tags") or "").split(",")[0]
+        yield _record(
+            _split_path(folder),
+            row.get("Title"), row.get("Username"), row.get("Password"),
+            row.get("Url") or row.get("URL") or row.get("Website"), row.get("Notes"),
+        )
+
+
+def parse_bitwarden_csv(fp):
+    """Bitwarden の CSV（folder, name, notes, login_uri, login_username, login_password ...）"""
+    for row in csv.DictReader(fp):
+        yield _record(
+            _split_path(row.get("folder")),
+            row.get("name"), row.get("login_username"), row.get("login_password"),
+            row.get("login_uri"), row.get("notes"),
+        )
+
+
+def parse_keepass_csv(fp):
+    """KeePass / KeePassXC の CSV（Group, Title, Username, Password, URL, Notes）"""
+    for row in csv.DictReader(fp):
+        group = _split_path(row.get("Group"))
+        # KeePassXC は先頭に "Root" を付けるので取り除く
+        if group and group[0] == "Root":
+            group = group[1:]
+        yield _record(
+            group,
+            row.get("Title"), row.get("Username"), row.get("Password"),
+            row.get("URL"), row.get("Notes"),
+        )
+
+
+# ---------- JSON ----------
+
+def _iter_json_array(fp, chunk_size=64 * 1024):
+    """
+    JSON 配列の要素を1つずつ返す（配列全体を読み込まない）。
+    json.JSONDecoder.raw_decode で、読み込んだ分だけを順に切り出す。
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # 空白と区切り文字を読み飛ばし、次の文字が来るまで読み足す
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ImportFormatError("JSON 配列が途中で終わっています")
+            more = fp.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise ImportFormatError("JSON 配列ではありません")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # 要素がバッファの途中で切れている。読み足して再試行する
+            more = "" if eof else fp.read(chunk_size)
+            if not more:
+                raise ImportFormatError("JSON の形式が不正です")
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield value
+        pos = end
+        # 処理済みの部分を捨ててバッファを小さく保つ
+        if pos > chunk_size:
+            buf, pos = buf[pos:], 0
+
+
+def _json_record(obj):
+    folder = obj.get("folder") or obj.get("group") or ""
+    folder = tuple(folder) if isinstance(folder, list) else _split_path(folder)
+    return _record(
+        folder,
+        obj.get("title") or obj.get("name"), obj.get("username"), obj.get("password"),
+        obj.get("url") or obj.get("uri"), obj.get("notes"),
+    )
+
+
+def parse_json(fp):
+    """
+    汎用 JSON。オブジェクトの配列、または1行1オブジェクトの JSON Lines。
+    キーは title(name) / username / password / url(uri) / notes / folder(group)。
+    folder は "親/子" 形式の文字列か、名前のリスト。
+    """
+    first = fp.read(1)
+    while first and first.isspace():
+        first = fp.read(1)
+    if first == "[":
+        yield from (_json_record(obj) for obj in _iter_json_array(_Prepend(first, fp)))
+        return
+    if first != "{":
+        if first:
+            raise ImportFormatError("JSON の形式が不正です")
+        return
+    line = first + fp.readline()
+    while True:
+        if line.strip():
+            yield _json_record(json.loads(line))
+        line = fp.readline()
+        if not line:
+            return
+
+
+class _Prepend:
+    """先読みした文字を戻したファイルのように振る舞う"""
+
+    def __init__(self, head, fp):
+        self.head = head
+        self.fp = fp
+
+    def read(self, size=-1):
+        head, self.head = self.head, ""
+        return head + self.fp.read(size)
+
+
+# ---------- 形式の判定 ----------
+
+PARSERS = {
+    "1password": parse_1password_csv,
+    "bitwarden": parse_bitwarden_csv,
+    "keepass": parse_keepass_csv,
+    "json": parse_json,
+}
+
+
+def detect_format(path):
+    """拡張子と CSV のヘッダ行からエクスポート元を推定する"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".json", ".jsonl"):
+        return "json"
+    with open(path, newline="", encoding="utf-8-sig") as fp:
+        header = next(csv.reader(fp), [])
+    if "login_username" in header:
+        return "bitwarden"
+    if "Group" in header and "Title" in header:
+        return "keepass"
+    if "Title" in header and ("Username" in header or "Password" in header):
+        return "1password"
+    raise ImportFormatError("対応していないファイル形式です")
+
+
+def iter_records(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    if fmt not in PARSERS:
+        raise ImportFormatError(f"未対応の形式です: {fmt}")
+    with open(path, newline="", encoding="utf-8-sig") as fp:
+        yield from PARSERS[fmt](fp)
+
+
+# ========== 取り込み ==========
+
+class _FolderResolver:
+    """フォルダのパス（名前のタプル）を id に変換し、無ければ作る"""
+
+    def __init__(self, conn, root_id, dry_run):
+        self.conn = conn
+        self.dry_run = dry_run
+        self.cache = {(): root_id}
+        self.created = 0
+        self._next_fake_id = -1
+
+    def resolve(self, path):
+        folder_id = self.cache.get(path)
+        if folder_id is not None:
+            return folder_id
+        parent_id = self.resolve(path[:-1])
+        name = path[-1]
+        row = None
+        if parent_id > 0:
+            row = self.conn.execute(
+                "SELECT id FROM folders WHERE parent_id = ? AND name = ? LIMIT 1",
+                (parent_id, name)
+            ).fetchone()
+        if row is not None:
+            folder_id = row[0]
+        elif self.dry_run:
+            # 作ったことにして数えるだけ
+            folder_id = self._next_fake_id
+            self._next_fake_id -= 1
+            self.created += 1
+        else:
+            folder_id = self.conn.execute(
+                "INSERT INTO folders (parent_id, name) VALUES (?, ?)", (parent_id, name)
+            ).lastrowid
+            self.created += 1
+        self.cache[path] = folder_id
+        return folder_id
+
+
+def import_records(conn, records, root_folder_id, cipher=None,
+                   batch_size=BATCH_SIZE, progress=None, dry_run=False):
+    """
+    records を root_folder_id の下に取り込み、{"items": 件数, "folders": 作成数} を返す。
+    元のフォルダ階層は root_folder_id の下にそのまま作る（同名のフォルダは再利用）。
+
+    cipher   : password / notes の暗号化に使う FieldCipher（dry_run 以外では必須）
+    progress : batch_size 件ごとに progress(取り込み済み件数) を呼ぶ
+    dry_run  : 解析とフォルダ解決だけ行い、DB には書き込まない
+
+    batch_size 件ごとにコミットする。途中で失敗した場合、
+    失敗したバッチだけが取り消され、それ以前のバッチは残る。
+    BULK_THRESHOLD 件を超えた後は残り全体を1トランザクションで取り込むので、
+    失敗するとその分がまとめて取り消される（その間、他の接続は書き込めない）。
+    """
+    if cipher is None and not dry_run:
+        raise ValueError("暗号化のための cipher が必要です")
+
+    folders = _FolderResolver(conn, root_folder_id, dry_run)
+    total = 0
+    batch = []
+    # 大量取り込みに切り替えた後は、外したトリガを戻す ExitStack
+    bulk = None
+
+    def flush():
+        if not dry_run:
+            conn.executemany(
+                "INSERT INTO items (folder_id, title, username, password, url, notes, uuid) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            if bulk is None:
+                conn.commit()
+        batch.clear()
+        if progress is not None:
+            progress(total)
+
+    def start_bulk():
+        conn.commit()
+        # トリガの削除も同じトランザクションに含めるため、明示的に開始する
+        conn.execute("BEGIN IMMEDIATE")
+        stack = contextlib.ExitStack()
+        stack.enter_context(triggers_suspended(conn, FTS_TRIGGERS))
+        stack.enter_context(triggers_suspended(conn, ITEM_STATS_TRIGGERS))
+        return stack
+
+    try:
+        for record in records:
+            folder_id = folders.resolve(record["folder"])
+            if dry_run:
+                batch.append((folder_id, *(record[f] for f in FIELDS), None))
+            else:
+                row_uuid = new_row_uuid()
+                values = encrypt_fields(cipher, record, row_uuid)
+                batch.append((folder_id, *(values[f] for f in FIELDS), row_uuid))
+            total += 1
+            if len(batch) >= batch_size:
+                flush()
+                if bulk is None and not dry_run and total >= BULK_THRESHOLD:
+                    bulk = start_bulk()
+        if batch:
+            flush()
+        if bulk is not None:
+            # 全文検索の索引とアイテム数を作り直してから、トリガを戻す
+            rebuild_fts_index(conn)
+            rebuild_folder_stats(conn)
+            bulk.close()
+            conn.commit()
+    except Exception:
+        if not dry_run:
+            # 外したトリガも取り消しで元に戻る
+            conn.rollback()
+        raise
+
+    return {"items": total, "folders": folders.created}
+
+
+def import_file(conn, path, root_folder_id, cipher=None, fmt=None, **kwargs):
+    return import_records(conn, iter_records(path, fmt), root_folder_id, cipher, **kwargs)
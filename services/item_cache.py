@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+
+# ========== 復号済みアイテムのキャッシュ ==========
+#
+# 詳細フォームに出すアイテムを、復号した Item のまま最近使った順に保持する。
+# 一覧で行を選んだら前後 PREFETCH_RADIUS 行もまとめて1回の問い合わせで読んでおくので、
+# 矢印キーで順に移動する間は DB にも復号にも触れずにフォームを埋められる。
+#
+# キャッシュには復号済みの password / notes が入る。保管庫がロックされたら
+# （手動でもアイドルタイムアウトでも）clear() で全件を捨てること。
+# アイテムを書き換えたら invalidate() でその行だけ捨てる。
+
+DEFAULT_CAPACITY = 256
+PREFETCH_RADIUS = 2
+
+
+class ItemCache:
+    def __init__(self, vault, capacity=DEFAULT_CAPACITY):
+        self.vault = vault
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # item_id -> Item（末尾が最近使ったもの）
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def get(self, item_id, cipher):
+        """item_id の Item を返す（無ければ None）。キャッシュに無ければ読んで復号する"""
+        with self._lock:
+            item = self._entries.get(item_id)
+            if item is not None:
+                self._entries.move_to_end(item_id)
+                self.hits += 1
+                return item
+            self.misses += 1
+        item = self.vault.get_item(item_id, cipher)
+        if item is not None:
+            self._put([item])
+        return item
+
+    def prefetch(self, item_ids, cipher):
+        """item_ids のうちキャッシュに無いものを1回の問い合わせで読み込み、読んだ件数を返す"""
+        with self._lock:
+            missing = [i for i in item_ids if i is not None and i not in self._entries]
+        if not missing:
+            return 0
+        items = self.vault.get_items(missing, cipher)
+        self._put(items)
+        with self._lock:
+            self.prefetched += len(items)
+        return len(items)
+
+    def _put(self, items):
+        with self._lock:
+            for item in items:
+                self._entries[item.id] = item
+                self._entries.move_to_end(item.id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, item_ids):
+        with self._lock:
+            for item_id in item_ids:
+                self._entries.pop(item_id, None)
+
+    def clear(self):
+        """全件を捨てる（ロック時・一括変更の後に呼ぶ）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "prefetched": self.prefetched,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
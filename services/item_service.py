@@ -0,0 +1,230 @@
+import json
+import os
+
+from services.connection import triggers_suspended
+from services.crypto import VERSION
+from services.migrations import SYNC_TRIGGERS
+
+# ========== アイテム一覧のページング ==========
+#
+# OFFSET ではなくキーセット（最後に読んだ id）で次ページを取るので、
+# 何ページ目でも (folder_id, id) のインデックスを使った範囲読み込みになる。
+
+PAGE_SIZE = 200
+
+
+def fetch_item_page(conn, folder_id, before_id=None, limit=PAGE_SIZE):
+    """
+    folder_id のアイテムを id 降順で最大 limit 件返す。
+    before_id を渡すとそれより小さい id から続きを読む。
+    戻り値は (id, title) のリスト。
+    """
+    if before_id is None:
+        cur = conn.execute(
+            "SELECT id, title FROM items WHERE folder_id = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (folder_id, limit)
+        )
+    else:
+        cur = conn.execute(
+            "SELECT id, title FROM items WHERE folder_id = ? AND id < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (folder_id, before_id, limit)
+        )
+    return cur.fetchall()
+
+
+# ========== 詳細の読み込みと暗号化 ==========
+#
+# 一覧は (id, title) だけを読むので復号は発生しない。
+# password / notes は詳細を表示するときに1行ずつ復号する。
+# 暗号文は行の uuid に結び付けるので（services.crypto）、読み書きには uuid も要る。
+
+ENCRYPTED_FIELDS = ("password", "notes")
+
+
+# 行に結び付けていない旧形式の暗号文の先頭バイト（services.crypto.VERSION）
+LEGACY_PREFIX = VERSION
+
+ITEM_COLUMNS = ("id", "folder_id", "title", "username", "password", "url", "notes", "version")
+
+
+def new_row_uuid():
+    """追加する行の uuid。暗号化の前に決めておき、INSERT で明示して入れる"""
+    return os.urandom(16)
+
+
+def get_uuid(conn, item_id):
+    row = conn.execute("SELECT uuid FROM items WHERE id = ?", (item_id,)).fetchone()
+    return row[0] if row else None
+
+
+def get_item(conn, item_id):
+    """
+    1件を dict（ITEM_COLUMNS と uuid）で返す（password / notes は暗号文のまま）。無ければ None。
+    """
+    row = conn.execute(
+        f"SELECT {', '.join(ITEM_COLUMNS)}, uuid FROM items WHERE id = ?",
+        (item_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(ITEM_COLUMNS + ("uuid",), row))
+
+
+def get_items(conn, item_ids):
+    """
+    複数件を1回の問い合わせで dict のリストにして返す（順序は不定、無い id は含まない）。
+    一覧で選択中の前後の行を先読みするときに使う。
+    """
+    rows = conn.execute(
+        f"SELECT {', '.join(ITEM_COLUMNS)}, uuid FROM items "
+        "WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(item_ids)),)
+    ).fetchall()
+    return [dict(zip(ITEM_COLUMNS + ("uuid",), row)) for row in rows]
+
+
+def decrypt_item(cipher, item):
+    """get_item の結果の暗号化フィールドを復号した dict を返す"""
+    decrypted = dict(item)
+    for field in ENCRYPTED_FIELDS:
+        decrypted[field] = cipher.decrypt_text(item[field], field, item["uuid"])
+    return decrypted
+
+
+def encrypt_fields(cipher, values, row_uuid):
+    """values（列名 -> 値）のうち暗号化対象の列を、row_uuid の行用に暗号化した dict を返す"""
+    encrypted = dict(values)
+    for field in ENCRYPTED_FIELDS:
+        if field in encrypted:
+            encrypted[field] = cipher.encrypt_text(encrypted[field], field, row_uuid)
+    return encrypted
+
+
+# ========== 追加・更新・削除 ==========
+#
+# 書き込み系の関数はコミットしない。複数の操作を1トランザクションに
+# まとめられるよう、コミットは呼び出し側（Repository.transaction）で行う。
+
+ITEM_FIELDS = ("title", "username", "password", "url", "notes")
+
+
+class ItemConflictError(Exception):
+    """読み込んだ後に別のウィンドウや CLI がアイテムを更新していた"""
+
+    def __init__(self, item_id):
+        super().__init__(f"アイテム {item_id} は別の場所で更新されています")
+        self.item_id = item_id
+
+
+def add_item(conn, folder_id, values, row_uuid):
+    """values（列名 -> 値。row_uuid 用に暗号化済み）で1件追加し、新しい id を返す"""
+    cur = conn.execute(
+        "INSERT INTO items (folder_id, title, username, password, url, notes, uuid) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (folder_id, *(values.get(f) for f in ITEM_FIELDS), row_uuid)
+    )
+    return cur.lastrowid
+
+
+def update_item(conn, item_id, values, expected_version=None):
+    """
+    values に含まれる列だけを更新する（folder_id も指定できる）。
+    更新した行があれば True。
+
+    内容の列（ITEM_FIELDS）を更新したときは version を1つ増やす（フォルダの移動だけでは
+    増やさない）。expected_version を渡すと、その版のときだけ更新し、
+    別の場所で先に更新されていれば ItemConflictError を送出する。
+    """
+    columns = [c for c in ("folder_id", *ITEM_FIELDS) if c in values]
+    if not columns:
+        return False
+    assignments = [c + " = ?" for c in columns]
+    if any(c in ITEM_FIELDS for c in columns):
+        assignments.append("version = version + 1")
+    sql = f"UPDATE items SET {', '.join(assignments)} WHERE id = ?"
+    params = [values[c] for c in columns] + [item_id]
+    if expected_version is not None:
+        sql += " AND version = ?"
+        params.append(expected_version)
+    cur = conn.execute(sql, params)
+    if cur.rowcount > 0:
+        return True
+    if expected_version is not None and conn.execute(
+        "SELECT 1 FROM items WHERE id = ?", (item_id,)
+    ).fetchone():
+        raise ItemConflictError(item_id)
+    return False
+
+
+def move_items(conn, item_ids, folder_id):
+    """
+    item_ids のアイテムをまとめて folder_id へ移し、移動した件数を返す。
+    id の列は JSON 配列として1つのパラメータで渡すので、件数に関係なく
+    UPDATE 1文（1往復）で済む（SQLite の変数の上限にもかからない）。
+    """
+    cur = conn.execute(
+        "UPDATE items SET folder_id = ? WHERE id IN (SELECT value FROM json_each(?))",
+        (folder_id, json.dumps(list(item_ids)))
+    )
+    return cur.rowcount
+
+
+def delete_item(conn, item_id):
+    cur = conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+    return cur.rowcount > 0
+
+
+_PENDING_ROWS_SQL = (
+    "SELECT id, uuid, password, notes FROM items "
+    "WHERE typeof(password) = 'text' OR typeof(notes) = 'text' "
+    "OR substr(password, 1, 1) = ? OR substr(notes, 1, 1) = ?"
+)
+
+
+def is_pending_value(value):
+    """平文（TEXT）か、行に結び付けていない旧形式の暗号文なら True"""
+    return isinstance(value, str) or (value is not None and value[:1] == LEGACY_PREFIX)
+
+
+def mark_pending_rows(conn):
+    """
+    変換の要る値を書き込んだことを vault_state に記録する。
+    書き込みと同じトランザクションで呼ぶ（変換の前に終了しても次の解錠で変換される）。
+    """
+    conn.execute("UPDATE vault_state SET pending_rows = 1 WHERE id = 1")
+
+
+def encrypt_pending_rows(conn, cipher):
+    """
+    暗号化導入前に平文（TEXT）で保存された password / notes と、行に結び付けていない
+    旧形式の暗号文を、1トランザクションで行の uuid に結び付けた暗号文にする。
+    解錠直後と、古いバックアップ・差分を取り込んだ後に呼ぶ。変換した行数を返す。
+    全行を調べるのは vault_state.pending_rows が立っているときだけで、変換したら下ろす。
+    """
+    def convert(value, field, row_uuid):
+        if is_pending_value(value):
+            return cipher.rebind_text(value, field, row_uuid)
+        return value
+
+    if not conn.execute("SELECT pending_rows FROM vault_state WHERE id = 1").fetchone()[0]:
+        return 0
+    conn.commit()
+    # トリガの削除も同じトランザクションに含めるため、明示的に開始する
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        rows = conn.execute(_PENDING_ROWS_SQL, (LEGACY_PREFIX, LEGACY_PREFIX)).fetchall()
+        # 保存の形式が変わるだけで内容は同じなので、同期の変更としては記録しない
+        # （記録すると、他の端末でのまだ取り込んでいない編集を後勝ちで上書きしてしまう）
+        with triggers_suspended(conn, SYNC_TRIGGERS):
+            conn.executemany(
+                "UPDATE items SET password = ?, notes = ? WHERE id = ?",
+                [
+                    (convert(password, "password", row_uuid),
+                     convert(notes, "notes", row_uuid), item_id)
+                    for item_id, row_uuid, password, notes in rows
+                ]
+            )
+        conn.execute("UPDATE vault_state SET pending_rows = 0 WHERE id = 1")
+    return len(rows)
@@ -0,0 +1,218 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+
+# ========== マスターパスワードの鍵導出 ==========
+#
+# マスターパスワードは平文では保存せず、メモリハードな scrypt
+# （使えない環境では PBKDF2-HMAC-SHA256）で鍵を導出して保存する。
+# 保存形式は "アルゴリズム$パラメータ$salt$検証値"（salt・検証値は base64）。
+#
+#   scrypt$n=32768,r=8,p=1$<salt>$<verifier>
+#   pbkdf2_sha256$i=600000$<salt>$<verifier>
+#
+# 導出した鍵そのものは保存せず、鍵から HMAC で作った検証値だけを保存する。
+# （導出鍵は保管庫データの暗号化鍵を包む用途にも使えるようにしておく）
+#
+# コストはマシンごとに calibrate() で目標の解錠時間に合わせて決める。
+
+KEY_LENGTH = 32
+SALT_LENGTH = 16
+DEFAULT_TARGET_MS = 300
+
+SCRYPT_R = 8
+MIN_SCRYPT_N = 2 ** 14
+# n の上限（メモリ使用量は 128 * n * r バイト。2**17 で 128MB）
+MAX_SCRYPT_N = 2 ** 17
+MIN_PBKDF2_ITERATIONS = 100000
+
+HAS_SCRYPT = hasattr(hashlib, "scrypt")
+
+
+class KdfError(ValueError):
+    pass
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+def _scrypt_maxmem(n, r):
+    return 128 * n * r * 2 + 1024 * 1024
+
+
+def default_params():
+    if HAS_SCRYPT:
+        return {"algorithm": "scrypt", "n": MIN_SCRYPT_N, "r": SCRYPT_R, "p": 1}
+    return {"algorithm": "pbkdf2_sha256", "i": MIN_PBKDF2_ITERATIONS}
+
+
+def derive_key(password, salt, params):
+    """params に従って password から KEY_LENGTH バイトの鍵を導出する"""
+    secret = password.encode("utf-8")
+    algorithm = params["algorithm"]
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        return hashlib.scrypt(
+            secret, salt=salt, n=n, r=r, p=p,
+            maxmem=_scrypt_maxmem(n, r), dklen=KEY_LENGTH
+        )
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", secret, salt, params["i"], dklen=KEY_LENGTH)
+    raise KdfError(f"未対応の鍵導出方式です: {algorithm}")
+
+
+def _verifier(key):
+    return hmac.new(key, b"master-password-verifier", hashlib.sha256).digest()
+
+
+# ---------- 保存形式 ----------
+
+def format_params(params):
+    fields = ",".join(f"{k}={v}" for k, v in params.items() if k != "algorithm")
+    return f"{params['algorithm']}${fields}"
+
+
+def encode(params, salt, verifier):
+    return f"{format_params(params)}${_b64encode(salt)}${_b64encode(verifier)}"
+
+
+def decode(encoded):
+    """保存形式を (params, salt, verifier) に分解する。形式が違えば KdfError"""
+    try:
+        algorithm, fields, salt, verifier = encoded.split("$")
+        params = {"algorithm": algorithm}
+        for field in fields.split(","):
+            k, v = field.split("=")
+            params[k] = int(v)
+        return params, _b64decode(salt), _b64decode(verifier)
+    except (ValueError, AttributeError) as e:
+        raise KdfError("マスターパスワードの保存形式が不正です") from e
+
+
+def is_hashed(value):
+    try:
+        decode(value)
+    except KdfError:
+        return False
+    return True
+
+
+# ---------- 設定・照合 ----------
+
+def create(password, params=None):
+    """
+    password を保存形式の文字列にし、(保存形式, 導出鍵) を返す。
+    params を省略するとこのマシンで校正したコストを使う。
+    """
+    params = dict(params or calibrate())
+    salt = os.urandom(SALT_LENGTH)
+    key = derive_key(password, salt, params)
+    return encode(params, salt, _verifier(key)), key
+
+
+def hash_password(password, params=None):
+    """password を保存形式の文字列にする（導出鍵が不要な場合）"""
+    return create(password, params)[0]
+
+
+def unlock(password, encoded):
+    """
+    password が encoded と一致すれば導出鍵を、違えば None を返す。
+    比較は定数時間で行う。
+    """
+    params, salt, expected = decode(encoded)
+    key = derive_key(password, salt, params)
+    if hmac.compare_digest(_verifier(key), expected):
+        return key
+    return None
+
+
+def verify_password(password, encoded):
+    return unlock(password, encoded) is not None
+
+
+def is_off_target(elapsed_ms, target_ms=DEFAULT_TARGET_MS):
+    """
+    鍵導出の実測時間が目標から大きく外れていれば True。
+    needs_rehash() の校正は数百ミリ秒かかるので、その前の安い目安に使う。
+    """
+    return not (target_ms / 2 <= elapsed_ms <= target_ms * 2)
+
+
+def needs_rehash(encoded, target_ms=DEFAULT_TARGET_MS):
+    """
+    保存済みのコストが、このマシンで校正したコストと違えば True。
+    別のマシンで設定した保管庫を開いた場合などに、コストを校正し直すために使う。
+    """
+    return decode(encoded)[0] != calibrate(target_ms)
+
+
+# ---------- 校正 ----------
+
+_calibrated = {}
+
+
+def _time_ms(params):
+    salt = os.urandom(SALT_LENGTH)
+    t0 = time.perf_counter()
+    derive_key("calibration", salt, params)
+    return (time.perf_counter() - t0) * 1000
+
+
+def calibrate(target_ms=DEFAULT_TARGET_MS, use_cache=True):
+    """
+    このマシンで1回の鍵導出がおよそ target_ms になるコストを返す。
+    scrypt は n を2倍ずつ（メモリ上限 MAX_SCRYPT_N まで）増やし、
+    それでも足りなければ p で時間を伸ばす。PBKDF2 は反復回数を比例で決める。
+    """
+    if use_cache and target_ms in _calibrated:
+        return dict(_calibrated[target_ms])
+
+    params = default_params()
+    if params["algorithm"] == "scrypt":
+        elapsed = _time_ms(params)
+        # 所要時間は n にほぼ比例するので、目標を超えない最大の n を見積もる
+        while params["n"] < MAX_SCRYPT_N and elapsed * 2 <= target_ms:
+            params["n"] *= 2
+            elapsed *= 2
+        # 見積もりではなく実測で確かめる
+        elapsed = _time_ms(params)
+        if elapsed * 1.5 < target_ms:
+            params["p"] = max(1, round(target_ms / elapsed))
+    else:
+        elapsed = _time_ms(params)
+        scale = target_ms / max(elapsed, 0.001)
+        params["i"] = max(MIN_PBKDF2_ITERATIONS, int(params["i"] * scale))
+
+    _calibrated[target_ms] = dict(params)
+    return params
+
+
+def main(argv=None):
+    """
+    python -m services.kdf [--target-ms 300]
+    このマシンでの鍵導出コストを校正し、実測時間とともに表示する。
+    """
+    parser = argparse.ArgumentParser(prog="python -m services.kdf")
+    parser.add_argument("--target-ms", type=int, default=DEFAULT_TARGET_MS)
+    args = parser.parse_args(argv)
+
+    params = calibrate(args.target_ms, use_cache=False)
+    samples = sorted(_time_ms(params) for _ in range(3))
+    print(f"target={args.target_ms}ms  params={format_params(params)}")
+    print(f"  measured: min={samples[0]:.0f}ms median={samples[1]:.0f}ms max={samples[2]:.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
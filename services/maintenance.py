@@ -0,0 +1,84 @@
+import argparse
+import sys
+
+from services.connection import get_connection
+from services.folder_service import (
+    check_folder_closure, check_folder_stats, rebuild_folder_closure, rebuild_folder_stats,
+    vacuum_orphans,
+)
+from services.migrations import migrate
+
+
+# ========== メンテナンスコマンド ==========
+#
+#   python -m services.maintenance [--db password_manager.db] vacuum-orphans [--compact]
+#   python -m services.maintenance [--db password_manager.db] check-closure [--repair]
+#   python -m services.maintenance [--db password_manager.db] check-stats [--repair]
+
+
+def cmd_vacuum_orphans(args):
+    conn = get_connection(args.db)
+    migrate(conn)
+    folders, items = vacuum_orphans(conn, compact=args.compact)
+    print(f"孤立フォルダ {folders} 件、孤立アイテム {items} 件を削除しました")
+    return 0
+
+
+def cmd_check_closure(args):
+    conn = get_connection(args.db)
+    migrate(conn)
+    missing, extra = check_folder_closure(conn)
+    if not missing and not extra:
+        print("OK フォルダの閉包テーブルは整合しています")
+        return 0
+    print(f"NG 閉包テーブルに欠けている組 {missing} 件、余分な組 {extra} 件")
+    if not args.repair:
+        return 1
+    with conn:
+        rebuild_folder_closure(conn)
+        # アイテム数は閉包テーブルで祖先をたどって増減していたので数え直す
+        rebuild_folder_stats(conn)
+    print("閉包テーブルを作り直し、アイテム数を数え直しました")
+    return 0
+
+
+def cmd_check_stats(args):
+    conn = get_connection(args.db)
+    migrate(conn)
+    problems = check_folder_stats(conn)
+    if not problems:
+        print("OK フォルダごとのアイテム数は整合しています")
+        return 0
+    for folder_id, stored, expected in problems:
+        print(f"NG フォルダ {folder_id}: 保存値 {stored} / 数え直した値 {expected}")
+    if not args.repair:
+        return 1
+    with conn:
+        rebuild_folder_stats(conn)
+    print("アイテム数を数え直しました")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m services.maintenance")
+    parser.add_argument("--db", default="password_manager.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("vacuum-orphans", help="親フォルダが消えたフォルダ・アイテムを削除する")
+    p.add_argument("--compact", action="store_true", help="削除後に VACUUM する")
+    p.set_defaults(func=cmd_vacuum_orphans)
+
+    p = sub.add_parser("check-closure", help="フォルダの閉包テーブルを folders と照合する")
+    p.add_argument("--repair", action="store_true", help="食い違っていれば作り直す")
+    p.set_defaults(func=cmd_check_closure)
+
+    p = sub.add_parser("check-stats", help="フォルダごとのアイテム数を数え直して照合する")
+    p.add_argument("--repair", action="store_true", help="食い違っていれば数え直す")
+    p.set_defaults(func=cmd_check_stats)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,775 @@
+import os
+import sqlite3
+import sys
+
+from services import kdf
+from services.connection import get_connection
+from services.folder_service import CLOSURE_FROM_FOLDERS
+
+
+# ========== スキーママイグレーション ==========
+#
+# PRAGMA user_version に適用済みのバージョン番号を記録し、
+# それより新しいステップだけを順に流す。
+# 各ステップは SQL 文のリスト、または conn を受け取る関数。
+# 1ステップ = 1トランザクションなので、途中で失敗しても中途半端な状態は残らない。
+
+def _hash_master_password(conn):
+    for row_id, stored in conn.execute("SELECT id, password FROM master").fetchall():
+        if not kdf.is_hashed(stored):
+            conn.execute(
+                "UPDATE master SET password = ? WHERE id = ?",
+                # 校正は数百ミリ秒かかるのでマイグレーション中には行わず、最小のコストで包む。
+                # GUI の初回解錠で needs_rehash() がこのマシンのコストに上げる
+                (kdf.hash_password(stored, kdf.default_params()), row_id)
+            )
+
+
+# 旧バックエンド（services/db_service.py）が使っていた DB の、保管庫からの相対位置
+LEGACY_ACCOUNTS_PATH = os.path.join("db", "id_manager.db")
+LEGACY_FOLDER_NAME = "ID Manager"
+
+
+def _main_db_path(conn):
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return ""
+
+
+def _legacy_account_rows(legacy_path):
+    """旧 DB の accounts を items の列の並び (title, username, password, url, notes) で返す"""
+    legacy = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+    try:
+        has_table = legacy.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts'"
+        ).fetchone()
+        if not has_table:
+            return []
+        rows = legacy.execute(
+            "SELECT title, account_id, password, email, email2, url FROM accounts ORDER BY id"
+        ).fetchall()
+    finally:
+        legacy.close()
+
+    merged = []
+    for title, account_id, password, email, email2, url in rows:
+        notes = "\n".join(
+            f"{label}: {value}"
+            for label, value in (("メール", email), ("2nd メール", email2)) if value
+        )
+        merged.append((title, account_id, password, url, notes))
+    return merged
+
+
+def _merge_legacy_accounts(conn):
+    """
+    旧 DB（保管庫と同じディレクトリの db/id_manager.db）の accounts を、
+    ルート直下の "ID Manager" フォルダのアイテムとして取り込む。
+    password は平文のまま入るが、次の解錠時に encrypt_pending_rows で暗号化される。
+    旧 DB が無ければ何もしない。旧 DB のファイルには手を付けない。
+    """
+    db_path = _main_db_path(conn)
+    if not db_path:
+        return
+    legacy_path = os.path.join(os.path.dirname(db_path), LEGACY_ACCOUNTS_PATH)
+    if not os.path.exists(legacy_path):
+        return
+    rows = _legacy_account_rows(legacy_path)
+    if not rows:
+        return
+
+    root = conn.execute(
+        "SELECT id FROM folders WHERE parent_id IS NULL ORDER BY id LIMIT 1"
+    ).fetchone()
+    if root is None:
+        root_id = conn.execute(
+            "INSERT INTO folders (parent_id, name) VALUES (NULL, 'ルート')"
+        ).lastrowid
+    else:
+        root_id = root[0]
+    folder_id = conn.execute(
+        "INSERT INTO folders (parent_id, name) VALUES (?, ?)", (root_id, LEGACY_FOLDER_NAME)
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO items (folder_id, title, username, password, url, notes) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(folder_id, *row) for row in rows]
+    )
+
+
+# folders から閉包テーブルを埋める（求め方は rebuild_folder_closure と同じ）
+_FILL_FOLDER_CLOSURE = "INSERT INTO folder_closure (ancestor, descendant, depth) " + CLOSURE_FROM_FOLDERS
+
+
+# ---------- 同期（services.sync_service）----------
+
+# 同期用の論理時計を1つ進め、この端末の変更の通し番号も1つ進める。
+# 時計は「ミリ秒の時刻 << 16」に同じミリ秒内の通し番号を足した値で、
+# 端末の時刻が戻っても前の値より必ず大きくなる（ハイブリッド論理時計）
+SYNC_TICK_SQL = (
+    "UPDATE sync_state SET seq = seq + 1, "
+    "clock = MAX(clock + 1, CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER) << 16) "
+    "WHERE id = 1"
+)
+# 同期する列（変更ログの field 名, 列）。フォルダの親とアイテムのフォルダは
+# 端末ごとに違う id ではなく uuid でやりとりする
+SYNC_FIELDS = {
+    "folders": (("parent", "parent_id"), ("name", "name")),
+    "items": (
+        ("folder", "folder_id"), ("title", "title"), ("username", "username"),
+        ("password", "password"), ("url", "url"), ("notes", "notes"),
+    ),
+}
+# 差分バックアップの change_seq を進める列（uuid の付与だけでは進めない）
+_CHANGE_COLUMNS = {
+    "folders": "parent_id, name",
+    "items": "folder_id, title, username, password, url, notes, version",
+}
+
+
+# _sync_triggers が作るトリガの名前（connection.triggers_suspended で外すとき用）
+SYNC_TRIGGERS = "*_sync_*"
+
+
+def _sync_triggers(table):
+    """
+    table の変更を sync_log に記録するトリガ。
+    追加は行全体（field = '*'）、更新は変わった列ごと、削除は墓標（field = '-'）
+    1行に置き換える。device が NULL の行はこの端末の変更で、seq に通し番号を持つ
+    """
+    fields = SYNC_FIELDS[table]
+    columns = ", ".join(column for _, column in fields)
+    changed = " OR ".join(f"old.{column} IS NOT new.{column}" for _, column in fields)
+    changed_fields = " UNION ALL ".join(
+        f"SELECT '{field}' AS field WHERE old.{column} IS NOT new.{column}"
+        for field, column in fields
+    )
+    log = "INSERT OR REPLACE INTO sync_log (entity, uuid, field, clock, device, seq)"
+    return [
+        # 同期で他の端末から来た行は uuid を指定して入れる。無ければここで振る
+        f"""
+        CREATE TRIGGER {table}_sync_ai AFTER INSERT ON {table} BEGIN
+            UPDATE {table} SET uuid = randomblob(16) WHERE id = new.id AND uuid IS NULL;
+            {SYNC_TICK_SQL};
+            {log}
+            SELECT '{table}', t.uuid, '*', s.clock, NULL, s.seq
+            FROM {table} t, sync_state s WHERE t.id = new.id AND s.id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_sync_au AFTER UPDATE OF {columns} ON {table}
+        WHEN {changed} BEGIN
+            {SYNC_TICK_SQL};
+            {log}
+            SELECT '{table}', new.uuid, c.field, s.clock, NULL, s.seq
+            FROM sync_state s, ({changed_fields}) c WHERE s.id = 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_sync_ad AFTER DELETE ON {table} BEGIN
+            {SYNC_TICK_SQL};
+            DELETE FROM sync_log WHERE entity = '{table}' AND uuid = old.uuid;
+            {log}
+            SELECT '{table}', old.uuid, '-', s.clock, NULL, s.seq FROM sync_state s WHERE s.id = 1;
+        END
+        """,
+    ]
+
+
+def _add_sync_log(conn):
+    # 6 の更新トリガは change_seq 以外のどの列でも番号を進めるので、
+    # uuid の付与で全行が差分バックアップに載らないよう、内容の列に絞っておく
+    for table in ("folders", "items"):
+        conn.execute(f"DROP TRIGGER {table}_change_au")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_change_au AFTER UPDATE OF {_CHANGE_COLUMNS[table]} ON {table}
+            BEGIN
+                UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+                UPDATE {table} SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)
+                WHERE id = new.id;
+            END
+        """)
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN uuid BLOB")
+
+    # 既存の行にも新しい行と同じく乱数の uuid を振る（id から決めると、この移行の前に
+    # 分かれた複製どうしで、別々に追加した同じ id の行が同じ行とみなされてしまう）。
+    # そうした複製は同期の履歴（sync_state.lineage）も別になり、互いの差分を取り込まない
+    for table in ("folders", "items"):
+        conn.execute(f"UPDATE {table} SET uuid = randomblob(16)")
+        conn.execute(f"CREATE UNIQUE INDEX idx_{table}_uuid ON {table}(uuid)")
+
+    # 同期で知った端末と、その端末の変更をどこまで取り込んだか（NULL はまだ1度も）
+    conn.execute("""
+        CREATE TABLE sync_devices (
+            id INTEGER PRIMARY KEY,
+            uuid TEXT NOT NULL UNIQUE,
+            imported_seq INTEGER
+        )
+    """)
+    # device: この端末の sync_devices.id（複製したファイルでは mark_sync_clone で振り直す）,
+    # seq: この端末の変更の通し番号,
+    # exported_seq: 書き出し済みの番号, base_seq: この端末として書き始めたときの番号,
+    # directory: 前回同期したディレクトリ,
+    # lineage: 同期の履歴の id。この移行で1度だけ振り、ファイルの複製（mark_sync_clone を含む）
+    # は引き継ぐ。同じ lineage の端末どうしだけが差分をやりとりする
+    conn.execute("""
+        CREATE TABLE sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            device INTEGER NOT NULL,
+            lineage TEXT NOT NULL,
+            clock INTEGER NOT NULL DEFAULT 0,
+            seq INTEGER NOT NULL DEFAULT 0,
+            exported_seq INTEGER NOT NULL DEFAULT 0,
+            base_seq INTEGER NOT NULL DEFAULT 0,
+            directory TEXT
+        )
+    """)
+    device = conn.execute(
+        "INSERT INTO sync_devices (uuid) VALUES (?)", (os.urandom(16).hex(),)
+    ).lastrowid
+    conn.execute(
+        "INSERT INTO sync_state (id, device, lineage) VALUES (1, ?, ?)",
+        (device, os.urandom(16).hex())
+    )
+    conn.execute("""
+        CREATE TABLE sync_log (
+            entity TEXT NOT NULL,
+            uuid BLOB NOT NULL,
+            field TEXT NOT NULL,
+            clock INTEGER NOT NULL,
+            device INTEGER,
+            seq INTEGER,
+            PRIMARY KEY (entity, uuid, field)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_sync_log_seq ON sync_log(seq) WHERE seq IS NOT NULL")
+    # 他の端末から来た、まだ無いフォルダを指している行（届いたら付け替える）
+    conn.execute("""
+        CREATE TABLE sync_orphans (
+            entity TEXT NOT NULL,
+            uuid BLOB NOT NULL,
+            ref BLOB NOT NULL,
+            PRIMARY KEY (entity, uuid)
+        ) WITHOUT ROWID
+    """)
+    for table in ("folders", "items"):
+        for sql in _sync_triggers(table):
+            conn.execute(sql)
+
+
+MIGRATIONS = [
+    # 1: 既存の初期スキーマ（既存 DB では IF NOT EXISTS で素通りする）
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS folders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            parent_id INTEGER,
+            name TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folder_id INTEGER NOT NULL,
+            title TEXT,
+            username TEXT,
+            password TEXT,
+            url TEXT,
+            notes TEXT,
+            FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS master (
+            id INTEGER PRIMARY KEY,
+            password TEXT NOT NULL
+        )
+        """,
+    ]),
+    # 2: 一覧表示・フォルダ削除・子フォルダ検索用のインデックス
+    (2, [
+        # (folder_id, id DESC) で絞り込みと並び替えを兼ね、title まで含めて
+        # 一覧クエリをテーブル本体に触れずに返す（カバリングインデックス）
+        "CREATE INDEX IF NOT EXISTS idx_items_folder_id_title "
+        "ON items(folder_id, id DESC, title)",
+        "CREATE INDEX IF NOT EXISTS idx_folders_parent_id ON folders(parent_id)",
+        "ANALYZE",
+    ]),
+    # 3: 全文検索インデックス（items を外部コンテンツとし、トリガで同期する）
+    (3, [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            title, username, url, notes,
+            content='items', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='1 2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts(rowid, title, username, url, notes)
+            VALUES (new.id, new.title, new.username, new.url, new.notes);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, username, url, notes)
+            VALUES ('delete', old.id, old.title, old.username, old.url, old.notes);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS items_fts_au
+        AFTER UPDATE OF title, username, url, notes ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, username, url, notes)
+            VALUES ('delete', old.id, old.title, old.username, old.url, old.notes);
+            INSERT INTO items_fts(rowid, title, username, url, notes)
+            VALUES (new.id, new.title, new.username, new.url, new.notes);
+        END
+        """,
+        # rank 列の並び順：bm25 で title > username > url > notes の順に重み付け
+        "INSERT INTO items_fts(items_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 3.0, 1.0)')",
+        # 既存の行を索引に取り込む
+        "INSERT INTO items_fts(items_fts) VALUES ('rebuild')",
+    ]),
+    # 4: 平文で保存されていたマスターパスワードを KDF の検証値に置き換える
+    (4, _hash_master_password),
+    # 5: フィールド暗号化。データ鍵を包んで保存する列を追加し、
+    #    暗号化される notes を全文検索の対象から外す
+    (5, [
+        "ALTER TABLE master ADD COLUMN wrapped_key BLOB",
+        "DROP TRIGGER IF EXISTS items_fts_ai",
+        "DROP TRIGGER IF EXISTS items_fts_ad",
+        "DROP TRIGGER IF EXISTS items_fts_au",
+        "DROP TABLE IF EXISTS items_fts",
+        """
+        CREATE VIRTUAL TABLE items_fts USING fts5(
+            title, username, url,
+            content='items', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='1 2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER items_fts_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts(rowid, title, username, url)
+            VALUES (new.id, new.title, new.username, new.url);
+        END
+        """,
+        """
+        CREATE TRIGGER items_fts_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, username, url)
+            VALUES ('delete', old.id, old.title, old.username, old.url);
+        END
+        """,
+        """
+        CREATE TRIGGER items_fts_au AFTER UPDATE OF title, username, url ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, title, username, url)
+            VALUES ('delete', old.id, old.title, old.username, old.url);
+            INSERT INTO items_fts(rowid, title, username, url)
+            VALUES (new.id, new.title, new.username, new.url);
+        END
+        """,
+        "INSERT INTO items_fts(items_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 3.0)')",
+        "INSERT INTO items_fts(items_fts) VALUES ('rebuild')",
+    ]),
+    # 6: 変更の追跡（差分バックアップ用）。
+    #    行を書き換えるたびに保管庫全体の通し番号を1つ進めて change_seq に記録し、
+    #    削除された行は tombstones に残す。
+    (6, [
+        "ALTER TABLE folders ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE items ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        )
+        """,
+        "INSERT INTO change_counter (id, seq) VALUES (1, 0)",
+        """
+        CREATE TABLE tombstones (
+            entity TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            change_seq INTEGER NOT NULL,
+            PRIMARY KEY (entity, row_id)
+        )
+        """,
+        "CREATE INDEX idx_folders_change_seq ON folders(change_seq)",
+        "CREATE INDEX idx_items_change_seq ON items(change_seq)",
+        "CREATE INDEX idx_tombstones_change_seq ON tombstones(change_seq)",
+        """
+        CREATE TABLE backups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            since_seq INTEGER NOT NULL,
+            until_seq INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        *[
+            sql
+            for table in ("folders", "items")
+            for sql in (
+                f"""
+                CREATE TRIGGER {table}_change_ai AFTER INSERT ON {table} BEGIN
+                    UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+                    UPDATE {table} SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)
+                    WHERE id = new.id;
+                    DELETE FROM tombstones WHERE entity = '{table}' AND row_id = new.id;
+                END
+                """,
+                # change_seq だけの更新（このトリガ自身によるもの）では番号を進めない
+                f"""
+                CREATE TRIGGER {table}_change_au AFTER UPDATE ON {table}
+                WHEN new.change_seq = old.change_seq BEGIN
+                    UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+                    UPDATE {table} SET change_seq = (SELECT seq FROM change_counter WHERE id = 1)
+                    WHERE id = new.id;
+                END
+                """,
+                f"""
+                CREATE TRIGGER {table}_change_ad AFTER DELETE ON {table} BEGIN
+                    UPDATE change_counter SET seq = seq + 1 WHERE id = 1;
+                    INSERT OR REPLACE INTO tombstones (entity, row_id, change_seq)
+                    VALUES ('{table}', old.id, (SELECT seq FROM change_counter WHERE id = 1));
+                END
+                """,
+            )
+        ],
+    ]),
+    # 7: 旧バックエンド（db/id_manager.db の accounts）を items に統合する
+    (7, _merge_legacy_accounts),
+    # 8: データ鍵の照合値（KDF を通さずに渡されたデータ鍵が正しいか確かめる）
+    (8, [
+        "ALTER TABLE master ADD COLUMN key_check BLOB",
+    ]),
+    # 9: アイテムの版数（楽観的排他制御。内容を更新するたびに1つ増やす）
+    (9, [
+        "ALTER TABLE items ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+    ]),
+    # 10: フォルダ階層の閉包テーブル（祖先・子孫の全組と距離。自分自身も depth 0 で持つ）。
+    #     部分木・パンくず・配下のアイテム数をインデックス1回の検索で引けるようにする。
+    #     追加・移動・削除のたびにトリガで保つ
+    (10, [
+        """
+        CREATE TABLE folder_closure (
+            ancestor INTEGER NOT NULL,
+            descendant INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX idx_folder_closure_descendant ON folder_closure(descendant, depth)",
+        _FILL_FOLDER_CLOSURE,
+        """
+        CREATE TRIGGER folders_closure_ai AFTER INSERT ON folders BEGIN
+            INSERT INTO folder_closure (ancestor, descendant, depth)
+            SELECT ancestor, new.id, depth + 1 FROM folder_closure WHERE descendant = new.parent_id
+            UNION ALL
+            SELECT new.id, new.id, 0;
+        END
+        """,
+        # 移動: 部分木と旧祖先の組を消し、新しい親の祖先と部分木の組を足す
+        """
+        CREATE TRIGGER folders_closure_au AFTER UPDATE OF parent_id ON folders
+        WHEN old.parent_id IS NOT new.parent_id BEGIN
+            DELETE FROM folder_closure
+            WHERE descendant IN (SELECT descendant FROM folder_closure WHERE ancestor = new.id)
+              AND ancestor IN (
+                  SELECT ancestor FROM folder_closure WHERE descendant = new.id AND ancestor != new.id
+              );
+            INSERT OR IGNORE INTO folder_closure (ancestor, descendant, depth)
+            SELECT a.ancestor, d.descendant, a.depth + d.depth + 1
+            FROM folder_closure a, folder_closure d
+            WHERE a.descendant = new.parent_id AND d.ancestor = new.id;
+        END
+        """,
+        """
+        CREATE TRIGGER folders_closure_ad AFTER DELETE ON folders BEGIN
+            DELETE FROM folder_closure WHERE descendant = old.id;
+            DELETE FROM folder_closure WHERE ancestor = old.id;
+        END
+        """,
+    ]),
+    # 11: フォルダごとのアイテム数（直下の数と、配下を含めた数）。
+    #     items の追加・削除・フォルダ変更とフォルダの移動・削除のたびに、
+    #     閉包テーブルで祖先をたどってトリガで増減する。
+    #     あわせて 10 のフォルダ削除トリガを、残った子孫と祖先の組も消すよう直す
+    #     （直す前に残った組は作り直して消す）
+    (11, [
+        "DROP TRIGGER folders_closure_ad",
+        """
+        CREATE TRIGGER folders_closure_ad AFTER DELETE ON folders BEGIN
+            DELETE FROM folder_closure
+            WHERE descendant IN (SELECT descendant FROM folder_closure WHERE ancestor = old.id)
+              AND ancestor IN (SELECT ancestor FROM folder_closure WHERE descendant = old.id);
+        END
+        """,
+        "DELETE FROM folder_closure",
+        _FILL_FOLDER_CLOSURE,
+        """
+        CREATE TABLE folder_stats (
+            folder_id INTEGER PRIMARY KEY,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            total_items INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT INTO folder_stats (folder_id, item_count, total_items)
+        WITH direct(folder_id, n) AS (
+            SELECT folder_id, COUNT(*) FROM items GROUP BY folder_id
+        )
+        SELECT f.id, COALESCE(d.n, 0), COALESCE((
+            SELECT SUM(sub.n) FROM folder_closure c JOIN direct sub ON sub.folder_id = c.descendant
+            WHERE c.ancestor = f.id
+        ), 0)
+        FROM folders f LEFT JOIN direct d ON d.folder_id = f.id
+        """,
+        """
+        CREATE TRIGGER items_stats_ai AFTER INSERT ON items BEGIN
+            UPDATE folder_stats
+            SET item_count = item_count + (folder_id = new.folder_id), total_items = total_items + 1
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = new.folder_id);
+        END
+        """,
+        """
+        CREATE TRIGGER items_stats_ad AFTER DELETE ON items BEGIN
+            UPDATE folder_stats
+            SET item_count = item_count - (folder_id = old.folder_id), total_items = total_items - 1
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = old.folder_id);
+        END
+        """,
+        """
+        CREATE TRIGGER items_stats_au AFTER UPDATE OF folder_id ON items
+        WHEN old.folder_id IS NOT new.folder_id BEGIN
+            UPDATE folder_stats
+            SET item_count = item_count - (folder_id = old.folder_id), total_items = total_items - 1
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = old.folder_id);
+            UPDATE folder_stats
+            SET item_count = item_count + (folder_id = new.folder_id), total_items = total_items + 1
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = new.folder_id);
+        END
+        """,
+        "CREATE TRIGGER folders_stats_ai AFTER INSERT ON folders BEGIN "
+        "INSERT OR IGNORE INTO folder_stats (folder_id) VALUES (new.id); END",
+        # 移動・削除では、部分木の合計を旧い親の祖先から引き（移動なら新しい親の祖先に足す）。
+        # 親の祖先の組は部分木の外なので、閉包テーブルのトリガとどちらが先に動いても変わらない
+        """
+        CREATE TRIGGER folders_stats_au AFTER UPDATE OF parent_id ON folders
+        WHEN old.parent_id IS NOT new.parent_id BEGIN
+            UPDATE folder_stats
+            SET total_items = total_items - (SELECT total_items FROM folder_stats WHERE folder_id = new.id)
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = old.parent_id);
+            UPDATE folder_stats
+            SET total_items = total_items + (SELECT total_items FROM folder_stats WHERE folder_id = new.id)
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = new.parent_id);
+        END
+        """,
+        """
+        CREATE TRIGGER folders_stats_ad AFTER DELETE ON folders BEGIN
+            UPDATE folder_stats
+            SET total_items = total_items - (SELECT total_items FROM folder_stats WHERE folder_id = old.id)
+            WHERE folder_id IN (SELECT ancestor FROM folder_closure WHERE descendant = old.parent_id);
+            DELETE FROM folder_stats WHERE folder_id = old.id;
+        END
+        """,
+    ]),
+    # 12: 端末間の同期。行に端末をまたいで変わらない uuid を振り、
+    #     列ごとの最終変更（論理時計と端末）を sync_log にトリガで記録する
+    (12, _add_sync_log),
+    # 13: 変換（item_service.encrypt_pending_rows）の要る行があるかの印。
+    #     解錠のたびに全行を調べないよう、印があるときだけ調べて変換後に下ろす。
+    #     ここまでの移行で平文や旧形式の暗号文が残っているかもしれないので、立てておく
+    (13, [
+        """
+        CREATE TABLE vault_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            pending_rows INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT INTO vault_state (id, pending_rows) VALUES (1, 1)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    未適用のマイグレーションをすべて適用し、適用後のバージョンを返す。
+    何度呼んでも結果は同じ（適用済みのステップは飛ばす）。
+    """
+    # 暗黙に開いているトランザクションがあれば先に確定しておく
+    conn.commit()
+
+    for version, step in MIGRATIONS:
+        if get_version(conn) >= version:
+            continue
+
+        # IMMEDIATE で書き込みロックを取ってからバージョンを読み直し、
+        # 別プロセスが同時に起動しても二重適用しないようにする
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                for sql in step:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_version(conn)
+
+
+def mark_sync_clone(conn):
+    """
+    この DB を複製として、同期では複製元とは別の端末にする（新しい端末 id を振る）。
+    端末 id は DB の中に持つので、ファイルを複製すると複製元と同じ端末になってしまう。
+    複製した時点までの複製元の変更は取り込み済みとし、書き出し済みの変更は
+    複製元のものとして扱う（まだ書き出していない変更はこの端末の変更として書き出す）。
+    同期の無い（マイグレーション 12 より前の）DB では何もしない。コミットする。
+    """
+    if get_version(conn) < 12:
+        return
+    with conn:
+        device, seq, exported = conn.execute(
+            "SELECT device, seq, exported_seq FROM sync_state WHERE id = 1"
+        ).fetchone()
+        conn.execute(
+            "UPDATE sync_devices SET imported_seq = MAX(COALESCE(imported_seq, 0), ?) "
+            "WHERE id = ?",
+            (seq, device)
+        )
+        conn.execute(
+            "UPDATE sync_log SET device = ?, seq = NULL WHERE seq <= ?", (device, exported)
+        )
+        device = conn.execute(
+            "INSERT INTO sync_devices (uuid) VALUES (?)", (os.urandom(16).hex(),)
+        ).lastrowid
+        conn.execute(
+            "UPDATE sync_state SET device = ?, base_seq = exported_seq WHERE id = 1", (device,)
+        )
+
+
+# ========== 実行計画チェック ==========
+
+# (説明, SQL, パラメータ, 使われるべきインデックス名)
+HOT_QUERIES = [
+    (
+        "アイテム一覧（先頭ページ）",
+        "SELECT id, title FROM items WHERE folder_id = ? ORDER BY id DESC LIMIT ?",
+        (1, 200),
+        "idx_items_folder_id_title",
+    ),
+    (
+        "アイテム一覧（続きのページ）",
+        "SELECT id, title FROM items WHERE folder_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+        (1, 1000, 200),
+        "idx_items_folder_id_title",
+    ),
+    (
+        "フォルダ内アイテム削除",
+        "DELETE FROM items WHERE folder_id = ?",
+        (1,),
+        "idx_items_folder_id_title",
+    ),
+    (
+        "子フォルダ検索",
+        "SELECT id FROM folders WHERE parent_id = ?",
+        (1,),
+        "idx_folders_parent_id",
+    ),
+    (
+        "部分木のフォルダ",
+        "SELECT descendant FROM folder_closure WHERE ancestor = ?",
+        (1,),
+        "PRIMARY KEY",
+    ),
+    (
+        "パンくず（祖先を上から順に）",
+        "SELECT ancestor FROM folder_closure WHERE descendant = ? ORDER BY depth DESC",
+        (1,),
+        "idx_folder_closure_descendant",
+    ),
+    (
+        "同期で書き出す変更",
+        "SELECT entity, uuid FROM sync_log WHERE seq > ? AND seq <= ?",
+        (0, 1000),
+        "idx_sync_log_seq",
+    ),
+    (
+        "行の変更ログ",
+        "SELECT field, clock, device FROM sync_log WHERE entity = ? AND uuid = ?",
+        ("items", b""),
+        "PRIMARY KEY",
+    ),
+    (
+        "uuid からアイテム",
+        "SELECT id FROM items WHERE uuid = ?",
+        (b"",),
+        "idx_items_uuid",
+    ),
+    (
+        "uuid からフォルダ",
+        "SELECT id FROM folders WHERE uuid = ?",
+        (b"",),
+        "idx_folders_uuid",
+    ),
+]
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN の detail 列を行ごとのリストで返す"""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans(conn):
+    """
+    HOT_QUERIES がそれぞれ想定のインデックスを使っているか確認する。
+    問題のあったクエリを (説明, 実行計画) のリストで返す（空なら OK）。
+    """
+    problems = []
+    for label, sql, params, index_name in HOT_QUERIES:
+        plan = explain(conn, sql, params)
+        uses_index = any(index_name in detail for detail in plan)
+        sorts = any("USE TEMP B-TREE" in detail for detail in plan)
+        if not uses_index or sorts:
+            problems.append((label, plan))
+    return problems
+
+
+def main(argv=None):
+    """
+    python -m services.migrations [DB_PATH]
+    マイグレーションを適用し、ホットクエリの実行計画を検査する。
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else "password_manager.db"
+
+    conn = get_connection(path)
+    version = migrate(conn)
+    print(f"{path}: user_version = {version}")
+
+    problems = check_query_plans(conn)
+    for label, plan in problems:
+        print(f"NG {label}: {' / '.join(plan)}")
+    if problems:
+        return 1
+    print("OK すべてのホットクエリがインデックスを使用しています")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
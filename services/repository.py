@@ -0,0 +1,257 @@
+import contextlib
+import threading
+from collections import namedtuple
+
+from services import folder_service, item_service, search_service, vault_key
+from services.connection import get_connection
+from services.diagnostics import instrument_methods
+from services.migrations import migrate
+
+
+# ========== 保管庫リポジトリ ==========
+#
+# フォルダ・アイテム・マスターパスワードへのアクセスをまとめた窓口。
+# GUI（gui_main.py）と CLI（main.py）はどちらもこのクラスだけを通して
+# password_manager.db を読み書きする。SQL そのものは各 services モジュールにあり、
+# ここでは接続の取得・暗号化・戻り値のレコード型への変換だけを行う。
+#
+# 接続はスレッドごとの共有コネクション（services.connection）を使うので、
+# 1つの Repository を GUI スレッドとワーカースレッドの両方から呼んでよい。
+#
+# 書き込みは transaction() の中で行い、with を抜けたところでコミットする。
+# 外側で transaction() を開いておけば、複数の操作が1トランザクションになる。
+#
+# PM_DIAGNOSTICS を設定して起動すると、公開メソッドの所要時間を vault.<名前> で記録する
+# （services.diagnostics）。
+
+DB_PATH = "password_manager.db"
+
+Folder = namedtuple("Folder", "id parent_id name")
+# 直下のアイテム数と、配下のフォルダを含めたアイテム数つきのフォルダ
+FolderCounts = namedtuple("FolderCounts", "id parent_id name item_count total_items")
+ItemSummary = namedtuple("ItemSummary", "id title")
+Item = namedtuple("Item", "id folder_id title username password url notes version")
+
+
+@instrument_methods("vault.", exclude=("transaction",))
+class Repository:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        # transaction() の入れ子の深さ（スレッドごと）
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        """呼び出したスレッド用の共有コネクション（close しないこと）"""
+        return get_connection(self.path)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        with の中の書き込みを1トランザクションにまとめる。
+        入れ子にした場合は一番外側で抜けたときにコミットし、
+        例外で抜けた場合は全体を取り消す。
+        """
+        conn = self.conn
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0:
+                conn.commit()
+        finally:
+            self._local.depth = depth
+
+    def init(self):
+        """
+        スキーマを最新にし（旧 db/id_manager.db の統合を含む）、
+        ルートフォルダが無ければ作る。スキーマのバージョンを返す。
+        """
+        version = migrate(self.conn)
+        with self.transaction() as conn:
+            folder_service.ensure_root_folder(conn)
+        return version
+
+    # ---------- フォルダ ----------
+
+    def list_folders(self):
+        return [Folder._make(row) for row in folder_service.load_folder_rows(self.conn)]
+
+    def list_folders_with_counts(self):
+        """list_folders と同じ順で FolderCounts を返す（数はトリガで保った値を読むだけ）"""
+        rows = folder_service.load_folder_rows_with_counts(self.conn)
+        return [FolderCounts._make(row) for row in rows]
+
+    def root_folder_id(self):
+        with self.transaction() as conn:
+            return folder_service.ensure_root_folder(conn)
+
+    def add_folder(self, parent_id, name):
+        with self.transaction() as conn:
+            return Folder(folder_service.add_folder(conn, parent_id, name), parent_id, name)
+
+    def rename_folder(self, folder_id, name):
+        with self.transaction() as conn:
+            return folder_service.rename_folder(conn, folder_id, name)
+
+    def move_folder(self, folder_id, new_parent_id):
+        """移動先が自分自身か配下なら ValueError"""
+        with self.transaction() as conn:
+            return folder_service.move_folder(conn, folder_id, new_parent_id)
+
+    def delete_folder(self, folder_id, progress=None):
+        """
+        配下ごと削除し、(削除したフォルダ数, 削除したアイテム数) を返す。
+        トップレベル（親の無い）フォルダは GUI と同じく削除させず ValueError。
+        """
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT parent_id FROM folders WHERE id = ?", (folder_id,)
+            ).fetchone()
+            if row is not None and row[0] is None:
+                raise ValueError("トップレベルフォルダは削除できません")
+            return folder_service.delete_subtree(conn, folder_id, progress)
+
+    def subtree_folders(self, folder_id):
+        """folder_id とその子孫を浅い順に Folder のリストで返す"""
+        rows = folder_service.subtree_folders(self.conn, folder_id)
+        return [Folder(folder_id, parent_id, name) for folder_id, parent_id, name, _ in rows]
+
+    def count_subtree_items(self, folder_id):
+        return folder_service.count_subtree_items(self.conn, folder_id)
+
+    def folder_path(self, folder_id):
+        """ルートから folder_id までの Folder のリスト（パンくず）"""
+        return [Folder._make(row) for row in folder_service.folder_path(self.conn, folder_id)]
+
+    # ---------- アイテム ----------
+
+    def item_page(self, folder_id, before_id=None, limit=item_service.PAGE_SIZE):
+        rows = item_service.fetch_item_page(self.conn, folder_id, before_id, limit)
+        return [ItemSummary._make(row) for row in rows]
+
+    def get_item(self, item_id, cipher=None):
+        """
+        1件を Item で返す（無ければ None）。
+        cipher を渡すと password / notes を復号し、省略すると暗号文のまま返す。
+        """
+        item = item_service.get_item(self.conn, item_id)
+        if item is None:
+            return None
+        if cipher is not None:
+            item = item_service.decrypt_item(cipher, item)
+        return Item._make(item[f] for f in Item._fields)
+
+    def get_items(self, item_ids, cipher=None):
+        """複数件を1回の問い合わせで Item のリストにして返す（無い id は含まない）"""
+        items = item_service.get_items(self.conn, item_ids)
+        if cipher is not None:
+            items = [item_service.decrypt_item(cipher, item) for item in items]
+        return [Item._make(item[f] for f in Item._fields) for item in items]
+
+    def add_item(self, folder_id, cipher, **values):
+        """values（title / username / password / url / notes）で1件追加し、Item を返す"""
+        unknown = set(values) - set(item_service.ITEM_FIELDS)
+        if unknown:
+            raise TypeError(f"不明な列です: {', '.join(sorted(unknown))}")
+        row_uuid = item_service.new_row_uuid()
+        with self.transaction() as conn:
+            item_id = item_service.add_item(
+                conn, folder_id, item_service.encrypt_fields(cipher, values, row_uuid), row_uuid
+            )
+        return Item(item_id, folder_id, *(values.get(f) for f in item_service.ITEM_FIELDS), 1)
+
+    def update_item(self, item_id, cipher, version=None, **values):
+        """
+        指定した列だけを更新する。folder_id を渡すと別フォルダへ移す。
+        version（読み込んだときの Item.version）を渡すと、その後に別の場所で
+        更新されていた場合は書き込まずに ItemConflictError を送出する。
+        """
+        unknown = set(values) - {"folder_id", *item_service.ITEM_FIELDS}
+        if unknown:
+            raise TypeError(f"不明な列です: {', '.join(sorted(unknown))}")
+        with self.transaction() as conn:
+            if any(f in values for f in item_service.ENCRYPTED_FIELDS):
+                row_uuid = item_service.get_uuid(conn, item_id)
+                if row_uuid is None:
+                    return False
+                values = item_service.encrypt_fields(cipher, values, row_uuid)
+            return item_service.update_item(conn, item_id, values, version)
+
+    def move_items(self, item_ids, folder_id):
+        """複数のアイテムを1文で folder_id へ移し、移動した件数を返す"""
+        with self.transaction() as conn:
+            return item_service.move_items(conn, item_ids, folder_id)
+
+    def delete_item(self, item_id):
+        with self.transaction() as conn:
+            return item_service.delete_item(conn, item_id)
+
+    def search(self, text, limit=search_service.SEARCH_LIMIT, folder_id=None):
+        rows = search_service.search_items(self.conn, text, limit, folder_id)
+        return [ItemSummary._make(row) for row in rows]
+
+    def item_uuid(self, item_id):
+        """暗号化フィールドを結び付ける行の uuid（無ければ None）"""
+        return item_service.get_uuid(self.conn, item_id)
+
+    def encrypt_pending_rows(self, cipher):
+        return item_service.encrypt_pending_rows(self.conn, cipher)
+
+    # ---------- インポート・バックアップ・同期・監査 ----------
+    # （使うときに初めて読み込み、GUI・CLI の起動時間に含めない）
+
+    def import_file(self, path, root_folder_id, cipher, fmt=None, **kwargs):
+        from services.importer import import_file
+        return import_file(self.conn, path, root_folder_id, cipher, fmt, **kwargs)
+
+    def export(self, path, cipher, incremental=False, progress=None):
+        from services import backup
+        return backup.export_archive(self.conn, path, cipher, incremental, progress)
+
+    def restore(self, path, cipher, progress=None):
+        from services import backup
+        return backup.restore_archive(self.conn, path, cipher, progress)
+
+    def copy_to(self, dest_path, progress=None):
+        from services import backup
+        backup.hot_backup(self.path, dest_path, progress=progress)
+
+    def sync(self, directory, cipher, progress=None):
+        """directory を介して他の端末と同期し、{"exported", "imported"} を返す"""
+        from services import sync_service
+        return sync_service.sync(self.conn, directory, cipher, progress)
+
+    def last_sync_directory(self):
+        from services import sync_service
+        return sync_service.last_directory(self.conn)
+
+    def audit(self, cipher, breach_path=None, workers=None, progress=None):
+        """全アイテムのパスワードを監査し、AuditEntry のリストを返す"""
+        from services.audit import audit_vault
+        return audit_vault(self.conn, cipher, breach_path, workers, progress=progress)
+
+    # ---------- マスターパスワード ----------
+
+    def is_master_password_set(self):
+        return vault_key.is_master_password_set(self.conn)
+
+    def set_master_password(self, password, data_key=None, params=None):
+        return vault_key.set_master_password(self.conn, password, data_key, params)
+
+    def needs_rehash(self):
+        """保存済みの KDF コストがこのマシンの校正値と違えば True"""
+        return vault_key.needs_rehash(self.conn)
+
+    def open_vault(self, password):
+        """正しければデータ鍵、違えば None"""
+        return vault_key.open_vault(self.conn, password)
+
+    def check_data_key(self, data_key):
+        """KDF を通さずに渡されたデータ鍵がこの保管庫のものなら True"""
+        return vault_key.check_data_key(self.conn, data_key)
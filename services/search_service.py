@@ -0,0 +1,62 @@
+from services.folder_service import SUBTREE_IDS
+
+
+# ========== 全文検索 ==========
+#
+# items_fts（FTS5）に対して入力途中の語を前方一致で検索する。
+# 並び順は items_fts の rank（bm25。title > username > url の順に重み付け。
+# 設定はマイグレーション 5 を参照）。暗号化される notes は索引に入れない。
+#
+# 順位付けは一致したすべての行で行い、上位 limit 件だけを返す
+# （LIMIT 付きの ORDER BY なので、並べ替えでは上位 limit 件だけを保持する）。
+# 新しい行に絞ってから順位付けすると、古い行の最良の一致が落ちてしまう。
+# 短い語で何万件も一致すると bm25 の計算に時間がかかるが、検索は入力が止まってから
+# ワーカースレッドで行うので、その間も画面は固まらない。
+
+SEARCH_LIMIT = 50
+
+
+def build_match_query(text):
+    """
+    入力文字列を FTS5 の MATCH 式に変換する。
+    空白で区切った語をそれぞれ "語"* の前方一致にし、すべてを含む行を探す。
+    語は引用符で囲むので、FTS5 の演算子や記号はそのまま文字として扱われる。
+    """
+    terms = []
+    for word in text.split():
+        terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms)
+
+
+def search_items(conn, text, limit=SEARCH_LIMIT, folder_id=None):
+    """
+    text に一致するアイテムを関連度順に最大 limit 件、(id, title) のリストで返す。
+    folder_id を指定すると、そのフォルダと配下のフォルダだけに絞り込む。
+    """
+    query = build_match_query(text)
+    if not query:
+        return []
+
+    if folder_id is None:
+        scope_sql, scope_params = "", ()
+    else:
+        scope_sql, scope_params = f"AND i.folder_id IN ({SUBTREE_IDS}) ", (folder_id,)
+
+    return conn.execute(
+        "SELECT i.id, i.title FROM items_fts "
+        "JOIN items i ON i.id = items_fts.rowid "
+        "WHERE items_fts MATCH ? " + scope_sql +
+        "ORDER BY items_fts.rank LIMIT ?",
+        (query, *scope_params, limit)
+    ).fetchall()
+
+
+# ========== 一括書き込み ==========
+
+# items_fts を同期するトリガ（connection.triggers_suspended で外す）
+FTS_TRIGGERS = "items_fts_*"
+
+
+def rebuild_fts_index(conn):
+    """items_fts を items から作り直す。コミットは呼び出し側で行う"""
+    conn.execute("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
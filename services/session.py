@@ -0,0 +1,74 @@
+import threading
+import time
+
+from services.crypto import FieldCipher
+
+
+# ========== 解錠セッション ==========
+#
+# 解錠時に取り出したデータ鍵をプロセス内に保持し、行の復号は
+# 共通鍵の演算1回で済ませる（KDF は解錠時の1回だけ）。
+# 一定時間使われなければ鍵を捨て、再度マスターパスワードを求める。
+
+DEFAULT_IDLE_TIMEOUT = 5 * 60
+
+
+class SessionLocked(Exception):
+    pass
+
+
+class KeySession:
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._cipher = None
+        self._last_used = 0.0
+        # ロック時に呼ぶ関数（復号済みデータのキャッシュ消去など）
+        self._on_lock = []
+
+    def unlock(self, data_key):
+        with self._lock:
+            self._cipher = FieldCipher(data_key)
+            self._last_used = time.monotonic()
+
+    def lock(self):
+        with self._lock:
+            was_unlocked = self._cipher is not None
+            self._cipher = None
+        if was_unlocked:
+            for callback in list(self._on_lock):
+                callback()
+
+    def add_lock_listener(self, callback):
+        self._on_lock.append(callback)
+
+    def is_unlocked(self):
+        return self._check() is not None
+
+    def _check(self):
+        with self._lock:
+            cipher = self._cipher
+            expired = (
+                cipher is not None and self.idle_timeout
+                and time.monotonic() - self._last_used > self.idle_timeout
+            )
+        if expired:
+            self.lock()
+            return None
+        return cipher
+
+    def cipher(self):
+        """
+        使用中の FieldCipher を返し、最終使用時刻を更新する。
+        未解錠またはアイドルタイムアウト後なら SessionLocked。
+        """
+        cipher = self._check()
+        if cipher is None:
+            raise SessionLocked("保管庫がロックされています")
+        with self._lock:
+            self._last_used = time.monotonic()
+        return cipher
+
+
+# プロセス全体で1つのセッション
+session = KeySession()
@@ -0,0 +1,621 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+
+from services.backup import (
+    BackupFormatError, ChunkWriter, decode_value, encode_value, iter_records, read_header,
+    write_header,
+)
+from services.connection import triggers_suspended
+from services.folder_service import ensure_root_folder
+from services.item_service import (
+    ENCRYPTED_FIELDS, encrypt_pending_rows, is_pending_value, mark_pending_rows
+)
+from services.migrations import SYNC_FIELDS, SYNC_TICK_SQL, SYNC_TRIGGERS
+from services.vault_key import load_master
+
+
+# ========== 端末間の同期 ==========
+#
+# 同じ保管庫の複製（同じデータ鍵を持つ DB ファイル）どうしを、共有ディレクトリ
+# （USB メモリ・ファイル同期サービスのフォルダなど）に置いた差分ファイルで同期する。
+# サーバーは要らず、端末どうしが同時につながっている必要もない。
+#
+# 各行は端末をまたいで変わらない uuid を持ち、トリガ（マイグレーション 12）が
+# 列ごとの最終変更を sync_log に (論理時計, 端末) で記録する。
+# 論理時計はミリ秒の時刻を元にしたハイブリッド論理時計で、取り込んだ変更より
+# 後の変更は必ず大きい値になる。
+#
+#   書き出し: 前回の書き出し以降にこの端末で変わった行を、行全体（列ごとの時計つき）
+#             か墓標として1ファイルに書く。ファイルは追記するだけで書き換えない
+#               <ディレクトリ>/<保管庫>/<端末>/<開始番号>-<終了番号>.pmsync
+#   取り込み: 他の端末のディレクトリから、前回取り込んだ番号より先のファイルを順に読み、
+#             列ごとに (論理時計, 端末 uuid) の大きい方を残す（後勝ち）。
+#             削除はどの変更よりも優先し、墓標のある行は以後の変更でも復活しない
+#
+# どの端末でどの順に取り込んでも、同じ変更を取り込めば同じ内容になる。
+# フォルダの削除で行き場を失ったアイテム・子フォルダと、同時の移動で循環した
+# フォルダはルートへ移し、その移動をこの端末の変更として書き出す。
+#
+# 端末 id は DB の中に持つ。hot_backup（Repository.copy_to）で作った複製は別の端末になるが、
+# ほかの方法でファイルを複製した場合は、複製の側で同期する前に clone コマンド
+# （migrations.mark_sync_clone）を実行すること。同じ端末 id のまま両方で同期すると、
+# 差分ファイルの番号が重なり、他の端末が一方の変更を取りこぼす。
+# 行の uuid と同期の履歴（sync_state.lineage）は同期を始めたとき（マイグレーション 12）に
+# 乱数で決まるので、それより前に分かれた複製どうしは同期できない（SyncError）。
+#
+# ファイルの形式は services.backup の暗号化アーカイブと同じ（kind = "sync"）で、
+# データ鍵で暗号化する。保管庫のディレクトリ名は鍵の照合値なので、
+# 別の保管庫の差分を読むことはない。
+
+SYNC_SUFFIX = ".pmsync"
+_FILE_NAME = re.compile(r"^(\d{12})-(\d{12})" + re.escape(SYNC_SUFFIX) + "$")
+# 端末のディレクトリ名（端末の uuid）。同期サービスが作る別名のコピーなどは読まない
+_DEVICE_NAME = re.compile(r"^[0-9a-f]{32}$")
+
+_RECORD_TYPES = {"folders": "folder", "items": "item"}
+_ENTITIES = {record_type: entity for entity, record_type in _RECORD_TYPES.items()}
+# 他の行を uuid で指す列（フォルダの親、アイテムのフォルダ）
+_REF_FIELDS = {"folders": "parent", "items": "folder"}
+_ITEM_CONTENT_FIELDS = {"title", "username", "password", "url", "notes"}
+# 時計の無い列（同期を始める前からある行）の時計。どの変更にも負ける
+_NO_STAMP = (0, "")
+
+
+class SyncError(ValueError):
+    pass
+
+
+# ---------- 状態 ----------
+
+def vault_directory(conn, directory):
+    """directory の中の、この保管庫の差分を置くディレクトリ"""
+    row = load_master(conn)
+    if row is None or row[2] is None:
+        raise SyncError("マスターパスワードを設定してから同期してください")
+    return os.path.join(directory, bytes(row[2]).hex())
+
+
+def local_device(conn):
+    """この端末の (sync_devices.id, uuid)"""
+    return conn.execute(
+        "SELECT d.id, d.uuid FROM sync_state s JOIN sync_devices d ON d.id = s.device "
+        "WHERE s.id = 1"
+    ).fetchone()
+
+
+def local_lineage(conn):
+    """この端末の同期の履歴の id（複製元と複製で同じ）"""
+    return conn.execute("SELECT lineage FROM sync_state WHERE id = 1").fetchone()[0]
+
+
+def last_directory(conn):
+    """前回同期したディレクトリ（無ければ None）"""
+    return conn.execute("SELECT directory FROM sync_state WHERE id = 1").fetchone()[0]
+
+
+def list_sync_files(device_dir):
+    """device_dir の差分ファイルを (開始番号, 終了番号, パス) で番号順に返す"""
+    files = []
+    for name in os.listdir(device_dir):
+        m = _FILE_NAME.match(name)
+        if m:
+            files.append((int(m.group(1)), int(m.group(2)), os.path.join(device_dir, name)))
+    return sorted(files)
+
+
+def _local_stamps(conn, entity, uuid, local_uuid):
+    """行の列ごとの (論理時計, 端末 uuid)。'*' は行全体、'-' は墓標"""
+    rows = conn.execute(
+        "SELECT l.field, l.clock, d.uuid FROM sync_log l "
+        "LEFT JOIN sync_devices d ON d.id = l.device WHERE l.entity = ? AND l.uuid = ?",
+        (entity, uuid)
+    )
+    return {field: (clock, device or local_uuid) for field, clock, device in rows}
+
+
+def _effective(stamps, field):
+    return max(stamps.get(field, _NO_STAMP), stamps.get("*", _NO_STAMP))
+
+
+# ---------- 書き出し ----------
+
+def _row_query(entity):
+    """sync_log の行（uuid 順）に、今の行の値を付けて返す SQL"""
+    ref_column = SYNC_FIELDS[entity][0][1]
+    columns = ", ".join(f"t.{column}" for _, column in SYNC_FIELDS[entity][1:])
+    # 参照先がまだ届いていない行は、届いたときに付け替える先（sync_orphans）を書く
+    return (
+        "SELECT l.uuid, l.field, l.clock, d.uuid, t.id, "
+        f"lower(hex(COALESCE(o.ref, r.uuid))), {columns} "
+        "FROM sync_log l "
+        "LEFT JOIN sync_devices d ON d.id = l.device "
+        f"LEFT JOIN {entity} t ON t.uuid = l.uuid "
+        f"LEFT JOIN folders r ON r.id = t.{ref_column} "
+        "LEFT JOIN sync_orphans o ON o.entity = l.entity AND o.uuid = l.uuid "
+        "WHERE l.entity = ? AND l.uuid IN "
+        "(SELECT uuid FROM sync_log WHERE seq > ? AND seq <= ? AND entity = ?) "
+        "ORDER BY l.uuid"
+    )
+
+
+def _changed_records(conn, since, until, local_uuid):
+    """since より後・until まででこの端末が変えた行のレコードを返す"""
+    for entity, record_type in _RECORD_TYPES.items():
+        fields = [field for field, _ in SYNC_FIELDS[entity]]
+        rows = conn.execute(_row_query(entity), (entity, since, until, entity))
+        for uuid, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            stamps = {field: (clock, device or local_uuid)
+                      for _, field, clock, device, *_ in group}
+            if "-" in stamps:
+                yield {"t": "delete", "e": entity, "id": uuid.hex(), "c": stamps["-"][0]}
+                continue
+            row_id, ref, *values = group[0][4:]
+            if row_id is None:
+                continue
+            record = {}
+            for field, value in zip(fields, [ref or None, *values]):
+                clock, device = _effective(stamps, field)
+                stamp = [clock, encode_value(value)]
+                if device != local_uuid:
+                    stamp.append(device)
+                record[field] = stamp
+            yield {"t": record_type, "id": uuid.hex(), "f": record}
+
+
+def export_changes(conn, directory, cipher, progress=None):
+    """
+    前回の書き出し以降のこの端末の変更を directory に書き出し、
+    {"path", "since", "until", "folders", "items", "deletes"} を返す
+    （変更が無ければ path は None でファイルを作らない）。
+
+    読み出しは1つの読み取りトランザクションで行い（export_archive と同じ）、
+    一時ファイルに書いてから置き換える。
+    """
+    vault_dir = vault_directory(conn, directory)
+    counts = {"folders": 0, "items": 0, "deletes": 0}
+
+    tmp_path = None
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        since, until, base = conn.execute(
+            "SELECT exported_seq, seq, base_seq FROM sync_state WHERE id = 1"
+        ).fetchone()
+        _, local_uuid = local_device(conn)
+        if until == since:
+            conn.rollback()
+            return {"path": None, "since": since, "until": until, **counts}
+
+        device_dir = os.path.join(vault_dir, local_uuid)
+        os.makedirs(device_dir, exist_ok=True)
+        path = os.path.join(device_dir, f"{since:012d}-{until:012d}{SYNC_SUFFIX}")
+        tmp_path = path + ".tmp"
+        header = {"kind": "sync", "device": local_uuid, "lineage": local_lineage(conn),
+                  "since": since, "until": until, "base": base}
+        with open(tmp_path, "wb") as fp:
+            writer = ChunkWriter(fp, cipher, write_header(fp, header))
+            chunks = 0
+            for record in _changed_records(conn, since, until, local_uuid):
+                writer.write(record)
+                counts["deletes" if record["t"] == "delete" else record["t"] + "s"] += 1
+                if progress is not None and writer.index != chunks:
+                    chunks = writer.index
+                    progress(sum(counts.values()))
+            writer.close()
+            fp.flush()
+            os.fsync(fp.fileno())
+    except BaseException:
+        conn.rollback()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    conn.rollback()
+
+    os.replace(tmp_path, path)
+    with conn:
+        conn.execute(
+            "UPDATE sync_state SET exported_seq = MAX(exported_seq, ?), directory = ? WHERE id = 1",
+            (until, os.path.abspath(directory))
+        )
+    return {"path": path, "since": since, "until": until, **counts}
+
+
+# ---------- 取り込み ----------
+
+class _Merge:
+    """1回の取り込み（1トランザクション）で、レコードを列ごとの後勝ちで適用する"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.local_id, self.local_uuid = local_device(conn)
+        self.device_ids = {uuid: device_id for device_id, uuid
+                           in conn.execute("SELECT id, uuid FROM sync_devices")}
+        self.root = ensure_root_folder(conn)
+        self.root_uuid = conn.execute(
+            "SELECT uuid FROM folders WHERE id = ?", (self.root,)
+        ).fetchone()[0]
+        self.max_clock = 0
+        # 参照（親・フォルダ）の付け替えは全レコードを読んでからまとめて行う
+        # （参照先が後のレコードで届くことがあるため）。(entity, uuid) -> (参照先, 時計)
+        self.moves = {}
+        # 削除するフォルダの id（中身を逃がしてから最後に消す）
+        self.doomed_folders = set()
+        self.counts = {"folders": 0, "items": 0, "deletes": 0, "rescued": 0}
+        # 行の uuid に結び付ける前の形式の暗号文を書き込んだか
+        self.pending = False
+
+    def device_id(self, uuid):
+        if uuid == self.local_uuid:
+            return self.local_id
+        device_id = self.device_ids.get(uuid)
+        if device_id is None:
+            device_id = self.conn.execute(
+                "INSERT INTO sync_devices (uuid) VALUES (?)", (uuid,)
+            ).lastrowid
+            self.device_ids[uuid] = device_id
+        return device_id
+
+    def log(self, entity, uuid, field, stamp):
+        clock, device = stamp
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_log (entity, uuid, field, clock, device, seq) "
+            "VALUES (?, ?, ?, ?, ?, NULL)",
+            (entity, uuid, field, clock, self.device_id(device))
+        )
+
+    def log_local(self, entity, uuid, field):
+        """この端末の変更として記録する（トリガを外しているので手で時計を進める）"""
+        self.conn.execute(SYNC_TICK_SQL)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_log (entity, uuid, field, clock, device, seq) "
+            "SELECT ?, ?, ?, clock, NULL, seq FROM sync_state WHERE id = 1",
+            (entity, uuid, field)
+        )
+
+    # ---------- レコード ----------
+
+    def apply(self, record, device):
+        kind = record["t"]
+        if kind == "delete":
+            if record["e"] not in _RECORD_TYPES:
+                raise BackupFormatError(f"不明なレコードです: {record['e']}")
+            self.max_clock = max(self.max_clock, record["c"])
+            self.apply_delete(record["e"], bytes.fromhex(record["id"]), (record["c"], device))
+        elif kind in _ENTITIES:
+            incoming = {
+                field: ((stamp[0], stamp[2] if len(stamp) > 2 else device), decode_value(stamp[1]))
+                for field, stamp in record["f"].items()
+            }
+            self.max_clock = max([self.max_clock, *(s[0] for s, _ in incoming.values())])
+            self.apply_row(_ENTITIES[kind], bytes.fromhex(record["id"]), incoming)
+        else:
+            raise BackupFormatError(f"不明なレコードです: {kind}")
+
+    def apply_row(self, entity, uuid, incoming):
+        stamps = _local_stamps(self.conn, entity, uuid, self.local_uuid)
+        if "-" in stamps:
+            return
+        fields = SYNC_FIELDS[entity]
+        ref_field = _REF_FIELDS[entity]
+        row = self.conn.execute(f"SELECT id FROM {entity} WHERE uuid = ?", (uuid,)).fetchone()
+        if row is None:
+            missing = [field for field, _ in fields if field not in incoming]
+            if missing:
+                raise BackupFormatError(f"行の列が足りません: {', '.join(missing)}")
+            winners = [field for field, _ in fields]
+        else:
+            winners = [field for field, _ in fields
+                       if field in incoming and incoming[field][0] > _effective(stamps, field)]
+            if not winners:
+                return
+
+        values = {column: incoming[field][1]
+                  for field, column in fields if field in winners and field != ref_field}
+        if entity == "items" and not self.pending:
+            self.pending = any(is_pending_value(values.get(c)) for c in ENCRYPTED_FIELDS)
+        if row is None:
+            # 参照先は後で付け替えるので、いったんルートに置く
+            ref_column = fields[0][1]
+            columns = [ref_column, *values, "uuid"]
+            self.conn.execute(
+                f"INSERT INTO {entity} ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                (self.root, *values.values(), uuid)
+            )
+        elif values:
+            assignments = [f"{column} = ?" for column in values]
+            if entity == "items" and _ITEM_CONTENT_FIELDS & set(winners):
+                assignments.append("version = version + 1")
+            self.conn.execute(
+                f"UPDATE {entity} SET {', '.join(assignments)} WHERE id = ?",
+                (*values.values(), row[0])
+            )
+        if ref_field in winners:
+            self.moves[entity, uuid] = incoming[ref_field][1], incoming[ref_field][0]
+
+        # 新しい行の列がすべて同じ時計（1回の追加）なら '*' 1行で記録する
+        new_stamps = {incoming[field][0] for field in winners}
+        if row is None and len(new_stamps) == 1:
+            if _NO_STAMP not in new_stamps:
+                self.log(entity, uuid, "*", new_stamps.pop())
+        else:
+            for field in winners:
+                if incoming[field][0] != _NO_STAMP:
+                    self.log(entity, uuid, field, incoming[field][0])
+        self.counts[entity] += 1
+
+    def apply_delete(self, entity, uuid, stamp):
+        self.conn.execute("DELETE FROM sync_log WHERE entity = ? AND uuid = ?", (entity, uuid))
+        self.conn.execute("DELETE FROM sync_orphans WHERE entity = ? AND uuid = ?", (entity, uuid))
+        self.log(entity, uuid, "-", stamp)
+        self.moves.pop((entity, uuid), None)
+        if entity == "items":
+            self.conn.execute("DELETE FROM items WHERE uuid = ?", (uuid,))
+        else:
+            row = self.conn.execute("SELECT id FROM folders WHERE uuid = ?", (uuid,)).fetchone()
+            if row is not None and row[0] != self.root:
+                self.doomed_folders.add(row[0])
+        self.counts["deletes"] += 1
+
+    # ---------- 参照の付け替え・削除 ----------
+
+    def rescue(self, entity, row_id, uuid):
+        """行き場の無い行をルートへ移し、この端末の変更として記録する"""
+        column = SYNC_FIELDS[entity][0][1]
+        self.conn.execute(f"UPDATE {entity} SET {column} = ? WHERE id = ?", (self.root, row_id))
+        self.conn.execute("DELETE FROM sync_orphans WHERE entity = ? AND uuid = ?", (entity, uuid))
+        self.log_local(entity, uuid, _REF_FIELDS[entity])
+        self.counts["rescued"] += 1
+
+    def parent_stamp(self, folder_id):
+        uuid = self.conn.execute("SELECT uuid FROM folders WHERE id = ?", (folder_id,)).fetchone()[0]
+        return _effective(_local_stamps(self.conn, "folders", uuid, self.local_uuid), "parent")
+
+    def move_folder(self, folder_id, uuid, target, stamp):
+        """
+        folder_id を target の下へ移す。移すと循環する（target が配下にある）なら、
+        循環の中で親の時計が最も古いフォルダをルートへ移して切る
+        """
+        path = [descendant for descendant, in self.conn.execute(
+            "SELECT descendant FROM folder_closure WHERE ancestor = ? AND descendant IN "
+            "(SELECT ancestor FROM folder_closure WHERE descendant = ?)",
+            (folder_id, target)
+        )]
+        if path:
+            oldest = min([(self.parent_stamp(f), f) for f in path if f != folder_id]
+                         + [(stamp, folder_id)])[1]
+            oldest_uuid = self.conn.execute(
+                "SELECT uuid FROM folders WHERE id = ?", (oldest,)
+            ).fetchone()[0]
+            self.rescue("folders", oldest, oldest_uuid)
+            if oldest == folder_id:
+                return
+        self.conn.execute("UPDATE folders SET parent_id = ? WHERE id = ?", (target, folder_id))
+
+    def resolve_moves(self):
+        # 前回までに参照先が届いていなかった行も、ここでもう一度付け替えを試みる
+        for entity, uuid, ref in self.conn.execute(
+                "SELECT entity, uuid, ref FROM sync_orphans").fetchall():
+            if (entity, uuid) not in self.moves:
+                self.moves[entity, uuid] = ref.hex(), None
+
+        for (entity, uuid), (ref, stamp) in self.moves.items():
+            row = self.conn.execute(f"SELECT id FROM {entity} WHERE uuid = ?", (uuid,)).fetchone()
+            if row is None:
+                self.conn.execute(
+                    "DELETE FROM sync_orphans WHERE entity = ? AND uuid = ?", (entity, uuid)
+                )
+                continue
+            ref = bytes.fromhex(ref) if ref else self.root_uuid
+            target = self.conn.execute("SELECT id FROM folders WHERE uuid = ?", (ref,)).fetchone()
+            if target is None or target[0] in self.doomed_folders:
+                if target is None and "-" not in _local_stamps(
+                        self.conn, "folders", ref, self.local_uuid):
+                    # まだ届いていないフォルダ。届くまでは今の場所に置いておく
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sync_orphans (entity, uuid, ref) VALUES (?, ?, ?)",
+                        (entity, uuid, ref)
+                    )
+                else:
+                    self.rescue(entity, row[0], uuid)
+                continue
+            self.conn.execute("DELETE FROM sync_orphans WHERE entity = ? AND uuid = ?", (entity, uuid))
+            if entity == "items":
+                self.conn.execute("UPDATE items SET folder_id = ? WHERE id = ?", (target[0], row[0]))
+            elif row[0] != self.root:
+                if stamp is None:
+                    stamp = self.parent_stamp(row[0])
+                self.move_folder(row[0], uuid, target[0], stamp)
+
+    def delete_folders(self):
+        """削除されたフォルダに残っている（他の端末では知らない）行をルートへ移してから消す"""
+        for folder_id in self.doomed_folders:
+            for entity, column in (("items", "folder_id"), ("folders", "parent_id")):
+                rows = self.conn.execute(
+                    f"SELECT id, uuid FROM {entity} WHERE {column} = ?", (folder_id,)
+                ).fetchall()
+                for row_id, uuid in rows:
+                    if entity == "items" or row_id not in self.doomed_folders:
+                        self.rescue(entity, row_id, uuid)
+        for folder_id in self.doomed_folders:
+            # 配下の削除予定のフォルダは、ここで親より先に消えていることがある
+            self.conn.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
+
+
+def pending_files(conn, directory):
+    """
+    取り込む差分ファイルを端末ごとに {端末 uuid: [(開始番号, 終了番号, パス), ...]} で、
+    番号が飛んでいて先へ進めない端末を [端末 uuid, ...] で返す。
+    まだ取り込んだことの無い端末は、その端末として書き始めた番号（ヘッダの base）から読む
+    """
+    vault_dir = vault_directory(conn, directory)
+    _, local_uuid = local_device(conn)
+    cursors = dict(conn.execute("SELECT uuid, imported_seq FROM sync_devices"))
+    pending = {}
+    gaps = []
+    if not os.path.isdir(vault_dir):
+        return pending, gaps
+    for device in sorted(os.listdir(vault_dir)):
+        device_dir = os.path.join(vault_dir, device)
+        if (device == local_uuid or not _DEVICE_NAME.match(device)
+                or not os.path.isdir(device_dir)):
+            continue
+        cursor = cursors.get(device)
+        for since, until, path in list_sync_files(device_dir):
+            if cursor is not None and until <= cursor:
+                continue
+            if cursor is None:
+                with open(path, "rb") as fp:
+                    cursor = read_header(fp)[0]["base"]
+            if since > cursor:
+                gaps.append(device)
+                break
+            pending.setdefault(device, []).append((since, until, path))
+            cursor = until
+    return pending, gaps
+
+
+def import_changes(conn, directory, cipher, progress=None):
+    """
+    他の端末の差分を directory から取り込み、
+    {"files", "folders", "items", "deletes", "rescued", "gaps"} を返す。
+    folders / items / deletes は実際に変わった行の数、rescued はルートへ移した行の数、
+    gaps は差分ファイルが欠けていて途中までしか取り込めなかった端末の uuid。
+
+    全体を1トランザクションで行うので、鍵が違う・壊れたファイルがあれば
+    DecryptionError / BackupFormatError で何も取り込まない。
+    同期の履歴を共有していない端末（別々に同期を始めた複製）の差分があれば SyncError。
+    progress(読んだファイル数) をファイルごとに呼ぶ。
+    """
+    conn.commit()
+    pending, gaps = pending_files(conn, directory)
+    files = 0
+    lineage = local_lineage(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        merge = _Merge(conn)
+        with triggers_suspended(conn, SYNC_TRIGGERS):
+            for device, device_files in pending.items():
+                for since, until, path in device_files:
+                    with open(path, "rb") as fp:
+                        header, digest = read_header(fp)
+                        if header.get("kind") != "sync" or header.get("device") != device:
+                            raise BackupFormatError(f"同期の差分ファイルではありません: {path}")
+                        if header.get("lineage") != lineage:
+                            raise SyncError(
+                                f"端末 {device} はこの端末と同期の履歴を共有していません"
+                                "（同期を始める前に別々に複製された保管庫です）。"
+                                "どちらか一方を残し、もう一方はその複製から作り直してください"
+                            )
+                        for record in iter_records(fp, cipher, digest):
+                            merge.apply(record, device)
+                    files += 1
+                    if progress is not None:
+                        progress(files)
+                conn.execute(
+                    "UPDATE sync_devices SET imported_seq = ? WHERE id = ?",
+                    (device_files[-1][1], merge.device_id(device))
+                )
+            # この後の変更が、取り込んだどの変更よりも新しい時計になるように進める
+            conn.execute(
+                "UPDATE sync_state SET clock = MAX(clock, ?), directory = ? WHERE id = 1",
+                (merge.max_clock, os.path.abspath(directory))
+            )
+            merge.resolve_moves()
+            merge.delete_folders()
+            if merge.pending:
+                mark_pending_rows(conn)
+    # 行の uuid に結び付ける前の形式の暗号文が届いていれば、ここで変換する
+    encrypt_pending_rows(conn, cipher)
+    return {"files": files, **merge.counts, "gaps": gaps}
+
+
+def sync(conn, directory, cipher, progress=None):
+    """この端末の変更を書き出してから、他の端末の変更を取り込む"""
+    exported = export_changes(conn, directory, cipher)
+    imported = import_changes(conn, directory, cipher, progress)
+    return {"exported": exported, "imported": imported}
+
+
+def sync_status(conn, directory=None):
+    """この端末の状態と、directory にある未取り込みの差分ファイルの数"""
+    _, local_uuid = local_device(conn)
+    seq, exported = conn.execute(
+        "SELECT seq, exported_seq FROM sync_state WHERE id = 1"
+    ).fetchone()
+    status = {
+        "device": local_uuid,
+        "unexported": seq - exported,
+        "directory": directory or last_directory(conn),
+        "devices": {uuid: imported for uuid, imported in conn.execute(
+            "SELECT uuid, imported_seq FROM sync_devices WHERE uuid != ? ORDER BY id",
+            (local_uuid,)
+        )},
+    }
+    if status["directory"] is not None:
+        pending, gaps = pending_files(conn, status["directory"])
+        status["pending"] = {device: len(files) for device, files in pending.items()}
+        status["gaps"] = gaps
+    return status
+
+
+# ========== コマンドライン ==========
+
+def main(argv=None):
+    """
+    python -m services.sync_service [--db DB] sync DIR
+    python -m services.sync_service [--db DB] export DIR
+    python -m services.sync_service [--db DB] import DIR
+    python -m services.sync_service [--db DB] status [DIR]
+    python -m services.sync_service [--db DB] clone
+    マスターパスワードは環境変数 PM_MASTER_PASSWORD か標準入力から読む（status・clone では不要）。
+    """
+    from services.backup import open_cipher
+    from services.connection import get_connection
+    from services.migrations import mark_sync_clone, migrate
+
+    parser = argparse.ArgumentParser(prog="python -m services.sync_service")
+    parser.add_argument("--db", default="password_manager.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("sync", "変更を書き出してから他の端末の変更を取り込む"),
+        ("export", "この端末の変更を書き出す"),
+        ("import", "他の端末の変更を取り込む"),
+    ):
+        sub.add_parser(name, help=help_text).add_argument("directory")
+    sub.add_parser("status", help="同期の状態を表示する").add_argument("directory", nargs="?")
+    sub.add_parser("clone", help="複製した DB を、複製元とは別の端末にする")
+    args = parser.parse_args(argv)
+
+    conn = get_connection(args.db)
+    migrate(conn)
+    if args.command == "status":
+        print(json.dumps(sync_status(conn, args.directory), ensure_ascii=False, indent=2))
+        return 0
+    if args.command == "clone":
+        mark_sync_clone(conn)
+        print(json.dumps({"device": local_device(conn)[1]}))
+        return 0
+
+    password = os.environ.get("PM_MASTER_PASSWORD")
+    if password is None:
+        password = sys.stdin.readline().rstrip("\n")
+    cipher = open_cipher(conn, password)
+
+    if args.command == "sync":
+        result = sync(conn, args.directory, cipher)
+    elif args.command == "export":
+        result = export_changes(conn, args.directory, cipher)
+    else:
+        result = import_changes(conn, args.directory, cipher)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
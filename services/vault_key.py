@@ -0,0 +1,91 @@
+import hashlib
+import hmac
+
+from services import kdf
+from services.crypto import new_data_key, wrap_key, unwrap_key
+
+
+# ========== マスターパスワードとデータ鍵 ==========
+#
+# master テーブルには KDF の検証値（password）と、
+# KDF の導出鍵で包んだデータ鍵（wrapped_key）を保存する。
+# マスターパスワードを変えても包み直すだけで、各行の暗号文は変わらない。
+#
+# key_check はデータ鍵の鍵付きハッシュ。CLI のセッショントークンのように
+# KDF を通さずに渡されたデータ鍵が、この保管庫のものか確かめるのに使う。
+
+
+def load_master(conn):
+    """(検証値, 包んだデータ鍵, 鍵の照合値) を返す。未設定なら None"""
+    return conn.execute(
+        "SELECT password, wrapped_key, key_check FROM master WHERE id = 1"
+    ).fetchone()
+
+
+def key_check(data_key):
+    return hashlib.blake2b(b"data-key-check", key=data_key, digest_size=16).digest()
+
+
+def check_data_key(conn, data_key):
+    """data_key がこの保管庫のデータ鍵なら True"""
+    row = load_master(conn)
+    if row is None or row[2] is None:
+        return False
+    return hmac.compare_digest(key_check(data_key), bytes(row[2]))
+
+
+def is_master_password_set(conn):
+    return load_master(conn) is not None
+
+
+def set_master_password(conn, password, data_key=None, params=None):
+    """
+    password を新しいマスターパスワードとして保存し、データ鍵を返す。
+    data_key を省略すると新しいデータ鍵を作る（初回設定時）。
+    """
+    if data_key is None:
+        data_key = new_data_key()
+    encoded, kek = kdf.create(password, params)
+    with conn:
+        conn.execute("DELETE FROM master")
+        conn.execute(
+            "INSERT INTO master (id, password, wrapped_key, key_check) VALUES (1, ?, ?, ?)",
+            (encoded, wrap_key(kek, data_key), key_check(data_key))
+        )
+    return data_key
+
+
+def needs_rehash(conn):
+    """保存済みの KDF コストがこのマシンの校正値と違えば True（未設定なら False）"""
+    row = load_master(conn)
+    return row is not None and kdf.needs_rehash(row[0])
+
+
+def open_vault(conn, password):
+    """
+    password が正しければデータ鍵を、違えば None を返す。
+    データ鍵がまだ無い保管庫（暗号化導入前）ではここで作って保存する。
+    """
+    row = load_master(conn)
+    if row is None:
+        return None
+    encoded, wrapped, check = row
+    kek = kdf.unlock(password, encoded)
+    if kek is None:
+        return None
+    if wrapped is not None:
+        data_key = unwrap_key(kek, wrapped)
+        if check is None:
+            with conn:
+                conn.execute(
+                    "UPDATE master SET key_check = ? WHERE id = 1", (key_check(data_key),)
+                )
+        return data_key
+
+    data_key = new_data_key()
+    with conn:
+        conn.execute(
+            "UPDATE master SET wrapped_key = ?, key_check = ? WHERE id = 1",
+            (wrap_key(kek, data_key), key_check(data_key))
+        )
+    return data_key
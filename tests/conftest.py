@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+# リポジトリの直下（services パッケージ）を import できるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import kdf
+from services.connection import close_connection
+from services.crypto import FieldCipher
+from services.repository import Repository
+
+
+MASTER_PASSWORD = "pw"
+
+
+def open_repository(path):
+    """path の保管庫を最新のスキーマで開く"""
+    repo = Repository(str(path))
+    repo.init()
+    return repo
+
+
+@pytest.fixture
+def repositories():
+    """テスト中に開いた Repository の接続を、終わったら閉じる"""
+    opened = []
+
+    def open_(path):
+        repo = open_repository(path)
+        opened.append(repo)
+        return repo
+
+    yield open_
+    for repo in opened:
+        close_connection(repo.path)
+
+
+@pytest.fixture
+def vault(tmp_path, repositories):
+    """マスターパスワードを設定した空の保管庫と、そのデータ鍵の FieldCipher"""
+    repo = repositories(tmp_path / "vault.db")
+    # 校正すると数百ミリ秒かかるので、最小のコストで包む
+    data_key = repo.set_master_password(MASTER_PASSWORD, params=kdf.default_params())
+    return repo, FieldCipher(data_key)
@@ -0,0 +1,153 @@
+import pytest
+
+from conftest import MASTER_PASSWORD
+from services import kdf
+from services.autosave import AutosaveBuffer
+from services.backup import BackupFormatError
+from services.crypto import DecryptionError, FieldCipher, new_data_key
+from services.folder_service import check_folder_closure, check_folder_stats
+from services.sync_service import local_device, local_lineage
+
+
+def snapshot(repo, cipher):
+    """フォルダと復号したアイテムの内容（比較用）"""
+    folders = sorted(repo.list_folders())
+    ids = [row[0] for row in repo.conn.execute("SELECT id FROM items")]
+    items = sorted(repo.get_items(ids, cipher))
+    return folders, [item._replace(version=None) for item in items]
+
+
+def fill(repo, cipher):
+    root = repo.root_folder_id()
+    work = repo.add_folder(root, "仕事")
+    deep = repo.add_folder(work.id, "深い")
+    items = [
+        repo.add_item(root, cipher, title="メール", username="me", password="p1", notes="メモ"),
+        repo.add_item(work.id, cipher, title="VPN", password="p2"),
+        repo.add_item(deep.id, cipher, title="サーバー", password="p3", url="ssh://host"),
+    ]
+    return work, deep, items
+
+
+@pytest.fixture
+def target(tmp_path, repositories, vault):
+    """vault と同じデータ鍵を持つ、空の復元先"""
+    data_key = vault[0].open_vault(MASTER_PASSWORD)
+    repo = repositories(tmp_path / "restored.db")
+    repo.set_master_password(MASTER_PASSWORD, data_key, params=kdf.default_params())
+    with repo.transaction() as conn:
+        conn.execute("DELETE FROM folders")
+    return repo
+
+
+def test_full_round_trip(vault, target, tmp_path):
+    repo, cipher = vault
+    fill(repo, cipher)
+    path = str(tmp_path / "full.pmbackup")
+    result = repo.export(path, cipher)
+    assert (result["kind"], result["folders"], result["items"]) == ("full", 3, 3)
+
+    assert target.restore(path, cipher)["items"] == 3
+    assert snapshot(target, cipher) == snapshot(repo, cipher)
+    assert check_folder_closure(target.conn) == (0, 0)
+    assert check_folder_stats(target.conn) == []
+    assert [title for _, title in target.search("サーバ")] == ["サーバー"]
+
+
+def test_incremental_after_full(vault, target, tmp_path):
+    repo, cipher = vault
+    work, deep, items = fill(repo, cipher)
+    full = str(tmp_path / "full.pmbackup")
+    repo.export(full, cipher)
+
+    repo.update_item(items[0].id, cipher, password="changed")
+    repo.delete_item(items[1].id)
+    repo.delete_folder(deep.id)
+    repo.add_item(work.id, cipher, title="新しい")
+    incremental = str(tmp_path / "incr.pmbackup")
+    result = repo.export(incremental, cipher, incremental=True)
+    assert result["kind"] == "incremental"
+    assert result["items"] == 2
+
+    target.restore(full, cipher)
+    target.restore(incremental, cipher)
+    assert snapshot(target, cipher) == snapshot(repo, cipher)
+    assert check_folder_stats(target.conn) == []
+
+
+def test_restore_over_existing_rows_bumps_version(vault, tmp_path):
+    repo, cipher = vault
+    _, _, items = fill(repo, cipher)
+    path = str(tmp_path / "full.pmbackup")
+    repo.export(path, cipher)
+    repo.update_item(items[0].id, cipher, password="after backup")
+    stale = repo.get_item(items[0].id).version
+
+    repo.restore(path, cipher)
+    assert repo.get_item(items[0].id, cipher).password == "p1"
+    assert repo.get_item(items[0].id).version > stale
+    # 復元前に読んだ版での自動保存は衝突になり、復元した内容を上書きしない
+    autosave = AutosaveBuffer(repo)
+    autosave.edit(items[0].id, stale, "password", "stale edit", cipher)
+    assert autosave.flush()[1] == [items[0].id]
+    assert repo.get_item(items[0].id, cipher).password == "p1"
+
+
+def test_tampered_archive_writes_nothing(vault, target, tmp_path):
+    repo, cipher = vault
+    fill(repo, cipher)
+    path = tmp_path / "full.pmbackup"
+    repo.export(str(path), cipher)
+    data = bytearray(path.read_bytes())
+    data[-5] ^= 0x01
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(DecryptionError):
+        target.restore(str(path), cipher)
+    assert target.list_folders() == []
+    assert target.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+
+
+def test_wrong_key_and_not_an_archive(vault, target, tmp_path):
+    repo, cipher = vault
+    fill(repo, cipher)
+    path = str(tmp_path / "full.pmbackup")
+    repo.export(path, cipher)
+    with pytest.raises(DecryptionError):
+        target.restore(path, FieldCipher(new_data_key()))
+
+    other = tmp_path / "other.pmbackup"
+    other.write_bytes(b"not a backup")
+    with pytest.raises(BackupFormatError):
+        target.restore(str(other), cipher)
+
+
+def test_restore_converts_legacy_rows(vault, target, tmp_path):
+    repo, cipher = vault
+    _, _, items = fill(repo, cipher)
+    # 行に結び付ける前の形式（平文・旧形式の暗号文）で書き出されたアーカイブ
+    with repo.transaction() as conn:
+        conn.execute(
+            "UPDATE items SET password = ?, notes = '平文のメモ' WHERE id = ?",
+            (cipher.encrypt("旧形式".encode("utf-8"), b"password"), items[0].id)
+        )
+    path = str(tmp_path / "legacy.pmbackup")
+    repo.export(path, cipher)
+
+    # 変換の要る行が無い状態から、復元した値だけで変換の印が立つこと
+    target.encrypt_pending_rows(cipher)
+    target.restore(path, cipher)
+    item = target.get_item(items[0].id, cipher)
+    assert (item.password, item.notes) == ("旧形式", "平文のメモ")
+    assert target.conn.execute("SELECT pending_rows FROM vault_state").fetchone()[0] == 0
+
+
+def test_copy_is_a_new_sync_device(vault, tmp_path, repositories):
+    repo, cipher = vault
+    fill(repo, cipher)
+    dest = tmp_path / "copy.db"
+    repo.copy_to(str(dest))
+    copy = repositories(dest)
+    assert snapshot(copy, cipher) == snapshot(repo, cipher)
+    assert local_device(copy.conn)[1] != local_device(repo.conn)[1]
+    assert local_lineage(copy.conn) == local_lineage(repo.conn)
@@ -0,0 +1,98 @@
+import pytest
+
+from services.crypto import (
+    FieldCipher, DecryptionError, VERSION, ROW_VERSION, new_data_key, wrap_key, unwrap_key
+)
+
+
+UUID_A = bytes(range(16))
+UUID_B = bytes(range(1, 17))
+
+
+@pytest.fixture
+def cipher():
+    return FieldCipher(new_data_key())
+
+
+@pytest.mark.parametrize("text", ["", "secret", "パスワード🔑", "x" * 10000])
+def test_text_round_trip(cipher, text):
+    blob = cipher.encrypt_text(text, "password", UUID_A)
+    assert blob[:1] == ROW_VERSION
+    assert cipher.decrypt_text(blob, "password", UUID_A) == text
+
+
+def test_none_and_plaintext_pass_through(cipher):
+    assert cipher.encrypt_text(None, "notes", UUID_A) is None
+    assert cipher.decrypt_text(None, "notes", UUID_A) is None
+    # 移行前の平文はそのまま読める
+    assert cipher.decrypt_text("平文", "notes", UUID_A) == "平文"
+
+
+def test_nonce_differs_each_time(cipher):
+    assert cipher.encrypt_text("same", "password", UUID_A) != \
+        cipher.encrypt_text("same", "password", UUID_A)
+
+
+def test_bound_to_row(cipher):
+    blob = cipher.encrypt_text("secret", "password", UUID_A)
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_text(blob, "password", UUID_B)
+
+
+def test_bound_to_field(cipher):
+    blob = cipher.encrypt_text("secret", "password", UUID_A)
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_text(blob, "notes", UUID_A)
+
+
+def test_wrong_key(cipher):
+    blob = cipher.encrypt_text("secret", "password", UUID_A)
+    with pytest.raises(DecryptionError):
+        FieldCipher(new_data_key()).decrypt_text(blob, "password", UUID_A)
+
+
+@pytest.mark.parametrize("position", [1, 20, -1])
+def test_tampering_detected(cipher, position):
+    blob = bytearray(cipher.encrypt_text("secret", "password", UUID_A))
+    blob[position] ^= 0x01
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_text(bytes(blob), "password", UUID_A)
+
+
+def test_row_uuid_required(cipher):
+    with pytest.raises(ValueError):
+        cipher.encrypt_text("secret", "password", None)
+
+
+def test_legacy_blob_rejected_then_rebound(cipher):
+    legacy = cipher.encrypt("旧形式".encode("utf-8"), b"password")
+    assert legacy[:1] == VERSION
+    with pytest.raises(DecryptionError):
+        cipher.decrypt_text(legacy, "password", UUID_A)
+    rebound = cipher.rebind_text(legacy, "password", UUID_A)
+    assert cipher.decrypt_text(rebound, "password", UUID_A) == "旧形式"
+    rebound = cipher.rebind_text("平文", "notes", UUID_A)
+    assert cipher.decrypt_text(rebound, "notes", UUID_A) == "平文"
+
+
+def test_wrap_key_round_trip():
+    kek, data_key = new_data_key(), new_data_key()
+    wrapped = wrap_key(kek, data_key)
+    assert unwrap_key(kek, wrapped) == data_key
+    with pytest.raises(DecryptionError):
+        unwrap_key(new_data_key(), wrapped)
+
+
+def test_stored_item_swap_detected(vault):
+    repo, cipher = vault
+    root = repo.root_folder_id()
+    a = repo.add_item(root, cipher, title="a", password="pa", notes="na")
+    b = repo.add_item(root, cipher, title="b", password="pb")
+    with repo.transaction() as conn:
+        conn.execute(
+            "UPDATE items SET password = (SELECT password FROM items WHERE id = ?) WHERE id = ?",
+            (a.id, b.id)
+        )
+    with pytest.raises(DecryptionError):
+        repo.get_item(b.id, cipher)
+    assert repo.get_item(a.id, cipher).password == "pa"
@@ -0,0 +1,169 @@
+import io
+import json
+
+import pytest
+
+from services import importer
+from services.folder_service import check_folder_stats
+from services.importer import (
+    ImportFormatError, detect_format, import_records, iter_records, parse_json
+)
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+# ========== パーサ ==========
+
+def test_1password_csv(tmp_path):
+    path = write(tmp_path / "1p.csv",
+                 "Title,Url,Username,Password,Notes,Vault\n"
+                 "メール,https://mail.example,me,pw1,メモ,個人/仕事\n")
+    assert detect_format(path) == "1password"
+    assert list(iter_records(path)) == [{
+        "folder": ("個人", "仕事"), "title": "メール", "username": "me",
+        "password": "pw1", "url": "https://mail.example", "notes": "メモ",
+    }]
+
+
+def test_bitwarden_csv(tmp_path):
+    path = write(tmp_path / "bw.csv",
+                 "folder,favorite,type,name,notes,fields,login_uri,login_username,login_password\n"
+                 ",,login,bank,,,https://bank.example,user,pw2\n")
+    assert detect_format(path) == "bitwarden"
+    record, = iter_records(path)
+    assert record["folder"] == ()
+    assert (record["title"], record["username"], record["password"]) == ("bank", "user", "pw2")
+
+
+def test_keepass_csv_drops_root_group(tmp_path):
+    # KeePassXC の書き出しは BOM 付き UTF-8 のことがある
+    path = str(tmp_path / "kp.csv")
+    with open(path, "w", encoding="utf-8-sig") as fp:
+        fp.write('"Group","Title","Username","Password","URL","Notes"\n'
+                 '"Root/Web","site","u","p","https://site.example","n"\n')
+    assert detect_format(path) == "keepass"
+    record, = iter_records(path)
+    assert record["folder"] == ("Web",)
+    assert record["url"] == "https://site.example"
+
+
+def test_json_array_and_lines():
+    objects = [
+        {"name": "a", "password": "p", "folder": ["x", "y"]},
+        {"title": "b", "uri": "https://b.example", "group": "x/z"},
+    ]
+    array = list(parse_json(io.StringIO(json.dumps(objects, ensure_ascii=False))))
+    lines = list(parse_json(io.StringIO("\n".join(json.dumps(o) for o in objects) + "\n")))
+    assert array == lines
+    assert [r["folder"] for r in array] == [("x", "y"), ("x", "z")]
+    assert array[1]["url"] == "https://b.example"
+    assert array[1]["password"] == ""
+
+
+def test_json_array_across_chunks():
+    objects = [{"title": f"t{i}", "notes": "メモ" * 50} for i in range(200)]
+    text = json.dumps(objects, ensure_ascii=False)
+    fp = io.StringIO(text)
+    records = [importer._json_record(o) for o in importer._iter_json_array(fp, chunk_size=64)]
+    assert [r["title"] for r in records] == [o["title"] for o in objects]
+
+
+@pytest.mark.parametrize("text", ['[{"title": "a"}', '[{"title": "a"', '"title"'])
+def test_broken_json(text):
+    with pytest.raises(ImportFormatError):
+        list(parse_json(io.StringIO(text)))
+
+
+def test_unknown_csv(tmp_path):
+    path = write(tmp_path / "x.csv", "a,b,c\n1,2,3\n")
+    with pytest.raises(ImportFormatError):
+        detect_format(path)
+
+
+# ========== 取り込み ==========
+
+def records(count, folder=("取り込み",), fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise ImportFormatError("壊れたレコード")
+        yield {
+            "folder": folder, "title": f"item{i}", "username": "u",
+            "password": f"pw{i}", "url": "", "notes": "",
+        }
+
+
+def item_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+def trigger_names(conn):
+    return sorted(name for name, in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+    ))
+
+
+def test_import_encrypts_and_indexes(vault, tmp_path):
+    repo, cipher = vault
+    root = repo.root_folder_id()
+    path = write(tmp_path / "in.json", json.dumps([
+        {"title": "メール", "username": "me", "password": "秘密", "folder": "個人/仕事"},
+    ], ensure_ascii=False))
+    assert repo.import_file(path, root, cipher) == {"items": 1, "folders": 2}
+    (item_id, title), = repo.search("メール")
+    item = repo.get_item(item_id, cipher)
+    assert item.password == "秘密"
+    assert repo.conn.execute(
+        "SELECT typeof(password) FROM items WHERE id = ?", (item_id,)
+    ).fetchone()[0] == "blob"
+    # 同じフォルダ階層を取り込み直しても、フォルダは増えない
+    assert repo.import_file(path, root, cipher)["folders"] == 0
+
+
+def test_dry_run_writes_nothing(vault):
+    repo, _ = vault
+    before = trigger_names(repo.conn)
+    result = import_records(repo.conn, records(10), repo.root_folder_id(), dry_run=True)
+    assert result == {"items": 10, "folders": 1}
+    assert item_count(repo.conn) == 0
+    assert len(repo.list_folders()) == 1
+    assert trigger_names(repo.conn) == before
+
+
+def test_failed_batch_is_rolled_back(vault):
+    repo, cipher = vault
+    with pytest.raises(ImportFormatError):
+        import_records(repo.conn, records(25, fail_at=23), repo.root_folder_id(), cipher,
+                       batch_size=10)
+    # コミット済みのバッチ（20件）だけが残る
+    assert item_count(repo.conn) == 20
+    assert check_folder_stats(repo.conn) == []
+
+
+def test_failed_bulk_import_is_rolled_back(vault, monkeypatch):
+    repo, cipher = vault
+    conn = repo.conn
+    before = trigger_names(conn)
+    monkeypatch.setattr(importer, "BULK_THRESHOLD", 20)
+    with pytest.raises(ImportFormatError):
+        import_records(conn, records(60, fail_at=55), repo.root_folder_id(), cipher,
+                       batch_size=10)
+    # 一括取り込みに切り替えた後の分はまとめて取り消され、外したトリガも戻る
+    assert item_count(conn) == 20
+    assert trigger_names(conn) == before
+    assert check_folder_stats(conn) == []
+    assert len(repo.search("item1")) == 11
+
+
+def test_bulk_import_rebuilds_indexes(vault, monkeypatch):
+    repo, cipher = vault
+    conn = repo.conn
+    before = trigger_names(conn)
+    monkeypatch.setattr(importer, "BULK_THRESHOLD", 20)
+    result = import_records(conn, records(60), repo.root_folder_id(), cipher, batch_size=10)
+    assert result == {"items": 60, "folders": 1}
+    assert trigger_names(conn) == before
+    assert check_folder_stats(conn) == []
+    assert [title for _, title in repo.search("item59")] == ["item59"]
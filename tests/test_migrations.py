@@ -0,0 +1,102 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import ROOT
+from services import kdf, migrations
+from services.connection import close_connection, get_connection
+from services.crypto import FieldCipher
+from services.folder_service import check_folder_closure, check_folder_stats
+from services.migrations import (
+    LATEST_VERSION, LEGACY_ACCOUNTS_PATH, LEGACY_FOLDER_NAME, get_version, migrate
+)
+
+
+# リポジトリに同梱の、マイグレーション導入前（user_version = 0）の保管庫
+BASELINE_DB = os.path.join(ROOT, "password_manager.db")
+BASELINE_PASSWORD = "osamu4545"
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """同梱の保管庫と旧 DB を、元と同じ配置で tmp_path に複製する（元のファイルは触らない）"""
+    path = tmp_path / "password_manager.db"
+    shutil.copy(BASELINE_DB, path)
+    os.makedirs(tmp_path / "db")
+    shutil.copy(os.path.join(ROOT, LEGACY_ACCOUNTS_PATH), tmp_path / LEGACY_ACCOUNTS_PATH)
+    return path
+
+
+def test_upgrade_keeps_data(baseline, repositories):
+    repo = repositories(baseline)
+    conn = repo.conn
+    names = {f.id: f.name for f in repo.list_folders()}
+    assert names[1] == "デフォルト"
+    # 旧 DB の accounts はルート直下の "ID Manager" に入る
+    assert LEGACY_FOLDER_NAME in names.values()
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 6
+
+    # 平文のマスターパスワードは KDF の検証値になり、解錠でデータ鍵ができる
+    assert kdf.is_hashed(conn.execute("SELECT password FROM master").fetchone()[0])
+    cipher = FieldCipher(repo.open_vault(BASELINE_PASSWORD))
+    assert repo.open_vault("wrong") is None
+
+    # 平文の password / notes は最初の解錠で行に結び付けた暗号文になる
+    assert repo.encrypt_pending_rows(cipher) == 6
+    assert conn.execute(
+        "SELECT COUNT(*) FROM items WHERE typeof(password) = 'text' OR typeof(notes) = 'text'"
+    ).fetchone()[0] == 0
+    assert repo.encrypt_pending_rows(cipher) == 0
+    assert conn.execute("SELECT pending_rows FROM vault_state").fetchone()[0] == 0
+    legacy = [item for item in repo.get_items(range(1, 100), cipher) if item.username == "osamu"]
+    assert legacy[0].password == BASELINE_PASSWORD
+    assert "osm1110@icloud.com" in legacy[0].notes
+    assert repo.get_item(1, cipher).notes == "aaa"
+
+
+def test_upgrade_builds_derived_tables(baseline, repositories):
+    repo = repositories(baseline)
+    conn = repo.conn
+    assert check_folder_closure(conn) == (0, 0)
+    assert check_folder_stats(conn) == []
+    assert [title for _, title in repo.search("aa")] == ["aaa"]
+    # 既存の行にも uuid と同期の履歴が振られる
+    assert conn.execute("SELECT COUNT(*) FROM items WHERE uuid IS NULL").fetchone()[0] == 0
+    assert conn.execute(
+        "SELECT COUNT(DISTINCT uuid) = COUNT(*) FROM folders"
+    ).fetchone()[0] == 1
+    assert conn.execute("SELECT lineage FROM sync_state").fetchone()[0]
+    assert migrations.check_query_plans(conn) == []
+
+
+def test_each_step_from_baseline(baseline, monkeypatch):
+    """途中のバージョンで止まった保管庫からでも、残りのステップを適用できる"""
+    conn = get_connection(str(baseline))
+    try:
+        assert get_version(conn) == 0
+        steps = migrations.MIGRATIONS
+        for count in range(1, len(steps) + 1):
+            monkeypatch.setattr(migrations, "MIGRATIONS", steps[:count])
+            assert migrate(conn) == steps[count - 1][0]
+        monkeypatch.undo()
+        assert migrate(conn) == LATEST_VERSION
+        assert check_folder_closure(conn) == (0, 0)
+    finally:
+        close_connection(str(baseline))
+
+
+def test_migrate_is_idempotent(baseline, repositories):
+    repo = repositories(baseline)
+    before = repo.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    assert migrate(repo.conn) == LATEST_VERSION
+    assert repo.init() == LATEST_VERSION
+    assert repo.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == before
+
+
+def test_upgrade_without_legacy_db(tmp_path, repositories):
+    path = tmp_path / "password_manager.db"
+    shutil.copy(BASELINE_DB, path)
+    repo = repositories(path)
+    assert repo.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 5
+    assert LEGACY_FOLDER_NAME not in [f.name for f in repo.list_folders()]
@@ -0,0 +1,169 @@
+import random
+
+import pytest
+
+from services.sync_service import SyncError
+
+
+@pytest.fixture
+def devices(vault, tmp_path, repositories):
+    """(元の端末, 複製を別の端末として作る関数, cipher, 同期ディレクトリ)"""
+    origin, cipher = vault
+
+    def clone(name):
+        dest = tmp_path / f"{name}.db"
+        origin.copy_to(str(dest))
+        return repositories(dest)
+
+    return origin, clone, cipher, str(tmp_path / "sync")
+
+
+def sync_all(repos, directory, cipher):
+    """全端末で2巡同期する（後の端末の変更を前の端末も取り込むように）"""
+    for _ in range(2):
+        for repo in repos:
+            repo.sync(directory, cipher)
+
+
+def state(repo, cipher):
+    """端末ごとに違う id ではなく uuid で表した内容（端末どうしの比較用）"""
+    conn = repo.conn
+    folders = sorted(conn.execute(
+        "SELECT f.uuid, p.uuid, f.name FROM folders f LEFT JOIN folders p ON p.id = f.parent_id"
+    ))
+    items = []
+    for item_id, uuid, folder_uuid in conn.execute(
+        "SELECT i.id, i.uuid, f.uuid FROM items i JOIN folders f ON f.id = i.folder_id"
+    ).fetchall():
+        item = repo.get_item(item_id, cipher)
+        items.append((uuid, folder_uuid, item.title, item.username, item.password,
+                      item.url, item.notes))
+    return folders, sorted(items)
+
+
+def find_item(repo, cipher, title):
+    ids = [row[0] for row in repo.conn.execute("SELECT id FROM items")]
+    matches = [item for item in repo.get_items(ids, cipher) if item.title == title]
+    return matches[0] if matches else None
+
+
+def test_adds_and_field_edits_merge(devices):
+    a, clone, cipher, directory = devices
+    item = a.add_item(a.root_folder_id(), cipher, title="mail", username="u", password="p0")
+    b = clone("b")
+    a.update_item(item.id, cipher, password="from-a")
+    b.update_item(item.id, cipher, username="from-b")
+    a.add_item(a.root_folder_id(), cipher, title="only-a")
+    b.add_folder(b.root_folder_id(), "only-b")
+
+    sync_all([a, b], directory, cipher)
+    assert state(a, cipher) == state(b, cipher)
+    merged = find_item(b, cipher, "mail")
+    assert (merged.username, merged.password) == ("from-b", "from-a")
+    assert find_item(b, cipher, "only-a") is not None
+    assert "only-b" in [f.name for f in a.list_folders()]
+
+
+def test_same_field_concurrent_edits_converge(devices):
+    a, clone, cipher, directory = devices
+    item = a.add_item(a.root_folder_id(), cipher, title="x", password="p0")
+    b = clone("b")
+    a.update_item(item.id, cipher, password="from-a")
+    b.update_item(item.id, cipher, password="from-b")
+
+    sync_all([a, b], directory, cipher)
+    assert state(a, cipher) == state(b, cipher)
+    assert find_item(a, cipher, "x").password in ("from-a", "from-b")
+
+
+def test_later_edit_wins(devices):
+    a, clone, cipher, directory = devices
+    item = a.add_item(a.root_folder_id(), cipher, title="x", password="p0")
+    b = clone("b")
+    a.update_item(item.id, cipher, password="first")
+    sync_all([a, b], directory, cipher)
+    # 取り込んだ変更より後の編集は、端末の時刻に関係なく新しいとみなされる
+    with b.transaction() as conn:
+        conn.execute("UPDATE sync_state SET clock = clock - (1000 << 16) WHERE id = 1")
+    b.update_item(item.id, cipher, password="second")
+
+    sync_all([b, a], directory, cipher)
+    assert state(a, cipher) == state(b, cipher)
+    assert find_item(a, cipher, "x").password == "second"
+
+
+@pytest.mark.parametrize("edit_first", [True, False])
+def test_delete_beats_edit(devices, edit_first):
+    a, clone, cipher, directory = devices
+    item = a.add_item(a.root_folder_id(), cipher, title="doomed", password="p0")
+    b = clone("b")
+    if edit_first:
+        b.update_item(item.id, cipher, password="edited")
+        a.delete_item(item.id)
+    else:
+        a.delete_item(item.id)
+        b.update_item(item.id, cipher, password="edited")
+
+    sync_all([b, a], directory, cipher)
+    assert state(a, cipher) == state(b, cipher)
+    assert find_item(a, cipher, "doomed") is None
+    # 墓標のある行は、後から編集が届いても復活しない
+    assert find_item(b, cipher, "doomed") is None
+
+
+def test_item_added_to_deleted_folder_is_rescued(devices):
+    a, clone, cipher, directory = devices
+    folder = a.add_folder(a.root_folder_id(), "消すフォルダ")
+    b = clone("b")
+    a.delete_folder(folder.id)
+    b.add_item(folder.id, cipher, title="迷子")
+
+    sync_all([a, b], directory, cipher)
+    assert state(a, cipher) == state(b, cipher)
+    rescued = find_item(a, cipher, "迷子")
+    assert rescued.folder_id == a.root_folder_id()
+    assert "消すフォルダ" not in [f.name for f in b.list_folders()]
+
+
+def test_three_devices_converge(devices):
+    a, clone, cipher, directory = devices
+    b, c = clone("b"), clone("c")
+    repos = [a, b, c]
+    rnd = random.Random(0)
+    for round_ in range(6):
+        for index, repo in enumerate(repos):
+            ids = [row[0] for row in repo.conn.execute("SELECT id FROM items")]
+            folders = [f.id for f in repo.list_folders()]
+            for step in range(4):
+                op = rnd.random()
+                if op < 0.4 or not ids:
+                    ids.append(repo.add_item(
+                        rnd.choice(folders), cipher, title=f"{index}-{round_}-{step}"
+                    ).id)
+                elif op < 0.7:
+                    repo.update_item(rnd.choice(ids), cipher, password=f"{index}-{round_}")
+                elif op < 0.85:
+                    target = rnd.choice(ids)
+                    repo.delete_item(target)
+                    ids.remove(target)
+                else:
+                    folders.append(repo.add_folder(rnd.choice(folders), f"f{index}{round_}").id)
+            # 毎回は同期しない端末があっても最後には揃う
+            if rnd.random() < 0.7:
+                repo.sync(directory, cipher)
+
+    sync_all(repos, directory, cipher)
+    assert state(a, cipher) == state(b, cipher) == state(c, cipher)
+
+
+def test_unrelated_vault_is_refused(devices):
+    a, clone, cipher, directory = devices
+    a.sync(directory, cipher)
+    # 同期の履歴を共有しないまま同じ鍵を持つ保管庫（移行前に別々に複製したものなど）
+    other = clone("other")
+    with other.transaction() as conn:
+        conn.execute("UPDATE sync_state SET lineage = 'unrelated' WHERE id = 1")
+    a.add_item(a.root_folder_id(), cipher, title="y")
+    a.sync(directory, cipher)
+    with pytest.raises(SyncError):
+        other.sync(directory, cipher)